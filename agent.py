@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Long running collector that serves the latest snapshot over HTTP."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-02
+
+import os
+import json
+import stat
+import time
+import signal
+import socket
+import tempfile
+import logging
+import threading
+import click
+try:
+    import httplib
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    import http.client as httplib
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+from collectMetadata import (collector_options, collector_from_options,
+                             validate_seconds)
+from probes import PROBES, run_sections, select_sections
+
+SOCKET_DIR = 'node-metadata-collector'
+SOCKET_NAME = 'agent.sock'
+# probes only served with --serve_env, the environment may hold secrets
+PRIVATE_PROBES = ('env', )
+# seconds between two runs of a probe
+DEFAULT_INTERVALS = {
+    'time': 10,
+    'processes': 10,
+    'vms': 10,
+    'mounts': 60,
+    'network': 300,
+    'env': 3600,
+    'users': 3600,
+    'mpi': 3600,
+    'vTorque': 3600,
+    'packages': 3600,
+    'cpu': 6 * 3600,
+}
+
+
+def default_socket():
+    """Return the socket path in the private runtime directory of the user.
+
+    That is $XDG_RUNTIME_DIR, /run for root and a directory of the user in
+    the temp directory otherwise.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_DIR, SOCKET_NAME)
+    if os.getuid() == 0:
+        return os.path.join('/run', SOCKET_DIR, SOCKET_NAME)
+    return os.path.join(tempfile.gettempdir(), '{}-{}'.format(
+        SOCKET_DIR, os.getuid()), SOCKET_NAME)
+
+
+def private_dir(dir_path):
+    """Create dir_path with mode 0700 and check nobody else can use it.
+
+    Raises OSError if it belongs to another user or is open to others.
+    """
+    try:
+        os.makedirs(dir_path, 0o700)
+    except OSError:
+        if not os.path.isdir(dir_path):
+            raise
+    info = os.lstat(dir_path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            info.st_mode & 0o077:
+        raise OSError('{} is not a directory private to this user'.format(
+            dir_path))
+
+
+def remove_stale_socket(socket_path):
+    """Remove the socket a former agent left, but no other kind of file."""
+    try:
+        info = os.lstat(socket_path)
+    except OSError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        raise OSError('{} exists and is no socket'.format(socket_path))
+    os.remove(socket_path)
+
+
+class CollectorAgent(object):
+    """Refreshes every probe on its own interval and keeps the results."""
+
+    def __init__(self, coll, scheduler, probes=None, intervals=None):
+        """Class init.
+
+        coll        Collector the probes are run on
+        scheduler   ProbeScheduler running the probes due at the same time
+        probes      probe names to keep, all registered probes by default
+        intervals   dict of probe name to seconds, overriding the defaults
+        """
+        self.logger = self._get_logger()
+        self.coll = coll
+        self.scheduler = scheduler
+        self.probes = list(probes or PROBES)
+        self.intervals = dict(DEFAULT_INTERVALS)
+        self.intervals.update(intervals or {})
+        self.snapshot = {}
+        self.updated = {}
+        self.next_run = dict((p, 0) for p in self.probes)
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _get_logger(self):
+        """Setup the global logger."""
+        logger = logging.getLogger(__name__)
+
+        logger.setLevel(logging.INFO)
+        # create console handler with a higher log level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        # create formatter and add it to the handlers
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch.setFormatter(formatter)
+        # add the handlers to the logger
+        logger.addHandler(ch)
+        logger.debug('Logger setup complete. Start Program ... ')
+        return logger
+
+    def _collect(self, probes):
+        """Run probes and store their results."""
+        try:
+            result = run_sections(
+                self.coll, self.scheduler, [(p, p) for p in probes])
+        finally:
+            with self.lock:
+                self.running.difference_update(probes)
+        now = time.time()
+        with self.lock:
+            for probe_name, value in result.items():
+                self.snapshot[probe_name] = value
+                self.updated[probe_name] = now
+
+    def tick(self):
+        """Start the probes that are due and not running yet.
+
+        Probes due at the same time run together in one scheduler run, a
+        slow probe does not delay the next run of the fast ones.
+        Returns the seconds until the next probe is due.
+        """
+        now = time.time()
+        with self.lock:
+            due = [p for p in self.probes
+                   if self.next_run[p] <= now and p not in self.running]
+            for probe_name in due:
+                self.running.add(probe_name)
+                self.next_run[probe_name] = now + self.intervals.get(
+                    probe_name, 3600)
+        if due:
+            worker = threading.Thread(target=self._collect, args=(due,))
+            worker.daemon = True
+            worker.start()
+        return max(0, min(self.next_run.values()) - time.time())
+
+    def run(self):
+        """Run probes until stop() is called."""
+        while not self.stopped.is_set():
+            self.stopped.wait(min(1, self.tick()))
+
+    def stop(self):
+        """Stop the scheduling loop."""
+        self.stopped.set()
+
+    def get(self, probe_name=None):
+        """Return one probe result or the whole document of this host."""
+        with self.lock:
+            if probe_name is None:
+                return {self.coll.hostname: dict(self.snapshot)}
+            return self.snapshot[probe_name]
+
+    def status(self):
+        """Return interval and age of every probe result."""
+        now = time.time()
+        with self.lock:
+            return dict((p, {
+                'interval': self.intervals.get(p, 3600),
+                'updated': self.updated.get(p),
+                'age': now - self.updated[p] if p in self.updated else None,
+                'running': p in self.running,
+            }) for p in self.probes)
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    """Answers GET /, /status and /section/<probe> with JSON."""
+
+    def address_string(self):
+        # unix socket clients have no address
+        return str(self.client_address or 'local')
+
+    def log_message(self, format, *args):
+        self.server.agent.logger.debug(format % args)
+
+    def _send(self, code, payload):
+        body = json.dumps(payload, sort_keys=True).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        agent = self.server.agent
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        if not parts:
+            self._send(200, agent.get())
+        elif parts == ['status']:
+            self._send(200, agent.status())
+        elif len(parts) == 2 and parts[0] == 'section':
+            try:
+                self._send(200, agent.get(parts[1]))
+            except KeyError:
+                self._send(404, {'error': 'no section {}'.format(parts[1])})
+        else:
+            self._send(404, {'error': 'unknown path {}'.format(self.path)})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    """HTTP server on a unix socket only its user can connect to."""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        # the socket is created with mode 0600, no chmod after bind needed
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+
+class TCPHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server on a TCP port."""
+
+    daemon_threads = True
+
+
+class _UnixHTTPConnection(httplib.HTTPConnection):
+    """HTTPConnection talking to a unix socket."""
+
+    def __init__(self, socket_path, timeout):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def query_agent(address, path='/', timeout=10):
+    """GET path from an agent and return the decoded JSON.
+
+    address is a unix socket path or host:port. Raises IOError if the
+    agent is not reachable or answers with an error.
+    """
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        conn = httplib.HTTPConnection(host, int(port), timeout=timeout)
+    else:
+        conn = _UnixHTTPConnection(address, timeout)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        body = response.read()
+    except (socket.error, httplib.HTTPException) as e:
+        raise IOError('agent {} not reachable: {}'.format(address, e))
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise IOError('agent {} answered {}: {}'.format(
+            address, response.status, body))
+    return json.loads(body.decode('utf-8'))
+
+
+@click.command()
+@click.option(
+    '--socket',
+    'socket_path',
+    default=default_socket(),
+    type=click.Path(),
+    help='unix socket the snapshot is served on, created with mode 0600')
+@click.option(
+    '--port',
+    type=click.INT,
+    help='serve on this localhost TCP port instead of the unix socket')
+@click.option(
+    '--interval',
+    multiple=True,
+    type=click.STRING,
+    callback=validate_seconds,
+    help='refresh interval of a probe as PROBE=SECONDS, e.g. processes=5')
+@click.option(
+    '--serve_env',
+    default=False,
+    is_flag=True,
+    help='also collect and serve the environment, which may hold secrets')
+@collector_options
+def main(socket_path, port, interval, serve_env, **options):
+    """
+    Run the collector as agent serving the latest data of this node.
+
+    Every probe is refreshed on its own interval, the results are kept in
+    memory and served as JSON:
+    GET /                   document of this host with all probes
+    GET /section/<probe>    result of one probe
+    GET /status             interval and age of every probe
+    The env probe is left out unless --serve_env is given.
+    """
+    coll, scheduler = collector_from_options(options)
+    probes = [p for _, p in select_sections(
+        [(p, p) for p in PROBES], options['probes'], options['skip'])
+        if serve_env or p not in PRIVATE_PROBES]
+    agent = CollectorAgent(coll, scheduler, probes, interval)
+
+    if port:
+        server = TCPHTTPServer(('127.0.0.1', port), AgentRequestHandler)
+    else:
+        try:
+            if socket_path == default_socket():
+                private_dir(os.path.dirname(socket_path))
+            remove_stale_socket(socket_path)
+            server = UnixHTTPServer(socket_path, AgentRequestHandler)
+        except (OSError, socket.error) as e:
+            agent.logger.error('can not serve on {}: {}'.format(
+                socket_path, e))
+            exit(1)
+    server.agent = agent
+
+    def shutdown(signum, frame):
+        agent.stop()
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    scheduling = threading.Thread(target=agent.run)
+    scheduling.daemon = True
+    scheduling.start()
+    agent.logger.info('serving on {}'.format(
+        '127.0.0.1:{}'.format(port) if port else socket_path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if not port:
+            try:
+                remove_stale_socket(socket_path)
+            except OSError as e:
+                agent.logger.warning(e)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,753 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Benchmarks for the collector, merge and database code paths."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-18
+
+import os
+import json
+import time
+import shutil
+import resource
+import tempfile
+import multiprocessing
+import click
+from fleetgen import FleetGenerator
+
+
+def _child(func, args, conn):
+    """Run func in a child and send back time and peak memory."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    try:
+        result = func(*args)
+        error = None
+    except Exception as e:
+        result = None
+        error = '{}: {}'.format(type(e).__name__, e)
+    conn.send({
+        'seconds': time.time() - start,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'rss_growth_kb':
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before,
+        'result': result,
+        'error': error,
+    })
+    conn.close()
+
+
+def measure(func, *args):
+    """Run func(*args) in a fresh process and return its measurements.
+
+    Every measurement gets its own process, so the peak RSS of one code
+    path does not hide the one of the next. func has to return something
+    small, e.g. a count.
+    """
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_child, args=(func, args, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def write_dpkg_status(status_path, entries, installed_share=0.9):
+    """Write a synthetic dpkg status file with entries stanzas."""
+    installed_every = max(1, int(round(1 / (1 - installed_share)))) \
+        if installed_share < 1 else 0
+    with open(status_path, 'w') as fp:
+        for i in range(entries):
+            if installed_every and i % installed_every == 0:
+                status = 'deinstall ok config-files'
+            else:
+                status = 'install ok installed'
+            fp.write(
+                'Package: pkg{0}\n'
+                'Status: {1}\n'
+                'Priority: optional\n'
+                'Section: libs\n'
+                'Installed-Size: {2}\n'
+                'Maintainer: Someone <someone@example.org>\n'
+                'Architecture: amd64\n'
+                'Multi-Arch: same\n'
+                'Source: src{0}\n'
+                'Version: 1.{0}.{3}-1ubuntu1\n'
+                'Depends: libc6 (>= 2.14), libgcc1 (>= 1:3.0)\n'
+                'Description: synthetic package {0}\n'
+                ' A longer description of the synthetic package that is\n'
+                ' spread over several continuation lines, like the real\n'
+                ' ones.\n'
+                ' .\n'
+                ' It is only here to make the parser skip some text.\n'
+                '\n'.format(i, status, 100 + i % 5000, i % 7))
+
+
+def write_passwd_group(passwd_path, group_path, entries, groups=None,
+                       members=20):
+    """Write synthetic passwd and group files.
+
+    entries users get one of groups primary groups, every group lists
+    members users as supplementary members.
+    """
+    groups = groups or max(1, entries // 10)
+    with open(passwd_path, 'w') as fp:
+        for i in range(entries):
+            shell = '/usr/sbin/nologin' if i % 10 == 0 else '/bin/bash'
+            fp.write('user{0}:x:{1}:{2}:User {0}:/home/user{0}:{3}\n'.format(
+                i, 10000 + i, 10000 + i % groups, shell))
+    with open(group_path, 'w') as fp:
+        for g in range(groups):
+            fp.write('group{0}:x:{1}:{2}\n'.format(
+                g, 10000 + g, ','.join(
+                    'user{}'.format((g * 7 + m * 13) % entries)
+                    for m in range(members))))
+
+
+def _legacy_users(passwd_path, group_path):
+    """The former get_users loop, kept to compare against."""
+    from users import iter_passwd_file, iter_group_file
+    groups_list = list(iter_group_file(group_path))
+    gids = dict((g[2], g) for g in reversed(groups_list))
+    return_dict = {}
+    for user in iter_passwd_file(passwd_path):
+        user_group_list = []
+        if ('/bin/false' not in user[6] and
+                '/usr/sbin/nologin' not in user[6] and
+                '/home' in user[5]):
+            user_group_list.append(gids[user[3]][0])
+            for group in groups_list:
+                if user[0] in group[3]:
+                    user_group_list.append(group[0])
+            if len(user_group_list) > 0:
+                return_dict[user[0]] = user_group_list
+    return return_dict
+
+
+def _resolve_users(passwd_path, group_path):
+    from users import get_entries, resolve_users
+    return resolve_users(*get_entries('files', passwd_path, group_path))[0]
+
+
+def _legacy_processes():
+    """The former collect_processes loop, kept to compare against."""
+    import psutil
+    pl = []
+    for proc in psutil.process_iter():
+        try:
+            pinfo = proc.as_dict(attrs=['pid', 'name'])
+        except psutil.NoSuchProcess:
+            pass
+        else:
+            pl.append(pinfo)
+    return pl
+
+
+def _snapshot(attrs, backend):
+    from processes import ProcessSnapshot
+    return list(ProcessSnapshot(attrs, backend))
+
+
+def _snapshot_stream(attrs, backend, out_path):
+    from processes import ProcessSnapshot
+    return ProcessSnapshot(attrs, backend).write_jsonl(out_path)
+
+
+def _format_roundtrip(fmt, nodes):
+    """Encode and decode a synthetic fleet snapshot in fmt."""
+    from formats import encode, decode
+    fleet = dict(FleetGenerator().hosts(nodes))
+    start = time.time()
+    data = encode(fleet, fmt)
+    encoded = time.time()
+    decode(data)
+    return {'bytes': len(data), 'encode_seconds': encoded - start,
+            'decode_seconds': time.time() - encoded}
+
+
+def _fleet_diff(nodes, packages):
+    """Diff a mostly homogeneous synthetic fleet against its first host."""
+    from fleetdiff import FleetDiff
+    # one variant, so only the drifting hosts differ in their packages
+    generator = FleetGenerator(packages, processes=50, variants=1)
+    _, reference = generator.document(0)
+    fleet = list(generator.hosts(nodes))
+    start = time.time()
+    diff = FleetDiff(reference)
+    paths = sum(len(diff.compare(h, d)) for h, d in fleet)
+    return {'paths': paths, 'diff_seconds': time.time() - start,
+            'hosts_per_s': nodes / (time.time() - start)}
+
+
+def _homogeneous_fleet(nodes):
+    """Synthetic fleet sharing all but the network and collection time."""
+    return dict(FleetGenerator(variants=1).hosts(nodes))
+
+
+def _dedup_write(nodes, out_path, dedup):
+    from database import dump_format
+    dump_format(_homogeneous_fleet(nodes), out_path, 'json-compact', dedup)
+    return os.path.getsize(out_path)
+
+
+def _dedup_load(out_path):
+    from dedup import decode_expanded
+    with open(out_path, 'rb') as fp:
+        return len(decode_expanded(fp.read()))
+
+
+def _merge_read(node_dir, read_threads, parse_procs):
+    import logging
+    from mergeMetadata import MergeMetadata
+    mm = MergeMetadata()
+    mm.logger.setLevel(logging.WARNING)
+    mm.read_files(node_dir, read_threads, parse_procs)
+    mm.merge_files()
+    return len(mm.merge_dict)
+
+
+def _count(func, *args):
+    return len(func(*args))
+
+
+def _dpkg_cached(cache_dir, status_path):
+    from cache import FileCache
+    from packages import installed_packages
+    cache = FileCache(cache_dir)
+    installed_packages(cache, status_path)
+    start = time.time()
+    count = len(installed_packages(cache, status_path))
+    return {'count': count, 'cached_seconds': time.time() - start}
+
+
+def _stand_ins(stand_in_dir, packages, users):
+    """Write local replacements for dpkg, passwd/group and mpirun."""
+    paths = {
+        'status': os.path.join(stand_in_dir, 'status'),
+        'passwd': os.path.join(stand_in_dir, 'passwd'),
+        'group': os.path.join(stand_in_dir, 'group'),
+        'bin': os.path.join(stand_in_dir, 'bin'),
+        'cache': os.path.join(stand_in_dir, 'cache'),
+    }
+    os.makedirs(paths['bin'])
+    write_dpkg_status(paths['status'], packages)
+    write_passwd_group(paths['passwd'], paths['group'], users)
+    mpirun = os.path.join(paths['bin'], 'mpirun')
+    with open(mpirun, 'w') as fp:
+        fp.write('#!/bin/sh\necho "mpirun (Open MPI) 1.10.2"\n')
+    os.chmod(mpirun, 0o755)
+    return paths
+
+
+def _collect_probe(name, paths):
+    """Run one probe of a Collector, reading the stand-ins where it can.
+
+    vms connects to the libvirt test driver, vTorque describes this
+    repository.
+    """
+    import logging
+    from collectMetadata import Collector
+    from cache import FileCache
+    from probes import PROBES
+    from packages import installed_packages
+    from users import get_entries, resolve_users
+    os.environ['PATH'] = paths['bin'] + os.pathsep + os.environ['PATH']
+    coll = Collector(FileCache(paths['cache'], refresh=True), 'files',
+                     'test:///default')
+    coll.logger.setLevel(logging.WARNING)
+    if name == 'packages':
+        result = installed_packages(None, paths['status'])
+    elif name == 'users':
+        result = resolve_users(*get_entries(
+            'files', paths['passwd'], paths['group']))[0]
+    else:
+        entry = PROBES[name]
+        missing = entry.missing()
+        if missing:
+            return {'unavailable': missing}
+        args = entry.args
+        if name == 'vTorque':
+            args = (os.path.dirname(os.path.abspath(__file__)), )
+        result = entry.task(coll)(*args)
+    return {'entries': len(result) if hasattr(result, '__len__') else 1}
+
+
+def _suite_merge(mode, node_dir, out_path):
+    import logging
+    from mergeMetadata import MergeMetadata
+    mm = MergeMetadata()
+    mm.logger.setLevel(logging.WARNING)
+    if mode == 'stream':
+        return mm.stream_merge(node_dir, out_path)
+    if mode.startswith('incremental'):
+        return mm.incremental_merge(node_dir, out_path)
+    if mode == 'parallel':
+        mm.read_files(node_dir, 4, 4)
+    else:
+        mm.read_files(node_dir)
+    mm.merge_files()
+    mm.save_new_json(out_path)
+    return len(mm.merge_dict)
+
+
+def _suite_dedup(db_path, out_path):
+    from database import dump_format
+    from dedup import decode_expanded
+    with open(db_path, 'rb') as fp:
+        dump_format(decode_expanded(fp.read()), out_path, 'json', True)
+    return os.path.getsize(out_path)
+
+
+def _suite_load(db_path, host=None):
+    """Load a database like inventory.py does, whole or one host."""
+    from database import JsonConnector
+    je = JsonConnector(db_path)
+    if host:
+        return len(je._get_host(host))
+    return len(je.dict_server)
+
+
+def _suite_value_index(db_path):
+    from database import JsonConnector
+    from valueindex import ValueIndex
+    ValueIndex.build(JsonConnector(db_path)._iter_hosts()).save(db_path)
+    return os.path.getsize(db_path + '.vidx')
+
+
+def _suite_columns(db_path, out_dir):
+    """Flatten a database to CSV tables like inventory.py --columns."""
+    from database import JsonConnector
+    from columnar import ColumnarExporter
+    exporter = ColumnarExporter(out_dir)
+    return sum(exporter.add_hosts(
+        JsonConnector(db_path)._iter_hosts()).close().values())
+
+
+def _suite_inventory(db_path, method, args):
+    """Call one JsonConnector method of inventory.py, output discarded."""
+    import sys
+    import logging
+    from database import JsonConnector
+    sys.stdout = open(os.devnull, 'w')
+    je = JsonConnector(db_path)
+    je.logger.setLevel(logging.ERROR)
+    getattr(je, method)(*args)
+
+
+def suite_queries(host):
+    """Return name to (JsonConnector method, args) of every query mode."""
+    return {
+        'list': ('list_hosts', ()),
+        'host': ('get_host_infos', (host, )),
+        'host_key': ('get_host_value_to_key', (host, 'packages')),
+        'all_hosts_key': ('get_all_host_keys', ('cpu', )),
+        'query_path': ('query_hosts', ('network.eth0.2[*].addr', )),
+        'query_where': ('query_hosts', (
+            'packages.lib0-dev where cpu.count >= 32', )),
+        'lookup': ('lookup_hosts', (['cpu.count=40'], )),
+        'diff': ('diff_hosts', (host, 'packages')),
+    }
+
+
+def compare_results(results, baseline, path=()):
+    """Return dotted path to seconds / baseline seconds of all measurements.
+
+    Values above 1 are slower than the baseline.
+    """
+    ratios = {}
+    for key, value in results.items():
+        if not isinstance(value, dict) or key not in baseline or \
+                not isinstance(baseline[key], dict):
+            continue
+        if 'seconds' in value and baseline[key].get('seconds'):
+            ratios['.'.join(path + (key, ))] = round(
+                value['seconds'] / baseline[key]['seconds'], 3)
+        else:
+            ratios.update(compare_results(
+                value, baseline[key], path + (key, )))
+    return ratios
+
+
+def _revision():
+    import subprocess
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(hosts, packages, processes, parts, work_dir):
+    """Run the parts of the benchmark suite, return their results."""
+    import platform
+    from probes import PROBES
+    # the Collector registers its probes when it is imported
+    import collectMetadata  # noqa
+    results = {
+        'meta': {
+            'time': time.time(),
+            'revision': _revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+        },
+        'params': {'hosts': hosts, 'packages': packages,
+                   'processes': processes, 'parts': parts},
+    }
+    if 'collect' in parts:
+        paths = _stand_ins(os.path.join(work_dir, 'stand_ins'), packages,
+                           1000)
+        results['collect'] = dict(
+            (name, measure(_collect_probe, name, paths)) for name in PROBES)
+    if not set(parts) & set(['merge', 'database', 'query', 'columns']):
+        return results
+
+    node_dir = os.path.join(work_dir, 'nodes')
+    generator = FleetGenerator(packages, processes)
+    start = time.time()
+    generator.write_files(node_dir, hosts)
+    results['params']['generate_seconds'] = time.time() - start
+    db_path = os.path.join(work_dir, 'merge.json')
+    inc_path = os.path.join(work_dir, 'incremental.json')
+
+    merges = {'classic': measure(_suite_merge, 'classic', node_dir, db_path)}
+    if 'merge' in parts:
+        for mode in ('parallel', 'stream', 'incremental_full',
+                     'incremental_unchanged'):
+            merges[mode] = measure(_suite_merge, mode, node_dir, os.path.join(
+                work_dir, mode + '.json') if mode in ('parallel', 'stream')
+                else inc_path)
+        # one node file in a hundred collected again
+        changed = FleetGenerator(packages, processes, seed=1)
+        for i in range(0, hosts, 100):
+            hostname, document = changed.document(i)
+            with open(os.path.join(node_dir, hostname + '.json'), 'w') as fp:
+                json.dump({hostname: document}, fp)
+        merges['incremental_changed'] = measure(
+            _suite_merge, 'incremental_changed', node_dir, inc_path)
+        results['merge'] = merges
+
+    host = generator.hostname(0)
+    if 'database' in parts:
+        dedup_path = os.path.join(work_dir, 'dedup.json')
+        results['database'] = {
+            'bytes': os.path.getsize(db_path),
+            'load_full': measure(_suite_load, db_path),
+            'load_host': measure(_suite_load, db_path, host),
+            'write_dedup': measure(_suite_dedup, db_path, dedup_path),
+            'load_dedup': measure(_suite_load, dedup_path),
+        }
+    if 'query' in parts:
+        queries = {}
+        for name, (method, args) in sorted(suite_queries(host).items()):
+            queries[name] = measure(_suite_inventory, db_path, method, args)
+        queries['value_index_build'] = measure(_suite_value_index, db_path)
+        queries['lookup_indexed'] = measure(
+            _suite_inventory, db_path, 'lookup_hosts', (['cpu.count=40'], ))
+        results['query'] = queries
+    if 'columns' in parts:
+        results['columns'] = {
+            'csv': measure(_suite_columns, db_path,
+                           os.path.join(work_dir, 'columns')),
+        }
+    return results
+
+
+@click.group()
+def main():
+    """Benchmarks for the node meta data collector.
+
+    Every command prints its results as JSON to stdout.
+    """
+
+
+@main.command()
+@click.option(
+    '--entries',
+    default=50000,
+    type=click.INT,
+    help='number of stanzas in the synthetic dpkg status file')
+def packages(entries):
+    """Compare the dpkg status reader against python-apt."""
+    from packages import read_dpkg_status, read_apt_cache
+    workdir = tempfile.mkdtemp()
+    try:
+        status_dir = os.path.join(workdir, 'var', 'lib', 'dpkg')
+        os.makedirs(status_dir)
+        status_path = os.path.join(status_dir, 'status')
+        write_dpkg_status(status_path, entries)
+
+        results = {
+            'entries': entries,
+            'status_bytes': os.path.getsize(status_path),
+            'dpkg_status': measure(_count, read_dpkg_status, status_path),
+            'dpkg_status_cached': measure(
+                _dpkg_cached, os.path.join(workdir, 'cache'), status_path),
+            'apt_cache': measure(_count, read_apt_cache, workdir),
+        }
+    finally:
+        shutil.rmtree(workdir)
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--entries',
+    default=100000,
+    type=click.INT,
+    help='number of users in the synthetic passwd file')
+@click.option(
+    '--legacy_entries',
+    default=2000,
+    type=click.INT,
+    help='number of users for the former quadratic loop, 0 to skip it')
+def users(entries, legacy_entries):
+    """Compare the user/group resolution against the former loop."""
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {'entries': entries, 'legacy_entries': legacy_entries}
+        for label, count in (('', entries), ('legacy_', legacy_entries)):
+            if not count:
+                continue
+            passwd_path = os.path.join(workdir, label + 'passwd')
+            group_path = os.path.join(workdir, label + 'group')
+            write_passwd_group(passwd_path, group_path, count)
+            results[label + 'resolve_users'] = measure(
+                _count, _resolve_users, passwd_path, group_path)
+        if legacy_entries:
+            results['legacy_loop'] = measure(
+                _count, _legacy_users,
+                os.path.join(workdir, 'legacy_passwd'),
+                os.path.join(workdir, 'legacy_group'))
+    finally:
+        shutil.rmtree(workdir)
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--spawn',
+    default=0,
+    type=click.INT,
+    help='number of sleeping processes to start before measuring')
+def processes(spawn):
+    """Time process snapshots with psutil and /proc."""
+    import subprocess
+    from processes import ATTRS
+    children = [subprocess.Popen(['sleep', '600']) for _ in range(spawn)]
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {
+            'processes': len([e for e in os.listdir('/proc') if e.isdigit()]),
+            'legacy_pid_name': measure(_count, _legacy_processes),
+        }
+        for backend in ('psutil', 'proc'):
+            results[backend + '_pid_name'] = measure(
+                _count, _snapshot, ['pid', 'name'], backend)
+            results[backend + '_all_attrs'] = measure(
+                _count, _snapshot, ATTRS, backend)
+            results[backend + '_all_attrs_stream'] = measure(
+                _snapshot_stream, ATTRS, backend,
+                os.path.join(workdir, backend + '.jsonl'))
+    finally:
+        for child in children:
+            child.kill()
+            child.wait()
+        shutil.rmtree(workdir)
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--nodes',
+    default=10000,
+    type=click.INT,
+    help='number of synthetic node files')
+@click.option(
+    '--workers',
+    default='1,4,16',
+    type=click.STRING,
+    help='comma separated worker counts to measure')
+@click.option(
+    '--packages',
+    default=100,
+    type=click.INT,
+    help='number of packages per host')
+def merge(nodes, workers, packages):
+    """Read throughput of the merge with threads and parser processes."""
+    import jsoncodec
+    workdir = tempfile.mkdtemp()
+    try:
+        # indented like the node files of inventory.py -c
+        FleetGenerator(packages, processes=50).write_files(
+            workdir, nodes, fmt='json')
+        total_bytes = sum(os.path.getsize(os.path.join(workdir, f))
+                          for f in os.listdir(workdir))
+        results = {'nodes': nodes, 'bytes': total_bytes,
+                   'codec': jsoncodec.CODEC_NAME}
+        runs = [('serial', 1, 0)]
+        for count in [int(w) for w in workers.split(',') if w]:
+            runs.append(('threads_{}'.format(count), count, 0))
+            runs.append(('threads_{0}_procs_{0}'.format(count), count, count))
+        for label, read_threads, parse_procs in runs:
+            result = measure(_merge_read, workdir, read_threads, parse_procs)
+            if result['seconds']:
+                result['files_per_s'] = nodes / result['seconds']
+                result['mb_per_s'] = total_bytes / 1e6 / result['seconds']
+            results[label] = result
+    finally:
+        shutil.rmtree(workdir)
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--nodes',
+    default=200,
+    type=click.INT,
+    help='number of hosts in the synthetic fleet snapshot')
+def formats(nodes):
+    """Size, encode and decode time of every snapshot format."""
+    from formats import FORMATS
+    results = {'nodes': nodes}
+    for fmt in FORMATS:
+        results[fmt] = measure(_format_roundtrip, fmt, nodes)
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--nodes',
+    default=10000,
+    type=click.INT,
+    help='number of hosts in the synthetic fleet')
+@click.option(
+    '--packages',
+    default=1500,
+    type=click.INT,
+    help='number of packages per host')
+def diff(nodes, packages):
+    """Time the subtree hash diff of a fleet against one host."""
+    results = {'nodes': nodes, 'packages': packages,
+               'fleet_diff': measure(_fleet_diff, nodes, packages)}
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--nodes',
+    default=2000,
+    type=click.INT,
+    help='number of hosts in the synthetic fleet')
+def dedup(nodes):
+    """Size and load time of a fleet with and without deduplication."""
+    tmp_dir = tempfile.mkdtemp()
+    results = {'nodes': nodes}
+    try:
+        for name, flag in (('plain', False), ('dedup', True)):
+            out_path = os.path.join(tmp_dir, name + '.json')
+            results[name] = {
+                'write': measure(_dedup_write, nodes, out_path, flag),
+                'load': measure(_dedup_load, out_path),
+            }
+    finally:
+        shutil.rmtree(tmp_dir)
+    print(json.dumps(results, sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--hosts',
+    default=1000,
+    type=click.IntRange(1, 100000),
+    help='number of hosts in the synthetic fleet, 10 to 100k')
+@click.option(
+    '--packages',
+    default=1500,
+    type=click.INT,
+    help='number of packages per host')
+@click.option(
+    '--processes',
+    default=300,
+    type=click.INT,
+    help='number of processes per host')
+@click.option(
+    '--out_dir',
+    type=click.Path(),
+    required=True,
+    help='directory the node files are written to')
+def generate(hosts, packages, processes, out_dir):
+    """Write the node files of a synthetic fleet."""
+    start = time.time()
+    FleetGenerator(packages, processes).write_files(out_dir, hosts)
+    print(json.dumps({'hosts': hosts, 'seconds': time.time() - start},
+                     sort_keys=True, indent=4))
+
+
+@main.command()
+@click.option(
+    '--hosts',
+    default=1000,
+    type=click.IntRange(1, 100000),
+    help='number of hosts in the synthetic fleet, 10 to 100k')
+@click.option(
+    '--packages',
+    default=1500,
+    type=click.INT,
+    help='number of packages per host')
+@click.option(
+    '--processes',
+    default=300,
+    type=click.INT,
+    help='number of processes per host')
+@click.option(
+    '--parts',
+    default='collect,merge,database,query,columns',
+    help='comma separated parts to run: '
+         'collect,merge,database,query,columns')
+@click.option(
+    '--out',
+    type=click.Path(),
+    help='also write the results to this file')
+@click.option(
+    '--baseline',
+    type=click.Path(exists=True),
+    help='results of an earlier run to compare the times with')
+def suite(hosts, packages, processes, parts, out, baseline):
+    """Time collection, merge, database load and queries of a fleet."""
+    parts = [p.strip() for p in parts.split(',') if p.strip()]
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = run_suite(hosts, packages, processes, parts, work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+    if baseline:
+        with open(baseline) as fp:
+            results['baseline'] = compare_results(results, json.load(fp))
+    text = json.dumps(results, sort_keys=True, indent=4)
+    if out:
+        with open(out, 'w') as fp:
+            fp.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
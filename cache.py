@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Local cache for probe results that only change with their sources."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-18
+
+import os
+import json
+import time
+import logging
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'node-metadata-collector')
+BOOT_ID = '/proc/sys/kernel/random/boot_id'
+# entries not written for this long are removed
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+
+def file_key(*paths):
+    """Build a cache key from the mtime and size of paths.
+
+    Missing files are part of the key as well, so creating one of them
+    invalidates the entry.
+    """
+    key = {}
+    for file_path in paths:
+        try:
+            st = os.stat(file_path)
+            key[file_path] = [st.st_mtime, st.st_size]
+        except OSError:
+            key[file_path] = None
+    return key
+
+
+def boot_id():
+    """Return the id of the current boot, None if the kernel has none."""
+    try:
+        with open(BOOT_ID) as fp:
+            return fp.read().strip()
+    except IOError:
+        return None
+
+
+def boot_key(*paths):
+    """Build a key valid until reboot or until one of paths changes."""
+    return {'boot_id': boot_id(), 'files': file_key(*paths)}
+
+
+class FileCache(object):
+    """Stores one JSON file per entry together with the key it is valid for."""
+
+    def __init__(self, cache_dir=None, refresh=False,
+                 max_age=DEFAULT_MAX_AGE):
+        """Class init.
+
+        cache_dir   directory of the entries, $NMC_CACHE_DIR or
+                    ~/.cache/node-metadata-collector by default
+        refresh     ignore stored entries, every value is rebuilt and
+                    stored again
+        max_age     seconds after which an entry is evicted
+        """
+        self.cache_dir = cache_dir or os.environ.get(
+            'NMC_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.refresh = refresh
+        self.max_age = max_age
+        self.logger = self._get_logger()
+
+    def _get_logger(self):
+        """Setup the global logger."""
+        logger = logging.getLogger(__name__)
+
+        logger.setLevel(logging.INFO)
+        # create console handler with a higher log level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        # create formatter and add it to the handlers
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch.setFormatter(formatter)
+        # add the handlers to the logger
+        logger.addHandler(ch)
+        logger.debug('Logger setup complete. Start Program ... ')
+        return logger
+
+    def _entry_path(self, name):
+        return os.path.join(self.cache_dir, '{}.json'.format(name))
+
+    def get(self, name, key, ttl=None):
+        """Return the value stored for name or None if key does not match.
+
+        With ttl the entry is also outdated when it was stored more than
+        ttl seconds ago.
+        """
+        if self.refresh:
+            return None
+        entry_path = self._entry_path(name)
+        try:
+            age = time.time() - os.path.getmtime(entry_path)
+            with open(entry_path) as fp:
+                entry = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        if age > min(ttl or self.max_age, self.max_age):
+            self.logger.debug('cache entry {} expired'.format(name))
+            return None
+        if entry.get('key') != json.loads(json.dumps(key)):
+            self.logger.debug('cache entry {} is outdated'.format(name))
+            return None
+        self.logger.debug('cache hit for {}'.format(name))
+        return entry.get('value')
+
+    def put(self, name, key, value):
+        """Store value for name, valid as long as key does not change."""
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump({'key': key, 'value': value}, fp)
+            os.rename(tmp_path, self._entry_path(name))
+        except (IOError, OSError) as e:
+            # a cache we can not write is no reason to fail the collection
+            self.logger.warning('can not write cache {}: {}'.format(name, e))
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove entries that were not written for max_age seconds."""
+        now = time.time()
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for entry in names:
+            entry_path = os.path.join(self.cache_dir, entry)
+            try:
+                if now - os.path.getmtime(entry_path) > self.max_age:
+                    self.logger.debug('evicting cache entry {}'.format(entry))
+                    os.remove(entry_path)
+            except OSError:
+                # removed by a concurrent run
+                pass
+
+    def cached(self, name, key, func, *args, **kwargs):
+        """Return the cached value for name or compute and store it.
+
+        A ttl keyword limits how long the value is served from the cache.
+        """
+        ttl = kwargs.get('ttl')
+        value = self.get(name, key, ttl)
+        if value is None:
+            value = func(*args)
+            self.put(name, key, value)
+        return value
@@ -22,22 +22,53 @@
 # @Date: 2016-11-22
 
 
+import sys
+import time
+import cProfile
 import logging
 from os import path, makedirs, environ
 import datetime
 import platform
 import subprocess
-import json
 import click
+from formats import FORMATS, SUFFIXES, encode
+from scheduler import ProbeScheduler, parse_timeouts
+from probes import probe, parse_names, select_sections, run_sections
+from cache import FileCache
+from history import HistoryStore
+from instrument import (STATS_SECTION, check_output, collection_stats,
+                        count_spawn, write_metrics, write_profile)
+from fleetdiff import FleetDiff, format_path
 
 
 class Collector(object):
     """collects metadata for one host."""
 
-    def __init__(self):
-        """Init of this class."""
+    def __init__(self, cache=None, user_source='nss',
+                 libvirt_uri='qemu:///system', vm_details=(),
+                 process_snapshot=None, process_stream=None):
+        """Init of this class.
+
+        cache       FileCache used by probes with expensive, rarely changing
+                    results; a default one is created if not given
+        user_source 'nss' to enumerate users through the name service
+                    switch, 'files' to only read /etc/passwd and /etc/group
+        libvirt_uri connection the vms probe reads the domains from
+        vm_details  counters added per active domain: vcpu, block, net
+        process_snapshot
+                    ProcessSnapshot configuring the processes probe
+        process_stream
+                    file the processes are written to as JSON lines
+                    instead of being part of the document
+        """
         self.logger = self.get_logger()
         self.hostname = self.collect_hostname()
+        self.cache = cache if cache is not None else FileCache()
+        self.user_source = user_source
+        self.libvirt_uri = libvirt_uri
+        self.vm_details = vm_details
+        self.process_snapshot = process_snapshot
+        self.process_stream = process_stream
 
     def get_logger(self):
         """Setup the global logger."""
@@ -56,26 +87,21 @@ class Collector(object):
         logger.debug('Logger setup complete. Start Program ... ')
         return logger
 
+    @probe('cpu', requires=['cpuinfo'], static=True)
     def collect_cpu_info(self):
         """Get cpu info."""
         self.logger.info('getting cpu info.')
         import cpuinfo
         return cpuinfo.get_cpu_info()
 
+    @probe('packages')
     def collect_packages(self):
         """Get packages installed."""
         self.logger.info('getting installed packages and there version.')
-        import apt
-        cache = apt.Cache()
-
-        pkg_list = {}
-
-        for pkg in cache.keys():
-            if cache[pkg].is_installed:
-                pkg_list[cache[pkg].name] = str(cache[pkg].versions)
-
-        return pkg_list
+        from packages import installed_packages
+        return installed_packages(self.cache)
 
+    @probe('env')
     def collect_env(self):
         """Get environment variables."""
         self.logger.info('getting the environment.')
@@ -86,20 +112,18 @@ class Collector(object):
         self.logger.info('getting the host name.')
         return platform.node()
 
+    @probe('processes', requires=['psutil'])
     def collect_processes(self):
         """Get running processes."""
         self.logger.info('getting running processes.')
-        import psutil
-        pl = []
-        for proc in psutil.process_iter():
-            try:
-                pinfo = proc.as_dict(attrs=['pid', 'name'])
-            except psutil.NoSuchProcess:
-                pass
-            else:
-                pl.append(pinfo)
-        return pl
-
+        from processes import ProcessSnapshot
+        snapshot = self.process_snapshot or ProcessSnapshot()
+        if self.process_stream:
+            count = snapshot.write_jsonl(self.process_stream)
+            return {'stream': self.process_stream, 'count': count}
+        return list(snapshot)
+
+    @probe('time')
     def get_date(self):
         """Get the current date time."""
         import time
@@ -113,46 +137,49 @@ class Collector(object):
 
         return result_dict
 
+    @probe('mpi', commands=['which', 'mpirun'])
     def get_mpi_version(self):
         """Get the mpi version and path."""
         self.logger.info('getting mpi version.')
         out = {}
-        out['path'] = subprocess.check_output(["which", "mpirun"])
-        tmp = subprocess.check_output(
+        out['path'] = check_output(["which", "mpirun"])
+        tmp = check_output(
             ["mpirun", "--version"], stderr=subprocess.STDOUT)
         out['version'] = tmp.split('\n')[0]
         return out
 
+    @probe('vTorque', requires=['sh'], commands=['git'], args=['...'])
     def get_gitpath_version(self, path):
         """Merge the meta data form multiple nodes into one document."""
         self.logger.info('getting last git commit id of %s.' % path)
         from sh import git
         git = git.bake("-C", path)
+        count_spawn()
         git_out = git.describe('--always')
         return git_out.rstrip()
 
+    @probe('users', static=True,
+           cache_files=['/etc/passwd', '/etc/group', '/etc/nsswitch.conf'],
+           cache_attrs=['user_source'], cache_if='users_local')
     def get_users(self):
         """Get all users and their groups."""
         self.logger.info('getting user info.')
-        import pwd
-        import grp
-        return_dict = {}
-        groups_list = grp.getgrall()
-
-        for user in pwd.getpwall():
-            user_group_list = []
-            # skip all user accounts that are not allowed/capable to login
-            if ('/bin/false' not in user[6] and
-                    '/usr/sbin/nologin' not in user[6] and
-                    '/home' in user[5]):
-                user_group_list.append(grp.getgrgid(user[3])[0])
-                for group in groups_list:
-                    if user[0] in group[3]:
-                        user_group_list.append(group[0])
-                if len(user_group_list) > 0:
-                    return_dict[user[0]] = user_group_list
+        from users import get_entries, resolve_users
+        return_dict, scanned = resolve_users(*get_entries(self.user_source))
+        self.logger.info(
+            'scanned {passwd} passwd and {group} group entries.'.format(
+                **scanned))
         return return_dict
 
+    def users_local(self):
+        """Test if the users only come from files the cache key covers."""
+        from users import local_only
+        return local_only(self.user_source)
+
+    @probe('network', requires=['netifaces'], static=True,
+           cache_files=['/etc/network/interfaces', '/etc/resolv.conf',
+                        '/etc/netplan', '/sys/class/net'],
+           cache_ttl=3600)
     def get_network(self):
         """Get all network interface informations."""
         self.logger.info('getting network info.')
@@ -165,51 +192,14 @@ class Collector(object):
 
         return return_dict
 
+    @probe('vms', requires=['libvirt'])
     def get_vms(self):
         """Get VMs active / not active."""
         self.logger.info('getting vm(s) info.')
-        import libvirt
-        import sys
-
-        conn = libvirt.open('qemu:///system')
-        if conn is None:
-            self.logger.warning(
-                'Error in libvirt qemu connection:\n {}'.format(sys.stderr)
-            )
-            return
-
-        domain_names = conn.listDefinedDomains()
-
-        if len(domain_names) <= 0:
-            return ['no_vms']
-        domain_ids = conn.listDomainsID()
-        if domain_ids is None:
-            self.logger.warning(
-                'Error in libvirt domain collection:\n {}'.format(sys.stderr)
-            )
-            return
-        return_dict = {}
-        return_dict['inactive_vms'] = domain_names
-        return_dict['active_vms'] = {}
-        if len(domain_ids) >= 0:
-            for domainID in domain_ids:
-                domain = conn.lookupByID(domainID)
-                return_dict['active_vms'][domain.name()] = {
-                    'os_type': domain.OSType(),
-                    'id': domain.ID(),
-                    'infos': {
-                        'state': domain.info()[0],
-                        'max_memory': domain.info()[1],
-                        'memory': domain.info()[2],
-                        'nb_virt_cpu': domain.info()[3],
-                        'cpu_time': domain.info()[4]
-                    }
-
-                }
-
-        conn.close()
-        return return_dict
+        from vms import collect_domains
+        return collect_domains(self.libvirt_uri, self.vm_details)
 
+    @probe('mounts', requires=['psutil'])
     def get_mounts(self):
         """Get Physical disc / nfs mounts."""
         self.logger.info('getting mounts.')
@@ -225,61 +215,445 @@ class Collector(object):
         return partitions_disks
 
 
-def get_metatdata(coll):
+# (section, probe) pairs collected by default
+METADATA_SECTIONS = [
+    ('env', 'env'),
+    ('packages', 'packages'),
+    ('processes', 'processes'),
+    ('time', 'time'),
+    ('cpu', 'cpu'),
+    ('mpi', 'mpi'),
+    ('vTorque', 'vTorque'),
+]
+# (section, probe) pairs of inventory.py -c and --collect_fleet
+INVENTORY_SECTIONS = [
+    ('network', 'network'),
+    ('vms', 'vms'),
+    ('users', 'users'),
+    ('mounts', 'mounts'),
+    ('collection_time', 'time'),
+]
+SECTION_SETS = {
+    'metadata': METADATA_SECTIONS,
+    'inventory': INVENTORY_SECTIONS,
+}
+
+
+def inventory_document(results):
+    """Add the sections inventory.py keeps empty for manual entries."""
+    results['storage'] = {"get_info": []}
+    results['comment'] = ""
+    return results
+
+
+def validate_probes(ctx, param, value):
+    """Click callback checking a comma separated list of probe names."""
+    names = parse_names(value)
+    try:
+        select_sections([], names)
+    except KeyError as e:
+        raise click.BadParameter(e.args[0])
+    return names
+
+
+def validate_vm_details(ctx, param, value):
+    """Click callback checking a comma separated list of vm counters."""
+    from vms import DETAILS
+    names = parse_names(value)
+    unknown = [n for n in names if n not in DETAILS]
+    if unknown:
+        raise click.BadParameter(
+            'unknown counter(s) {}, available: {}'.format(
+                ', '.join(unknown), ', '.join(sorted(DETAILS))))
+    return names
+
+
+def validate_process_attrs(ctx, param, value):
+    """Click callback checking a comma separated list of process attributes."""
+    from processes import ATTRS
+    names = parse_names(value)
+    unknown = [n for n in names if n not in ATTRS]
+    if unknown:
+        raise click.BadParameter(
+            'unknown attribute(s) {}, available: {}'.format(
+                ', '.join(unknown), ', '.join(ATTRS)))
+    return names
+
+
+def validate_seconds(ctx, param, value):
+    """Click callback parsing repeated NAME=SECONDS pairs into a dict."""
+    try:
+        return parse_timeouts(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def get_metatdata(coll, scheduler=None, sections=None):
     """Get all the data."""
-    metadata = {}
-    metadata['env'] = coll.collect_env()
-    metadata['packages'] = coll.collect_packages()
-    metadata['processes'] = coll.collect_processes()
-    metadata['time'] = coll.get_date()
-    metadata['cpu'] = coll.collect_cpu_info()
-    metadata['mpi'] = coll.get_mpi_version()
-    metadata['vTorque'] = coll.get_gitpath_version('...')
+    if scheduler is None:
+        scheduler = ProbeScheduler()
+    if sections is None:
+        sections = METADATA_SECTIONS
+    metadata = run_sections(coll, scheduler, sections)
     return {coll.collect_hostname(): metadata}
 
 
+COLLECTOR_OPTIONS = [
+    click.option(
+        '--workers',
+        default=4,
+        type=click.INT,
+        help='number of probes running at the same time'),
+    click.option(
+        '--timeout',
+        default=60,
+        type=click.FLOAT,
+        help='seconds a probe may run before it is cancelled'),
+    click.option(
+        '--probe_timeout',
+        multiple=True,
+        type=click.STRING,
+        callback=validate_seconds,
+        help='per probe deadline as SECTION=SECONDS, e.g. mpi=5'),
+    click.option(
+        '--pool',
+        default='thread',
+        type=click.Choice(['thread', 'process']),
+        help='run probes in threads or in killable processes'),
+    click.option(
+        '--probes',
+        callback=validate_probes,
+        help='comma separated probes to collect, e.g. time,processes,vms'),
+    click.option(
+        '--skip',
+        callback=validate_probes,
+        help='comma separated probes to leave out'),
+    click.option(
+        '--refresh',
+        default=False,
+        is_flag=True,
+        help='rebuild cached static sections like cpu, users and network'),
+    click.option(
+        '--cache_dir',
+        type=click.Path(),
+        help='directory of the cache for static sections'),
+    click.option(
+        '--user_source',
+        default='nss',
+        type=click.Choice(['nss', 'files']),
+        help='enumerate users through nss or only from the local files'),
+    click.option(
+        '--libvirt_uri',
+        default='qemu:///system',
+        type=click.STRING,
+        help='libvirt connection of the vms probe, e.g. test:///default'),
+    click.option(
+        '--vm_details',
+        callback=validate_vm_details,
+        help='comma separated vm counters to add: vcpu,block,net'),
+    click.option(
+        '--process_attrs',
+        default='pid,name',
+        callback=validate_process_attrs,
+        help='comma separated process attributes, e.g. pid,name,rss'),
+    click.option(
+        '--process_backend',
+        default='psutil',
+        type=click.Choice(['psutil', 'proc']),
+        help='read processes with psutil or directly from /proc'),
+    click.option(
+        '--process_user',
+        type=click.STRING,
+        help='only record processes of this user'),
+    click.option(
+        '--process_name',
+        type=click.STRING,
+        help='only record processes whose name matches this regex'),
+    click.option(
+        '--process_cgroup',
+        type=click.STRING,
+        help='only record processes in a cgroup containing this path'),
+    click.option(
+        '--process_stream',
+        type=click.Path(),
+        help='write processes as JSON lines to this file instead'),
+]
+
+
+INSTRUMENT_OPTIONS = [
+    click.option(
+        '--no_stats',
+        default=False,
+        is_flag=True,
+        help='leave the probe measurements out of the document'),
+    click.option(
+        '--metrics_file',
+        type=click.Path(),
+        help='write the probe measurements to this file, prometheus '
+             'text for .prom, else appended JSON lines'),
+    click.option(
+        '--profile',
+        type=click.Path(),
+        help='write a cProfile dump of the whole collection to this file'),
+]
+
+
+def instrument_options(func):
+    """Add the options about measuring a collection to a command."""
+    for option in reversed(INSTRUMENT_OPTIONS):
+        func = option(func)
+    return func
+
+
+def collector_options(func):
+    """Add the options configuring Collector and probes to a command."""
+    for option in reversed(COLLECTOR_OPTIONS):
+        func = option(func)
+    return func
+
+
+def collector_from_options(options):
+    """Build the Collector and ProbeScheduler configured by options."""
+    from processes import ProcessSnapshot
+    coll = Collector(
+        FileCache(options['cache_dir'], options['refresh']),
+        options['user_source'],
+        options['libvirt_uri'],
+        options['vm_details'],
+        ProcessSnapshot(
+            options['process_attrs'], options['process_backend'],
+            options['process_user'], options['process_name'],
+            options['process_cgroup']),
+        options['process_stream'])
+    scheduler = ProbeScheduler(
+        options['workers'], options['timeout'], options['pool'],
+        options['probe_timeout'])
+    return coll, scheduler
+
+
+def collect_sections(options, sections):
+    """Collect sections as configured by options, return (host, results).
+
+    Every probe is measured. The measurements go into the section
+    _collection_stats (unless --no_stats) and to --metrics_file.
+    --profile dumps the profile of the run and of all its probes. Failing
+    to write either file is only a warning, the results are kept.
+    """
+    profiler = None
+    if options['profile']:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    coll, scheduler = collector_from_options(options)
+    probe_stats, profiles = {}, []
+    started = time.time()
+    results = run_sections(coll, scheduler, sections, probe_stats,
+                           profiles if profiler else None)
+    stats = collection_stats(probe_stats, started, time.time() - started,
+                             scheduler)
+    if profiler:
+        profiler.disable()
+        try:
+            write_profile(options['profile'], profiler, profiles)
+        except (IOError, OSError) as e:
+            coll.logger.warning('can not write the profile: {}'.format(e))
+    if options['metrics_file']:
+        try:
+            write_metrics(options['metrics_file'], coll.hostname, stats)
+        except (IOError, OSError) as e:
+            coll.logger.warning('can not write the metrics: {}'.format(e))
+    if not options['no_stats']:
+        results[STATS_SECTION] = stats
+    return coll.hostname, results
+
+
+EXPERIMENT_SECTION = 'experiment'
+
+
+def run_experiment(options, sections, command, interval, size,
+                   max_overhead):
+    """Collect before and after running command, sample while it runs.
+
+    Returns (host, document, exit status). The document is the snapshot
+    after the run with an experiment section holding the snapshot
+    before, the samples, the rates, the changed paths and the overhead
+    of the sampler.
+    """
+    from sampler import Sampler
+    hostname, before = collect_sections(options, sections)
+    vms = any(section == 'vms' for section, _ in sections)
+    start = time.time()
+    try:
+        proc = subprocess.Popen(list(command))
+    except OSError as e:
+        print('can not run {}: {}'.format(command[0], e.strerror))
+        exit(1)
+    sampler = Sampler(proc.pid, interval, size, max_overhead,
+                      options['libvirt_uri'] if vms else None)
+    try:
+        sampler.start()
+        status = proc.wait()
+    finally:
+        # the command is never left running without the sampler
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        sampler.stop()
+    end = time.time()
+    hostname, after = collect_sections(options, sections)
+    changes = FleetDiff(before).compare(hostname, after)
+    after[EXPERIMENT_SECTION] = {
+        'command': list(command),
+        'exit_status': status,
+        'start': start,
+        'end': end,
+        'wall_s': round(end - start, 6),
+        'before': before,
+        'samples': list(sampler.samples),
+        'rates': sampler.rates(),
+        'changes': [[format_path(p), kind] for p, kind in changes],
+        'sampler': sampler.overhead(),
+    }
+    return hostname, after, status
+
+
 @click.command()
 @click.option(
     '--input_path',
     type=click.Path(),
     help='the path to the directory containing the json files',
     required=True)
-def main(input_path):
+@click.option(
+    '--format',
+    'fmt',
+    default='json-compact',
+    type=click.Choice(FORMATS),
+    help='format of the written file')
+@click.option(
+    '--history',
+    type=click.Path(),
+    help='history directory the collection is appended to')
+@click.option(
+    '--sections',
+    'section_set',
+    default='metadata',
+    type=click.Choice(sorted(SECTION_SETS)),
+    help='collect the sections of this script or of inventory.py -c')
+@click.option(
+    '--wrap',
+    default=False,
+    is_flag=True,
+    help='run the command after -- and collect before and after it')
+@click.option(
+    '--sample_interval',
+    default=1.0,
+    type=click.FLOAT,
+    help='seconds between two samples while the wrapped command runs')
+@click.option(
+    '--sample_size',
+    default=600,
+    type=click.IntRange(1, None),
+    help='samples kept, older ones are dropped')
+@click.option(
+    '--max_overhead',
+    default=0.01,
+    type=click.FLOAT,
+    help='share of one cpu the sampler may use before it slows down')
+@click.argument('command', nargs=-1, type=click.UNPROCESSED)
+@collector_options
+@instrument_options
+def main(input_path, fmt, history, section_set, wrap, sample_interval,
+         sample_size, max_overhead, command, **options):
     """
     Collect information of this node and saves it to a json file.
 
     Click is used to build help and pares input.
-    --input_path    the path to the where the json file should be written.
+    --input_path    the path to the where the json file should be written,
+                    - writes the document to stdout (used by collect-fleet)
+    --format        json, json-compact, gzip, zstd or msgpack
+    --history       keep every collection of this node in a history store,
+                    the json file then always holds the latest one
+    --sections      metadata (default) or inventory, the document of
+                    inventory.py -c (used by collect-fleet)
+    --no_stats      leave _collection_stats, the probe measurements, out
+    --metrics_file  write the probe measurements to a metrics file
+    --profile       write a cProfile dump of the collection
+    --wrap          run the command given after -- as an experiment:
+                    collect before and after it, sample the processes,
+                    VMs, load and disk I/O while it runs and exit with
+                    its status
+    All other options select and configure the probes, see --help.
     """
+    if wrap and not command:
+        raise click.UsageError('--wrap needs a command after --')
+    if command and not wrap:
+        raise click.UsageError('a command is only run with --wrap')
     metadata_path = input_path
-    print 'write to %s' % metadata_path
-
-    # see if path exist
-    try:
-        if not path.exists(metadata_path):
-            print('path %s dose not exist, try to create it.' % metadata_path)
-            makedirs(metadata_path)
-    except Exception as e:
-        raise e
-
-    # collect data
-    print('collecting data...')
-    coll = Collector()
-    out = get_metatdata(coll)
-
-    nodename = str(out.keys()[0])
+    to_stdout = metadata_path == '-'
+    if not to_stdout:
+        print 'write to %s' % metadata_path
+
+        # see if path exist
+        try:
+            if not path.exists(metadata_path):
+                print('path %s dose not exist, try to create it.'
+                      % metadata_path)
+                makedirs(metadata_path)
+        except Exception as e:
+            raise e
+
+        # collect data
+        print('collecting data...')
+    sections = select_sections(
+        SECTION_SETS[section_set], options['probes'], options['skip'])
+    if wrap:
+        nodename, metadata, status = run_experiment(
+            options, sections, command, sample_interval, sample_size,
+            max_overhead)
+    else:
+        nodename, metadata = collect_sections(options, sections)
+    if section_set == 'inventory':
+        inventory_document(metadata)
+    out = {nodename: metadata}
+    nodename = str(nodename)
+
+    if wrap:
+        if history:
+            after = dict(metadata)
+            del after[EXPERIMENT_SECTION]
+            HistoryStore(history).append(nodename, after)
+        data = encode(out, fmt)
+        if to_stdout:
+            sys.stdout.write(data)
+            sys.stdout.flush()
+        else:
+            with open('%s/%s-experiment-%s%s' % (
+                    metadata_path, nodename,
+                    time.strftime('%Y%m%d-%H%M%S'), SUFFIXES[fmt]),
+                    'wb') as fp:
+                fp.write(data)
+        sys.exit(status)
+
+    if to_stdout:
+        if history:
+            HistoryStore(history).append(nodename, out[nodename])
+        sys.stdout.write(encode(out, fmt))
+        sys.stdout.flush()
+        return
 
     # write file out
-    json_path = str('%s/%s.json' % (metadata_path, nodename))
+    json_path = str('%s/%s%s' % (metadata_path, nodename, SUFFIXES[fmt]))
 
-    if path.exists(json_path):
+    if history:
+        HistoryStore(history).append(nodename, out[nodename])
+    elif path.exists(json_path):
         print(
             '%s already exists. please check if it is created by someone else'
             % json_path)
         exit()
 
-    with open(json_path, 'w') as fp:
-        json.dump(out, fp)
+    data = encode(out, fmt)
+    with open(json_path, 'wb') as fp:
+        fp.write(data)
 
 if __name__ == '__main__':
     # Start now!
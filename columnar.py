@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Flatten host documents into tables for analytics.
+
+Every table is one file in the output directory, with a row per host
+(hosts) or per host and entry (packages, addresses, ...). Hosts are
+added one at a time and rows are written in batches, so memory is
+bounded by the batch size and not by the fleet. Parquet and Arrow
+files store the string columns dictionary encoded.
+"""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-02
+
+import os
+import csv
+import sys
+import importlib
+import collections
+
+COLUMN_FORMATS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    # the arrow stream format, which allows a dictionary per batch
+    'arrow': '.arrows',
+}
+BATCH_ROWS = 65536
+# address families of the network section, as netifaces numbers them
+FAMILIES = {'2': 'inet', '10': 'inet6', '17': 'link'}
+
+Table = collections.namedtuple('Table', 'columns types rows')
+
+
+def _section(document, name, kind):
+    """Return a section if it has the expected type and is no error."""
+    value = document.get(name)
+    if not isinstance(value, kind) or \
+            (isinstance(value, dict) and '_error' in value):
+        return kind()
+    return value
+
+
+def _host_rows(hostname, document):
+    cpu = _section(document, 'cpu', dict)
+    moment = _section(document, 'collection_time', dict) or \
+        _section(document, 'time', dict)
+    mpi = _section(document, 'mpi', dict)
+    vtorque = document.get('vTorque')
+    yield (hostname, moment.get('time_stamp'), cpu.get('brand'),
+           cpu.get('count'), cpu.get('hz_advertised'), cpu.get('arch'),
+           cpu.get('vendor_id'), cpu.get('family'), cpu.get('model'),
+           mpi.get('version'),
+           vtorque if not isinstance(vtorque, dict) else None)
+
+
+def _cpu_flag_rows(hostname, document):
+    for flag in _section(document, 'cpu', dict).get('flags') or ():
+        yield hostname, flag
+
+
+def _package_rows(hostname, document):
+    packages = _section(document, 'packages', dict)
+    for name in sorted(packages):
+        yield hostname, name, packages[name]
+
+
+def _address_rows(hostname, document):
+    network = _section(document, 'network', dict)
+    for interface in sorted(network):
+        families = network[interface]
+        if interface == 'ip_v4_gateways' or not isinstance(families, dict):
+            continue
+        for family in sorted(families):
+            for address in families[family]:
+                yield (hostname, interface, FAMILIES.get(family, family),
+                       address.get('addr'), address.get('netmask'),
+                       address.get('broadcast'))
+
+
+def _mount_rows(hostname, document):
+    for mount in _section(document, 'mounts', list):
+        yield (hostname, ) + tuple(mount[:4])
+
+
+def _user_rows(hostname, document):
+    users = _section(document, 'users', dict)
+    for user in sorted(users):
+        for group in users[user]:
+            yield hostname, user, group
+
+
+def _process_rows(hostname, document):
+    for process in _section(document, 'processes', list):
+        yield hostname, process.get('pid'), process.get('name')
+
+
+def _vm_rows(hostname, document):
+    vms = _section(document, 'vms', dict).get('active_vms') or {}
+    for name in sorted(vms):
+        infos = vms[name].get('infos', {})
+        yield (hostname, name, infos.get('state'), infos.get('nb_virt_cpu'),
+               infos.get('memory'), infos.get('cpu_time'))
+
+
+# table name to Table, types are s for strings, i for integers, f for floats
+TABLES = collections.OrderedDict([
+    ('hosts', Table(
+        ('host', 'time_stamp', 'cpu_brand', 'cpu_count', 'cpu_hz',
+         'cpu_arch', 'cpu_vendor', 'cpu_family', 'cpu_model', 'mpi_version',
+         'vtorque'), 'sfsisssiiss', _host_rows)),
+    ('cpu_flags', Table(('host', 'flag'), 'ss', _cpu_flag_rows)),
+    ('packages', Table(('host', 'package', 'version'), 'sss',
+                       _package_rows)),
+    ('addresses', Table(
+        ('host', 'interface', 'family', 'address', 'netmask', 'broadcast'),
+        'ssssss', _address_rows)),
+    ('mounts', Table(('host', 'device', 'mountpoint', 'fstype', 'options'),
+                     'sssss', _mount_rows)),
+    ('users', Table(('host', 'user', 'group'), 'sss', _user_rows)),
+    ('processes', Table(('host', 'pid', 'name'), 'sis', _process_rows)),
+    ('vms', Table(('host', 'vm', 'state', 'vcpus', 'memory_kb',
+                   'cpu_time_ns'), 'ssiiii', _vm_rows)),
+])
+
+
+def parse_tables(value):
+    """Return the table names of a comma separated list, all if empty."""
+    names = [n.strip() for n in (value or '').split(',') if n.strip()]
+    unknown = [n for n in names if n not in TABLES]
+    if unknown:
+        raise KeyError('unknown table(s) {}, available: {}'.format(
+            ', '.join(unknown), ', '.join(TABLES)))
+    return names or list(TABLES)
+
+
+def _pyarrow(fmt):
+    """Import pyarrow, which the parquet and arrow formats need."""
+    try:
+        return importlib.import_module('pyarrow')
+    except ImportError:
+        raise ValueError('format {} needs the python module pyarrow'.format(
+            fmt))
+
+
+def _text(value):
+    """Return strings as they are, other values but None as strings."""
+    if value is None or isinstance(value, type(u'')):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return u'{}'.format(value)
+
+
+def _encoded(row):
+    """Encode the unicode cells of a row for the python 2 csv module."""
+    return [v.encode('utf-8') if isinstance(v, unicode) else v  # noqa
+            for v in row]
+
+
+class CsvTableWriter(object):
+    """Writes the rows of a table to a CSV file with a header line."""
+
+    def __init__(self, file_path, table):
+        """Class init."""
+        if sys.version_info[0] < 3:
+            self.fp = open(file_path, 'wb')
+        else:
+            self.fp = open(file_path, 'w', newline='')
+        self.writer = csv.writer(self.fp)
+        self.writer.writerow(table.columns)
+
+    def write(self, rows):
+        # python 2 writes ascii unicode as it is, only rows failing with
+        # other characters are encoded, None becomes an empty cell
+        writerow = self.writer.writerow
+        for row in rows:
+            try:
+                writerow(row)
+            except UnicodeEncodeError:
+                writerow(_encoded(row))
+
+    def close(self):
+        self.fp.close()
+
+
+class ArrowTableWriter(object):
+    """Writes the rows of a table as Parquet row groups or Arrow batches.
+
+    Every batch is one row group or record batch, its string columns
+    are dictionary encoded.
+    """
+
+    def __init__(self, file_path, table, fmt):
+        """Class init."""
+        pa = self.pa = _pyarrow(fmt)
+        types = {
+            's': pa.dictionary(pa.int32(), pa.string()),
+            'i': pa.int64(),
+            'f': pa.float64(),
+        }
+        self.types = [types[t] for t in table.types]
+        self.schema = pa.schema([pa.field(name, t) for name, t in
+                                 zip(table.columns, self.types)])
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(file_path, self.schema)
+        else:
+            import pyarrow.ipc  # noqa
+            self.sink = pa.OSFile(file_path, 'wb')
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        self.fmt = fmt
+
+    def _column(self, values, type_):
+        pa = self.pa
+        if pa.types.is_dictionary(type_):
+            return pa.array([_text(v) for v in values],
+                            pa.string()).dictionary_encode()
+        return pa.array(values, type_)
+
+    def write(self, rows):
+        columns = [self._column(list(values), type_) for values, type_ in
+                   zip(zip(*rows), self.types)]
+        batch = self.pa.RecordBatch.from_arrays(columns, self.schema.names)
+        if self.fmt == 'parquet':
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        if self.fmt != 'parquet':
+            self.sink.close()
+
+
+class ColumnarExporter(object):
+    """Flattens host documents into the files of tables in out_dir."""
+
+    def __init__(self, out_dir, tables=None, fmt='csv',
+                 batch_rows=BATCH_ROWS):
+        """Class init.
+
+        out_dir     directory the table files are written to
+        tables      names of the tables to write, all if None
+        fmt         csv, parquet or arrow
+        batch_rows  rows of a table buffered before they are written
+        """
+        if fmt not in COLUMN_FORMATS:
+            raise ValueError('unknown format {}, use one of {}'.format(
+                fmt, ', '.join(sorted(COLUMN_FORMATS))))
+        if fmt != 'csv':
+            _pyarrow(fmt)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        self.batch_rows = max(1, batch_rows)
+        self.tables = collections.OrderedDict(
+            (name, TABLES[name]) for name in tables or TABLES)
+        self.writers = {}
+        self.paths = {}
+        for name, table in self.tables.items():
+            path = os.path.join(out_dir, name + COLUMN_FORMATS[fmt])
+            self.paths[name] = path
+            self.writers[name] = CsvTableWriter(path, table) \
+                if fmt == 'csv' else ArrowTableWriter(path, table, fmt)
+        self.buffers = dict((name, []) for name in self.tables)
+        self.rows = dict((name, 0) for name in self.tables)
+        self.hosts = 0
+
+    def _flush(self, name):
+        if self.buffers[name]:
+            self.writers[name].write(self.buffers[name])
+            self.rows[name] += len(self.buffers[name])
+            self.buffers[name] = []
+
+    def add(self, hostname, document):
+        """Add the rows of one host to all tables."""
+        if not isinstance(document, dict):
+            return
+        for name, table in self.tables.items():
+            buf = self.buffers[name]
+            for row in table.rows(hostname, document):
+                buf.append(row)
+                if len(buf) >= self.batch_rows:
+                    self._flush(name)
+                    buf = self.buffers[name]
+        self.hosts += 1
+
+    def add_hosts(self, hosts):
+        """Add the (host name, document) pairs of an iterable."""
+        for hostname, document in hosts:
+            self.add(hostname, document)
+        return self
+
+    def close(self):
+        """Write the remaining rows, return table name to rows written."""
+        for name in self.tables:
+            self._flush(name)
+            self.writers[name].close()
+        return dict(self.rows)
@@ -24,16 +24,161 @@
 import logging
 import json
 import os
+import mmap
+import fcntl
+import tempfile
+from jsoncodec import loads
+from formats import detect_format, encode, decode, format_for_path
+from fleetdiff import FleetDiff, format_path
+from query import Query, QueryError, is_query
+from jsonstream import JsonObjectWriter
+from valueindex import ValueIndex, iter_terms, parse_lookup, term_key
+from dedup import deduplicate, expand, is_deduplicated
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+SHARD_DIR = 'hosts'
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+OFFSET_INDEX_SUFFIX = '.idx'
+OFFSET_INDEX_VERSION = 1
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS sections (
+    host TEXT NOT NULL REFERENCES hosts (host),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (host, key)
+);
+CREATE INDEX IF NOT EXISTS sections_by_key ON sections (key, host);
+"""
+
+
+def get_connector(path):
+    """Return the connector for the database at path.
+
+    A directory (or a path ending with a slash) is a sharded database,
+    everything else a single JSON file.
+    """
+    if path.endswith(os.sep) or os.path.isdir(path):
+        return ShardedConnector(path.rstrip(os.sep) or path)
+    if path.endswith(SQLITE_SUFFIXES):
+        return SqliteConnector(path)
+    return JsonConnector(path)
+
+
+def write_atomic(file_path, dict_to_write, **dump_args):
+    """Write a dict as JSON to a temporary file and rename it to file_path.
+
+    Readers see either the old or the new content, never a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)),
+        prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(dict_to_write, fp, **dump_args)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(tmp_path, file_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def write_offset_index(file_path, hosts):
+    """Write the sidecar index of a JSON db file.
+
+    hosts maps every top level key of file_path to [offset, length] of its
+    value. The size and mtime of file_path are recorded to detect a file
+    changed without updating the index.
+    """
+    stat = os.stat(file_path)
+    write_atomic(file_path + OFFSET_INDEX_SUFFIX, {
+        'version': OFFSET_INDEX_VERSION,
+        'output': [stat.st_size, stat.st_mtime],
+        'hosts': hosts,
+    })
+
+
+def read_offset_index(file_path):
+    """Return the host offsets of a JSON db file, None if missing or stale."""
+    try:
+        with open(file_path + OFFSET_INDEX_SUFFIX) as fp:
+            index = json.load(fp)
+        stat = os.stat(file_path)
+    except (IOError, OSError, ValueError):
+        return None
+    if (index.get('version') != OFFSET_INDEX_VERSION or
+            index['output'] != [stat.st_size, stat.st_mtime]):
+        return None
+    return index['hosts']
+
+
+def dump_indexed(dict_to_write, file_path):
+    """Write a dict like json.dump(sort_keys, indent=4) plus its index."""
+    hosts = {}
+    with open(file_path, 'w') as fp:
+        writer = JsonObjectWriter(fp)
+        for key in sorted(dict_to_write):
+            hosts[key] = writer.write(key, dict_to_write[key])
+        writer.close()
+    write_offset_index(file_path, hosts)
+
+
+def dump_format(dict_to_write, file_path, fmt='json', dedup=False):
+    """Write a dict in fmt, plain JSON gets an offset index.
+
+    With dedup the hosts are written in the deduplicated layout of
+    dedup.py, which is always read as a whole.
+    """
+    if dedup:
+        dict_to_write = deduplicate(dict_to_write)
+    elif fmt == 'json':
+        dump_indexed(dict_to_write, file_path)
+        return
+    with open(file_path, 'wb') as fp:
+        fp.write(encode(dict_to_write, fmt))
+    if os.path.exists(file_path + OFFSET_INDEX_SUFFIX):
+        # only plain JSON can be read by offset
+        os.remove(file_path + OFFSET_INDEX_SUFFIX)
 
 
 class JsonConnector(object):
     """Class to interact with the json file."""
 
+    # format written by dump_dict, None picks it from the file suffix
+    format = None
+    # save_dict writes the inverted value index as well
+    value_index = False
+    # store shared sections once, kept if the file was read deduplicated
+    dedup = False
+
     def __init__(self, path):
-        """Class init."""
+        """Class init.
+
+        With a valid sidecar index (written by dump_dict and the merges)
+        single hosts are read from their offset, the whole file is only
+        parsed when all hosts are needed.
+        """
         self.json_file = path
         self.logger = self._get_logger()
-        self.dict_server = self._get_dict_from_file()
+        self._dict_server = None
+        self.offsets = read_offset_index(path)
+        if self.offsets is None:
+            self._dict_server = self._get_dict_from_file()
+
+    @property
+    def dict_server(self):
+        """All hosts in one dict, parses the whole file on first use."""
+        if self._dict_server is None:
+            self._dict_server = self._get_dict_from_file()
+        return self._dict_server
 
     def _get_logger(self):
         """Setup the global logger."""
@@ -70,9 +215,8 @@ class JsonConnector(object):
 
     def _get_dict_from_file(self):
         try:
-            file = open(self.json_file)
-            return_dict = json.load(file)
-            file.close()
+            with open(self.json_file, 'rb') as file:
+                data = file.read()
 
         except (IOError):
             self.logger.warning(
@@ -82,22 +226,75 @@ class JsonConnector(object):
             self.dump_dict(self._get_default_dict(), self.json_file)
             return self._get_dict_from_file()
 
-        except (ValueError) as e:
+        try:
+            return_dict = decode(data)
+            if is_deduplicated(return_dict):
+                self.dedup = True
+                return_dict = expand(return_dict)
+        except (ValueError, IOError) as e:
+            # IOError is raised for broken gzip data
             self.logger.error(
                 'something is wrong with the json file.\n{}'.format(e))
             exit(1)
+        if self.format is None and detect_format(data) != 'json':
+            # keep writing compressed or binary files as they are
+            self.format = detect_format(data)
 
-        self.logger.debug(
-            json.dumps(return_dict, sort_keys=True, indent=4)
-        )
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                json.dumps(return_dict, sort_keys=True, indent=4)
+            )
 
         return return_dict
 
+    def _read_offset(self, hostname):
+        """Decode only the value of hostname, found with the offset index."""
+        offset, length = self.offsets[hostname]
+        with open(self.json_file, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return loads(mapped[offset:offset + length])
+            finally:
+                mapped.close()
+
+    def _host_names(self):
+        """Return the names of all stored hosts."""
+        if self._dict_server is None:
+            return self.offsets.keys()
+        return self.dict_server.keys()
+
+    def has_host(self, hostname):
+        """Tell if a host of this name is stored."""
+        return hostname in self._host_names()
+
+    def _get_host(self, hostname):
+        """Return the document of one host, raise KeyError if unknown."""
+        if self._dict_server is None:
+            return self._read_offset(hostname)
+        return self.dict_server[hostname]
+
+    def _iter_hosts(self):
+        """Yield (host name, document) of all stored hosts."""
+        if self._dict_server is None:
+            return self._iter_offsets()
+        return iter(self.dict_server.items())
+
+    def _iter_offsets(self):
+        """Decode the hosts one at a time from a single mapping."""
+        with open(self.json_file, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for hostname in sorted(self.offsets):
+                    offset, length = self.offsets[hostname]
+                    yield hostname, loads(mapped[offset:offset + length])
+            finally:
+                mapped.close()
+
     def get_host_infos(self, hostname):
         """Return informations to a host."""
         try:
             print_string = json.dumps(
-                self.dict_server[hostname],
+                self._get_host(hostname),
                 sort_keys=True,
                 indent=4
             )
@@ -110,7 +307,7 @@ class JsonConnector(object):
     def get_host_keys(self, hostname):
         """Get all keys stored for a host."""
         try:
-            key_list = self.dict_server[hostname].keys()
+            key_list = self._get_host(hostname).keys()
         except (KeyError):
             self.logger.error(
                 "Server informations not found for: {}".format(hostname)
@@ -121,15 +318,17 @@ class JsonConnector(object):
 
     def list_hosts(self):
         """List all stored hosts."""
-        host_list = self.dict_server.keys()
+        host_list = self._host_names()
         for host in sorted(host_list):
             print(host)
 
     def get_host_value_to_key(self, host, key):
         """Get a value to a key of a host."""
+        if is_query(key):
+            return self.query_hosts(key, host)
         try:
             print_string = json.dumps(
-                self.dict_server[host][key],
+                self._get_host(host)[key],
                 sort_keys=True,
                 indent=4
             )
@@ -145,17 +344,80 @@ class JsonConnector(object):
         """Add a new host to the store."""
         self.dict_server.update(update_dict)
 
+    def _iter_sections(self, sections, host=None):
+        """Yield (host name, document) with at least the given sections.
+
+        sections is a set of top-level keys or None for all, host limits
+        the result to this host.
+        """
+        if host is None:
+            return self._iter_hosts()
+        try:
+            return iter([(host, self._get_host(host))])
+        except (KeyError):
+            return iter([])
+
+    def query_hosts(self, expression, host=None):
+        """Show the values a query finds in all hosts or in host.
+
+        The expression is compiled once, then applied to one host after
+        the other, see query.py for the syntax.
+        """
+        try:
+            query = Query(expression)
+        except QueryError as e:
+            self.logger.error('invalid query: {}'.format(e))
+            exit(1)
+        found = False
+        for hostname, values in query.run(
+                self._iter_sections(query.sections(), host)):
+            found = True
+            print('Host: {} Query: {}'.format(hostname, expression))
+            for value in values:
+                print(json.dumps(value, sort_keys=True, indent=4))
+        if not found:
+            print('No host matches: {}'.format(expression))
+
+    def lookup_hosts(self, expressions):
+        """Show the hosts matching all lookups like packages.openmpi=1.10.
+
+        The value index written next to the database answers without
+        reading any host. If it is missing or older than the database,
+        all hosts are scanned.
+        """
+        lookups = [parse_lookup(e) for e in expressions]
+        index = ValueIndex.load(self.value_index_file)
+        if index is not None:
+            found = set(index.lookup(lookups[0]))
+            for terms in lookups[1:]:
+                found.intersection_update(index.lookup(terms))
+        else:
+            self.logger.warning(
+                'No current value index for {}, scanning all hosts'.format(
+                    self.json_file))
+            keys = [set(term_key(t) for t in terms) for terms in lookups]
+            found = set()
+            for host, host_dict in self._iter_hosts():
+                host_keys = set(term_key(t) for t in iter_terms(host_dict))
+                if all(host_keys & k for k in keys):
+                    found.add(host)
+        print('Hosts with {}: {}'.format(' and '.join(expressions),
+                                         len(found)))
+        for host in sorted(found):
+            print(host)
+
     def get_all_host_keys(self, show):
         """Show one key in all hosts (eg. show all users)."""
+        if is_query(show):
+            return self.query_hosts(show)
         search_key = show
-        host_list = self.dict_server.keys()
         missing_key = []
-        for host in host_list:
-            if search_key in self.dict_server[host].keys():
+        for host, host_dict in self._iter_hosts():
+            if search_key in host_dict.keys():
                 print('Host: {} Key: {}'.format(host, search_key))
                 print(
                     json.dumps(
-                        self.dict_server[host][search_key],
+                        host_dict[search_key],
                         sort_keys=True,
                         indent=4
                     )
@@ -165,6 +427,44 @@ class JsonConnector(object):
 
         print('Hosts without the key: {}'.format(missing_key))
 
+    def diff_hosts(self, reference, show=None):
+        """Show how all hosts differ from the reference host.
+
+        Hosts are grouped per section by the hash of the section, then
+        the differing paths of every host are listed. show limits the
+        diff to one section.
+        """
+        try:
+            ref_dict = self._get_host(reference)
+        except (KeyError):
+            self.logger.error(
+                "Server informations not found for: {}".format(reference)
+            )
+            exit(1)
+        diff = FleetDiff(ref_dict, [show] if show else None)
+        differences = []
+        for host, host_dict in self._iter_hosts():
+            found = diff.compare(host, host_dict)
+            if found:
+                differences.append((host, found))
+
+        for section, classes in diff.section_classes():
+            print('Section: {} Classes: {}'.format(section, len(classes)))
+            for number, (kind, hosts) in enumerate(classes):
+                label = 'class {}'.format(number + 1)
+                if kind == 'reference':
+                    label += ' like {}'.format(reference)
+                elif kind == 'missing':
+                    label = 'without {}'.format(section)
+                print('  {} ({} hosts): {}'.format(
+                    label, len(hosts), ', '.join(sorted(hosts))))
+        print('Differences to {}:'.format(reference))
+        for host, found in differences:
+            for path, kind in found:
+                print('{}: {} {}'.format(host, format_path(path), kind))
+        print('Hosts equal to {}: {}'.format(
+            reference, len(diff.hosts) - len(differences) - 1))
+
     def dump_dict(self, dict_to_write, json_file_path):
         """Dump the given dict to a json file."""
         db_pardir = os.path.abspath(os.path.join(
@@ -178,10 +478,328 @@ class JsonConnector(object):
             self.logger.info('creating {}'.format(db_pardir))
             os.makedirs(db_pardir)
 
-        with open(json_file_path, 'w') as fp:
-            json.dump(dict_to_write, fp, sort_keys=True, indent=4)
-            fp.close()
+        dump_format(dict_to_write, json_file_path,
+                    self.format or format_for_path(json_file_path),
+                    self.dedup)
+
+    @property
+    def value_index_file(self):
+        """The file the value index belongs to, it is written next to it."""
+        return self.json_file
 
     def save_dict(self):
         """Save the stored dictionary."""
         self.dump_dict(self.dict_server, self.json_file)
+        if self.value_index:
+            ValueIndex.build(self.dict_server.items()).save(
+                self.value_index_file)
+
+    def import_file(self, json_file_path):
+        """Add all hosts of a JSON database file to this database."""
+        with open(json_file_path, 'rb') as fp:
+            self.add_host(expand(decode(fp.read())))
+        self.save_dict()
+
+    def export_file(self, json_file_path):
+        """Write all hosts of this database to a JSON database file."""
+        self.dump_dict(self.dict_server, json_file_path)
+
+
+class ShardedConnector(JsonConnector):
+    """Stores every host in its own file next to a small index.
+
+    Layout of the database directory:
+    index.json          {"hosts": {host name: shard file}}
+    hosts/<host>.json   document of one host
+    Reading a host opens only the index and its shard, saving rewrites only
+    the shards of added hosts and the index. The value index belongs to
+    index.json and is updated with the added hosts, shards are always
+    indented json and never deduplicated.
+    """
+
+    def __init__(self, path):
+        """Class init."""
+        self.json_file = path
+        self.logger = self._get_logger()
+        self.index_file = os.path.join(path, INDEX_FILE)
+        self.pending = {}
+        self.index = self._get_index()
+
+    def _get_index(self):
+        try:
+            with open(self.index_file) as fp:
+                return json.load(fp)['hosts']
+
+        except (IOError):
+            self.logger.warning(
+                'No database index found please check path: {}'.format(
+                    self.index_file))
+            self.logger.info('creating new db: {}'.format(self.json_file))
+            self.pending = self._get_default_dict()
+            self.index = {}
+            self.save_dict()
+            return self._get_index()
+
+        except (ValueError, KeyError) as e:
+            self.logger.error(
+                'something is wrong with the index file.\n{}'.format(e))
+            exit(1)
+
+    @staticmethod
+    def shard_name(hostname):
+        """Return the file name of the shard of hostname."""
+        return '{}.json'.format(quote(hostname, safe=''))
+
+    def _shard_path(self, shard):
+        return os.path.join(self.json_file, SHARD_DIR, shard)
+
+    @property
+    def value_index_file(self):
+        return self.index_file
+
+    @property
+    def dedup(self):
+        return False
+
+    @dedup.setter
+    def dedup(self, value):
+        if value:
+            raise ValueError(
+                '{} is a sharded database, which stores every host on its '
+                'own and can not be deduplicated'.format(self.json_file))
+
+    @property
+    def format(self):
+        # exports pick their format from the file suffix
+        return None
+
+    @format.setter
+    def format(self, value):
+        if value not in (None, 'json'):
+            raise ValueError(
+                '{} is a sharded database, its shards are always written '
+                'as json, not {}'.format(self.json_file, value))
+
+    @property
+    def dict_server(self):
+        """All hosts in one dict, loads every shard."""
+        return dict(self._iter_hosts())
+
+    def _host_names(self):
+        return set(self.index) | set(self.pending)
+
+    def _get_host(self, hostname):
+        if hostname in self.pending:
+            return self.pending[hostname]
+        shard = self.index[hostname]
+        with open(self._shard_path(shard)) as fp:
+            return json.load(fp)
+
+    def _iter_hosts(self):
+        for hostname in sorted(self._host_names()):
+            yield hostname, self._get_host(hostname)
+
+    def add_host(self, update_dict):
+        """Add a new host to the store."""
+        self.pending.update(update_dict)
+
+    def save_dict(self):
+        """Write the shards of added hosts and update the index.
+
+        The index is re-read under a lock, so concurrent runs adding
+        different hosts do not drop each other's entries. A current value
+        index gets only the added hosts, a missing or stale one is rebuilt
+        from all shards.
+        """
+        shard_dir = os.path.join(self.json_file, SHARD_DIR)
+        if not os.path.exists(shard_dir):
+            self.logger.info('creating {}'.format(shard_dir))
+            os.makedirs(shard_dir)
+
+        shards = {}
+        for hostname, host_dict in self.pending.items():
+            shards[hostname] = self.shard_name(hostname)
+            write_atomic(self._shard_path(shards[hostname]), host_dict,
+                         sort_keys=True, indent=4)
+
+        with open(os.path.join(self.json_file, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.index_file) as fp:
+                    index = json.load(fp)['hosts']
+            except (IOError, ValueError, KeyError):
+                index = {}
+            index.update(shards)
+            # loaded before index.json changes, which makes it stale
+            values = ValueIndex.load(self.index_file) \
+                if self.value_index else None
+            write_atomic(self.index_file, {'hosts': index},
+                         sort_keys=True, indent=4)
+            self.index = index
+            if self.value_index:
+                if values is None:
+                    values = ValueIndex.build(self._iter_hosts())
+                else:
+                    for hostname, host_dict in self.pending.items():
+                        values.add(hostname, host_dict)
+                values.save(self.index_file)
+        self.pending = {}
+
+
+class SqliteConnector(JsonConnector):
+    """Stores hosts and their top-level sections as rows of a SQLite db.
+
+    Every section value is kept as JSON text, pretty-printed the way it is
+    shown, so printing a section needs no re-serialization. Looking up a
+    key of all hosts is one query on the (key, host) index. The value
+    index is written next to the db file and updated with the added
+    hosts, rows are never deduplicated.
+    """
+
+    def __init__(self, path):
+        """Class init."""
+        import sqlite3
+        self.json_file = path
+        self.logger = self._get_logger()
+        is_new = not os.path.exists(path)
+        db_pardir = os.path.dirname(os.path.abspath(path))
+        if is_new and not os.path.exists(db_pardir):
+            self.logger.info('creating {}'.format(db_pardir))
+            os.makedirs(db_pardir)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.pending = {}
+        if is_new:
+            self.logger.info('creating new db file: {}'.format(path))
+            self.add_host(self._get_default_dict())
+            self.save_dict()
+
+    @property
+    def dedup(self):
+        return False
+
+    @dedup.setter
+    def dedup(self, value):
+        if value:
+            raise ValueError(
+                '{} is a SQLite database, which stores every section in its '
+                'own row and can not be deduplicated'.format(self.json_file))
+
+    @property
+    def dict_server(self):
+        """All hosts in one dict, loads every row."""
+        return dict(self._iter_hosts())
+
+    def _host_names(self):
+        rows = self.conn.execute('SELECT host FROM hosts')
+        return set(row[0] for row in rows) | set(self.pending)
+
+    def has_host(self, hostname):
+        return hostname in self.pending or self.conn.execute(
+            'SELECT 1 FROM hosts WHERE host = ?',
+            (hostname,)).fetchone() is not None
+
+    def _get_host(self, hostname):
+        if hostname in self.pending:
+            return self.pending[hostname]
+        if self.conn.execute('SELECT 1 FROM hosts WHERE host = ?',
+                             (hostname,)).fetchone() is None:
+            raise KeyError(hostname)
+        rows = self.conn.execute(
+            'SELECT key, value FROM sections WHERE host = ?', (hostname,))
+        return dict((key, json.loads(value)) for key, value in rows)
+
+    def _iter_hosts(self):
+        for hostname in sorted(self._host_names()):
+            yield hostname, self._get_host(hostname)
+
+    def get_host_value_to_key(self, host, key):
+        """Get a value to a key of a host."""
+        if is_query(key):
+            return self.query_hosts(key, host)
+        row = self.conn.execute(
+            'SELECT value FROM sections WHERE host = ? AND key = ?',
+            (host, key)).fetchone()
+        if row is None:
+            self.logger.error(
+                "Server informations not found for: host:"
+                " {} key: {}\n try -l for a list of keys".format(host, key)
+            )
+            exit(1)
+        print(row[0])
+
+    def _iter_sections(self, sections, host=None):
+        """Read only the sections a query needs."""
+        if sections is None:
+            return JsonConnector._iter_sections(self, sections, host)
+        return self._iter_section_rows(sections, host)
+
+    def _iter_section_rows(self, sections, host):
+        sql = 'SELECT host, key, value FROM sections WHERE key IN ({})'.format(
+            ', '.join('?' * len(sections)))
+        args = sorted(sections)
+        if host is not None:
+            sql += ' AND host = ?'
+            args.append(host)
+        document, current = {}, None
+        for hostname, key, value in self.conn.execute(
+                sql + ' ORDER BY host', args):
+            if hostname != current and current is not None:
+                yield current, document
+                document = {}
+            current = hostname
+            document[key] = json.loads(value)
+        if current is not None:
+            yield current, document
+
+    def get_all_host_keys(self, show):
+        """Show one key in all hosts (eg. show all users)."""
+        if is_query(show):
+            return self.query_hosts(show)
+        search_key = show
+        rows = self.conn.execute(
+            'SELECT host, value FROM sections WHERE key = ? ORDER BY host',
+            (search_key,))
+        for host, value in rows:
+            print('Host: {} Key: {}'.format(host, search_key))
+            print(value)
+
+        missing_key = [row[0] for row in self.conn.execute(
+            'SELECT host FROM hosts WHERE host NOT IN '
+            '(SELECT host FROM sections WHERE key = ?) ORDER BY host',
+            (search_key,))]
+        print('Hosts without the key: {}'.format(missing_key))
+
+    def add_host(self, update_dict):
+        """Add a new host to the store."""
+        self.pending.update(update_dict)
+
+    def save_dict(self):
+        """Replace the rows of all added hosts in one transaction.
+
+        A current value index gets only the added hosts, a missing or
+        stale one is rebuilt from all rows.
+        """
+        # loaded before the db file changes, which makes it stale
+        values = ValueIndex.load(self.json_file) if self.value_index else None
+        with self.conn:
+            for hostname, host_dict in self.pending.items():
+                self.conn.execute(
+                    'INSERT OR IGNORE INTO hosts (host) VALUES (?)',
+                    (hostname,))
+                self.conn.execute(
+                    'DELETE FROM sections WHERE host = ?', (hostname,))
+                self.conn.executemany(
+                    'INSERT INTO sections (host, key, value) '
+                    'VALUES (?, ?, ?)',
+                    [(hostname, key, json.dumps(value, sort_keys=True,
+                                                indent=4))
+                     for key, value in host_dict.items()])
+        if self.value_index:
+            if values is None:
+                values = ValueIndex.build(self._iter_hosts())
+            else:
+                for hostname, host_dict in self.pending.items():
+                    values.add(hostname, host_dict)
+            values.save(self.json_file)
+        self.pending = {}
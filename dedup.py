@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Store sections shared by many hosts once, addressed by their hash.
+
+A deduplicated database looks like
+    {"__dedup__": 1,
+     "blobs": {"<sha1>": <section>, ...},
+     "hosts": {"<host>": {"packages": {"$blob": "<sha1>"}, "comment": ""}}}
+Every non-empty dict or list section is replaced by a reference to its
+blob, scalars and empty sections stay in the host. The blob address is
+the sha1 of the canonical (sorted, compact) JSON of the section.
+"""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-30
+
+import json
+import hashlib
+from formats import decode
+
+DEDUP_KEY = '__dedup__'
+DEDUP_VERSION = 1
+BLOB_KEY = '$blob'
+COMPACT_SEPARATORS = (',', ':')
+
+
+def section_hash(value):
+    """Return the content address of a section."""
+    return hashlib.sha1(json.dumps(
+        value, sort_keys=True, separators=COMPACT_SEPARATORS).encode(
+            'utf-8')).hexdigest()
+
+
+def is_deduplicated(document):
+    """Tell a deduplicated database from a dict of host documents."""
+    return isinstance(document, dict) and DEDUP_KEY in document
+
+
+def deduplicate(hosts):
+    """Return the deduplicated layout of a dict of host documents.
+
+    The canonical JSON is only built once per distinct section. Sections
+    are first grouped by their unsorted JSON, which the C encoder builds
+    fast, and by identity for sections already shared after expand().
+    """
+    blobs = {}
+    by_id = {}
+    by_text = {}
+    layout = {}
+    for hostname, document in hosts.items():
+        if not isinstance(document, dict):
+            layout[hostname] = document
+            continue
+        refs = {}
+        for section, value in document.items():
+            if not isinstance(value, (dict, list)) or not value:
+                refs[section] = value
+                continue
+            address = by_id.get(id(value))
+            if address is None:
+                text = json.dumps(value, separators=COMPACT_SEPARATORS)
+                address = by_text.get(text)
+                if address is None:
+                    address = by_text[text] = section_hash(value)
+                    blobs[address] = value
+                by_id[id(value)] = address
+            refs[section] = {BLOB_KEY: address}
+        layout[hostname] = refs
+    return {DEDUP_KEY: DEDUP_VERSION, 'blobs': blobs, 'hosts': layout}
+
+
+def expand(document):
+    """Return the host documents of a deduplicated database.
+
+    Hosts referencing the same blob share one object, so a section is
+    held in memory only once. Other documents are returned unchanged.
+    """
+    if not is_deduplicated(document):
+        return document
+    if document[DEDUP_KEY] != DEDUP_VERSION:
+        raise ValueError('unknown deduplicated layout {}'.format(
+            document[DEDUP_KEY]))
+    blobs = document['blobs']
+    hosts = {}
+    for hostname, refs in document['hosts'].items():
+        if not isinstance(refs, dict):
+            hosts[hostname] = refs
+            continue
+        hosts[hostname] = dict(
+            (section, blobs[value[BLOB_KEY]]
+             if isinstance(value, dict) and BLOB_KEY in value else value)
+            for section, value in refs.items())
+    return hosts
+
+
+def decode_expanded(data):
+    """Decode a file like formats.decode and expand it."""
+    return expand(decode(data))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Run the collector on many hosts at the same time."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-29
+
+import os
+import sys
+import time
+import shlex
+import signal
+import logging
+import threading
+import subprocess
+import collections
+from multiprocessing.pool import ThreadPool
+from formats import decode
+
+# collects the sections of inventory.py -c and writes them to stdout
+REMOTE_COMMAND = ('collectMetadata.py --input_path - --format json-compact '
+                  '--sections inventory')
+LOCAL_COMMAND = [
+    sys.executable,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 'collectMetadata.py'),
+    '--input_path', '-', '--format', 'json-compact', '--sections',
+    'inventory']
+SSH_OPTIONS = ['-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10']
+
+# host is the name of the hosts file, hostname the one the collector reported
+HostResult = collections.namedtuple(
+    'HostResult', 'host hostname document error latency attempts')
+
+
+class TransportError(Exception):
+    """Raised when the collector could not be run on a host."""
+
+
+class Transport(object):
+    """Runs a command for a host and returns its stdout."""
+
+    def argv(self, hostname):
+        raise NotImplementedError
+
+    def run(self, hostname, timeout):
+        """Return the stdout of the command for hostname.
+
+        The command runs in its own process group, which is killed
+        after timeout seconds with all children still holding the pipes.
+        Raises TransportError on a timeout or a non-zero exit status.
+        """
+        with open(os.devnull) as devnull:
+            proc = subprocess.Popen(
+                self.argv(hostname), stdin=devnull, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, close_fds=True,
+                preexec_fn=os.setpgrp)
+        killed = []
+
+        def kill():
+            killed.append(True)
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            out, err = proc.communicate()
+        finally:
+            timer.cancel()
+        if killed:
+            raise TransportError('timed out after {}s'.format(timeout))
+        if proc.returncode:
+            lines = err.decode('utf-8', 'replace').strip().splitlines()
+            raise TransportError('exit status {}: {}'.format(
+                proc.returncode, lines[-1] if lines else ''))
+        return out
+
+
+class SshTransport(Transport):
+    """Runs the collector on the host through ssh."""
+
+    name = 'ssh'
+
+    def __init__(self, command=None, options=None):
+        """Class init, command is the remote shell command."""
+        self.command = command or REMOTE_COMMAND
+        self.options = SSH_OPTIONS if options is None else options
+
+    def argv(self, hostname):
+        return ['ssh'] + self.options + [hostname, self.command]
+
+
+class LocalTransport(Transport):
+    """Runs the command on this machine, {host} is replaced by the host.
+
+    Used to test a fleet collection without remote hosts.
+    """
+
+    name = 'local'
+
+    def __init__(self, command=None):
+        """Class init, command is a shell like string or a list."""
+        if command and not isinstance(command, list):
+            command = shlex.split(str(command))
+        self.command = command or LOCAL_COMMAND
+
+    def argv(self, hostname):
+        return [arg.replace('{host}', hostname) for arg in self.command]
+
+
+TRANSPORTS = {
+    SshTransport.name: SshTransport,
+    LocalTransport.name: LocalTransport,
+}
+
+
+def read_hosts(file_path):
+    """Return the host names of a file, one per line, # starts a comment.
+
+    Hosts listed more than once are only returned the first time.
+    """
+    fp = sys.stdin if file_path == '-' else open(file_path)
+    try:
+        hosts = [line.split('#')[0].strip() for line in fp]
+    finally:
+        if fp is not sys.stdin:
+            fp.close()
+    seen = set()
+    unique = []
+    for host in hosts:
+        if host and host not in seen:
+            seen.add(host)
+            unique.append(host)
+    return unique
+
+
+class FleetCollector(object):
+    """Collects many hosts through a transport with a bounded concurrency.
+
+    Every host gets its own deadline and is retried after a failure,
+    results are yielded as soon as a host is done.
+    """
+
+    def __init__(self, transport, concurrency=16, timeout=120, retries=1,
+                 retry_delay=1.0):
+        """Class init.
+
+        transport       Transport running the collector for a host
+        concurrency     number of hosts collected at the same time
+        timeout         seconds one attempt on a host may take
+        retries         attempts after the first failed one
+        retry_delay     seconds before the first retry, doubled after each
+        """
+        self.logger = self._get_logger()
+        self.transport = transport
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def _get_logger(self):
+        """Setup the global logger."""
+        logger = logging.getLogger(__name__)
+
+        logger.setLevel(logging.INFO)
+        # create console handler with a higher log level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        # create formatter and add it to the handlers
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch.setFormatter(formatter)
+        # add the handlers to the logger
+        logger.addHandler(ch)
+        logger.debug('Logger setup complete. Start Program ... ')
+        return logger
+
+    def _attempt(self, hostname):
+        """Run the collector once, return (reported host name, document)."""
+        try:
+            document = decode(self.transport.run(hostname, self.timeout))
+        except ValueError as e:
+            raise TransportError('invalid output: {}'.format(e))
+        if not isinstance(document, dict) or len(document) != 1:
+            raise TransportError('output is not the document of one host')
+        return list(document.items())[0]
+
+    def collect_host(self, hostname):
+        """Collect one host, return its HostResult."""
+        start = time.time()
+        delay = self.retry_delay
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                reported, document = self._attempt(hostname)
+            except (TransportError, OSError) as e:
+                if attempts > self.retries:
+                    return HostResult(hostname, None, None, str(e),
+                                      time.time() - start, attempts)
+                self.logger.debug('{} attempt {} failed: {}'.format(
+                    hostname, attempts, e))
+                time.sleep(delay)
+                delay *= 2
+                continue
+            return HostResult(hostname, reported, document, None,
+                              time.time() - start, attempts)
+
+    def collect(self, hosts):
+        """Yield the HostResult of every host in the order they finish."""
+        pool = ThreadPool(min(self.concurrency, len(hosts) or 1))
+        try:
+            for number, result in enumerate(pool.imap_unordered(
+                    self.collect_host, hosts), 1):
+                if result.error is None:
+                    self.logger.info('[{}/{}] {} done in {:.2f}s'.format(
+                        number, len(hosts), result.host, result.latency))
+                else:
+                    self.logger.warning(
+                        '[{}/{}] {} failed after {} attempt(s): {}'.format(
+                            number, len(hosts), result.host,
+                            result.attempts, result.error))
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def fleet_stats(results):
+    """Summarize HostResults: counts, latency percentiles and failures."""
+    latencies = sorted(r.latency for r in results if r.error is None)
+    stats = {
+        'hosts': len(results),
+        'ok': len(latencies),
+        'failed': dict((r.host, r.error) for r in results if r.error),
+        'retried': sorted(r.host for r in results if r.attempts > 1),
+        'host_latency': dict((r.host, round(r.latency, 3)) for r in results),
+    }
+    if latencies:
+        stats['latency'] = {
+            'min': round(latencies[0], 3),
+            'median': round(_percentile(latencies, 0.5), 3),
+            'p95': round(_percentile(latencies, 0.95), 3),
+            'max': round(latencies[-1], 3),
+        }
+    return stats
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Compare host documents by the hashes of their subtrees."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-22
+
+CHANGED, ADDED, REMOVED = 'changed', 'added', 'removed'
+CONTAINERS = frozenset([dict, list])
+
+
+def freeze(value):
+    """Return a hashable copy of a JSON value.
+
+    Dicts become frozensets of items and lists tuples, so hash() of the
+    result combines the hashes of all subtrees. Containers holding only
+    scalars, like the package list, are frozen without walking them in
+    python.
+    """
+    if isinstance(value, dict):
+        if CONTAINERS.isdisjoint(map(type, value.values())):
+            return frozenset(value.items())
+        return frozenset((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        if CONTAINERS.isdisjoint(map(type, value)):
+            return tuple(value)
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def format_path(path):
+    """Join a path of keys and list indices like packages/libc6."""
+    return '/'.join(str(p) for p in path)
+
+
+class FleetDiff(object):
+    """Compares hosts against a reference host.
+
+    Every section of a host is frozen and hashed once. Hosts with equal
+    sections fall into the same class, found by the hash and confirmed
+    by comparing with the first host of the class. The differing paths
+    are found by descending only into subtrees that are not equal to the
+    reference, equal subtrees are skipped by one comparison in C.
+    """
+
+    def __init__(self, reference, sections=None):
+        """Class init.
+
+        reference   document of the reference host
+        sections    sections to compare, if None all sections of all hosts
+                    but the ones starting with _ like _collection_stats
+        """
+        self.reference = reference
+        self.sections = sections
+        # section to [(frozen value, [host names])]
+        self.classes = {}
+        self._buckets = {}
+        self.hosts = []
+
+    def _classify(self, section, hostname, value):
+        """Add hostname to the class of its value of section."""
+        frozen = freeze(value)
+        classes = self.classes.setdefault(section, [])
+        bucket = self._buckets.setdefault(section, {}).setdefault(
+            hash(frozen), [])
+        for index in bucket:
+            if classes[index][0] == frozen:
+                classes[index][1].append(hostname)
+                return
+        bucket.append(len(classes))
+        classes.append((frozen, [hostname]))
+
+    def _diff(self, path, ref, other):
+        """Yield (path, kind) of the differences below path."""
+        if ref == other:
+            return
+        if isinstance(ref, dict) and isinstance(other, dict):
+            for key in sorted(set(ref) | set(other)):
+                if key not in other:
+                    yield path + (key,), REMOVED
+                elif key not in ref:
+                    yield path + (key,), ADDED
+                else:
+                    for found in self._diff(
+                            path + (key,), ref[key], other[key]):
+                        yield found
+        elif (isinstance(ref, list) and isinstance(other, list) and
+                len(ref) == len(other)):
+            for index, (ref_item, item) in enumerate(zip(ref, other)):
+                for found in self._diff(path + (index,), ref_item, item):
+                    yield found
+        else:
+            yield path, CHANGED
+
+    def compare(self, hostname, document):
+        """Classify the sections of a host, return its differing paths."""
+        self.hosts.append(hostname)
+        sections = self.sections or sorted(
+            s for s in set(self.reference) | set(document)
+            if not s.startswith('_'))
+        differences = []
+        for section in sections:
+            if section not in document:
+                if section in self.reference:
+                    differences.append(((section,), REMOVED))
+                continue
+            value = document[section]
+            self._classify(section, hostname, value)
+            if section not in self.reference:
+                differences.append(((section,), ADDED))
+            else:
+                differences.extend(self._diff(
+                    (section,), self.reference[section], value))
+        return differences
+
+    def section_classes(self):
+        """Return [(section, [(kind, hosts)])] of every compared section.
+
+        kind is 'reference' for the class of the reference host, which
+        comes first, 'other' for the other classes by size and 'missing'
+        for the hosts without the section.
+        """
+        result = []
+        for section in sorted(self.classes):
+            ref = freeze(self.reference[section]) \
+                if section in self.reference else None
+            classes = [
+                ('reference' if section in self.reference and frozen == ref
+                 else 'other', hosts)
+                for frozen, hosts in self.classes[section]]
+            classes.sort(key=lambda item: (item[0] != 'reference',
+                                           -len(item[1])))
+            listed = set(h for _, hosts in classes for h in hosts)
+            missing = [h for h in self.hosts if h not in listed]
+            if missing:
+                classes.append(('missing', missing))
+            result.append((section, classes))
+        return result
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Generate synthetic host documents shaped like the collector output.
+
+Hosts fall into variants (hardware and software classes) sharing cpu,
+packages, mounts and most of the environment, like a homogeneous fleet.
+A small share of the hosts drifts from its variant. Every host is built
+from its own seeded random generator, so document i is always the same.
+"""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-31
+
+import os
+import random
+import datetime
+from formats import SUFFIXES, encode
+
+CPU_MODELS = [
+    ('Intel(R) Xeon(R) CPU E5-2630 v3 @ 2.40GHz', 16, '2.4000 GHz', 63),
+    ('Intel(R) Xeon(R) CPU E5-2680 v4 @ 2.40GHz', 28, '2.4000 GHz', 79),
+    ('Intel(R) Xeon(R) Gold 6138 CPU @ 2.00GHz', 40, '2.0000 GHz', 85),
+    ('AMD Opteron(tm) Processor 6276', 32, '2.3000 GHz', 1),
+]
+CPU_FLAGS = ('fpu vme de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov '
+             'pat pse36 clflush dts acpi mmx fxsr sse sse2 ss ht tm pbe '
+             'syscall nx pdpe1gb rdtscp lm constant_tsc arch_perfmon pebs '
+             'bts rep_good nopl xtopology nonstop_tsc aperfmperf eagerfpu '
+             'pni pclmulqdq dtes64 monitor ds_cpl vmx smx est tm2 ssse3 fma '
+             'cx16 xtpr pdcm pcid dca sse4_1 sse4_2 x2apic movbe popcnt '
+             'aes xsave avx f16c rdrand lahf_lm abm').split()
+PACKAGE_WORDS = ('lib', 'python', 'perl', 'x11', 'gnome', 'openmpi', 'gcc',
+                 'linux', 'ssl', 'xml', 'gtk', 'qt', 'boost', 'fonts')
+PROCESS_NAMES = ('systemd', 'kthreadd', 'ksoftirqd', 'kworker', 'rcu_sched',
+                 'sshd', 'bash', 'pbs_mom', 'munged', 'ntpd', 'rsyslogd',
+                 'qemu-system-x86', 'libvirtd', 'slurmd', 'orted', 'python')
+# share of the hosts with a package differing from their variant
+DRIFT_SHARE = 0.02
+BASE_TIME = 1494576000.0
+
+
+def _packages(variant, count):
+    """Return the packages of a variant, most versions are fleet wide."""
+    packages = {}
+    for p in range(count):
+        name = '{}{}-{}'.format(
+            PACKAGE_WORDS[p % len(PACKAGE_WORDS)], p // len(PACKAGE_WORDS),
+            'dev' if p % 5 == 0 else 'common')
+        # one package in twenty has a version per variant
+        release = variant if p % 20 == 0 else 0
+        packages[name] = '{}.{}.{}-{}ubuntu{}'.format(
+            p % 7, p % 13, p % 4, release, 1 + p % 3)
+    return packages
+
+
+def _cpu(variant):
+    brand, count, hz, model = CPU_MODELS[variant % len(CPU_MODELS)]
+    return {
+        'arch': 'X86_64',
+        'bits': 64,
+        'brand': brand,
+        'count': count,
+        'cpuinfo_version': [3, 3, 0],
+        'family': 6,
+        'flags': list(CPU_FLAGS),
+        'hz_advertised': hz,
+        'hz_advertised_raw': [int(float(hz.split()[0]) * 1e9), 0],
+        'l2_cache_size': '256 KB',
+        'model': model,
+        'raw_arch_string': 'x86_64',
+        'stepping': 2,
+        'vendor_id': 'AuthenticAMD' if 'AMD' in brand else 'GenuineIntel',
+    }
+
+
+def _mounts(variant):
+    mounts = [
+        ['/dev/sda1', '/', 'ext4',
+         'rw,relatime,errors=remount-ro,data=ordered'],
+        ['/dev/sda2', '/var', 'ext4', 'rw,relatime,data=ordered'],
+        ['/dev/sdb1', '/scratch', 'xfs', 'rw,noatime,attr2,inode64,noquota'],
+        ['nfs01:/home', '/home', 'nfs4',
+         'rw,relatime,vers=4.0,rsize=1048576,wsize=1048576,hard,proto=tcp'],
+        ['nfs02:/opt/software', '/opt/software', 'nfs4',
+         'ro,relatime,vers=4.0,rsize=1048576,wsize=1048576,hard,proto=tcp'],
+    ]
+    if variant % 2:
+        mounts.append(['lustre01@o2ib:/work', '/lustre/work', 'lustre',
+                       'rw,flock,lazystatfs'])
+    return mounts
+
+
+def _users(count):
+    users = {'root': ['root']}
+    for u in range(count):
+        users['user{:04d}'.format(u)] = [
+            'users', 'project{}'.format(u % 17)] + (
+                ['admins'] if u % 50 == 0 else [])
+    return users
+
+
+def _env(variant, hostname, address):
+    env = dict(
+        ('MODULE_{}'.format(e), '/opt/software/modules/tool{}/{}'.format(
+            e, variant)) for e in range(40))
+    env.update({
+        'HOME': '/root',
+        'LANG': 'en_US.UTF-8',
+        'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:'
+                '/bin:/opt/software/bin',
+        'SHELL': '/bin/bash',
+        'HOSTNAME': hostname,
+        'SSH_CONNECTION': '10.0.0.1 51234 {} 22'.format(address),
+    })
+    return env
+
+
+class FleetGenerator(object):
+    """Builds the documents of a synthetic fleet host by host."""
+
+    def __init__(self, packages=1500, processes=300, users=200, variants=4,
+                 seed=0):
+        """Class init.
+
+        packages    installed packages per host
+        processes   running processes per host
+        users       users known on every host
+        variants    hardware and software classes of the fleet
+        seed        changes every generated value
+        """
+        self.packages = packages
+        self.processes = processes
+        self.seed = seed
+        self.variants = max(1, variants)
+        # sections shared by all hosts of a variant are built once
+        self._shared = [{
+            'cpu': _cpu(v),
+            'packages': _packages(v, packages),
+            'mounts': _mounts(v),
+        } for v in range(self.variants)]
+        self._users = _users(users)
+
+    def hostname(self, i):
+        return 'node{:05d}'.format(i)
+
+    def document(self, i):
+        """Return (host name, document) of host i.
+
+        Sections shared by a variant are the same objects in all its
+        documents, encode them before measuring memory.
+        """
+        rnd = random.Random(self.seed * 1000003 + i)
+        variant = i % self.variants
+        shared = self._shared[variant]
+        hostname = self.hostname(i)
+        address = '10.{}.{}.{}'.format(i >> 16, (i >> 8) & 255, i & 255)
+        mac = '52:54:00:{:02x}:{:02x}:{:02x}'.format(
+            i >> 16, (i >> 8) & 255, i & 255)
+        when = BASE_TIME + i * 0.37 + rnd.random()
+
+        packages = shared['packages']
+        if rnd.random() < DRIFT_SHARE and packages:
+            packages = dict(packages)
+            name = rnd.choice(sorted(packages))
+            packages[name] = packages[name].replace('ubuntu', 'hpc')
+
+        pids = sorted(rnd.sample(range(1, 32768), self.processes))
+        vms = {'inactive_vms': [], 'active_vms': {}}
+        if variant == 0:
+            for n in range(rnd.randint(0, 4)):
+                vms['active_vms']['vm-{}-{}'.format(i, n)] = {
+                    'os_type': 'hvm',
+                    'id': n + 1,
+                    'infos': {
+                        'state': 1,
+                        'max_memory': 4194304,
+                        'memory': 4194304,
+                        'nb_virt_cpu': 2,
+                        'cpu_time': rnd.randint(10 ** 9, 10 ** 13),
+                    },
+                }
+            vms['inactive_vms'] = ['template-{}'.format(n)
+                                   for n in range(rnd.randint(0, 2))]
+        moment = {
+            'date': str(datetime.datetime.fromtimestamp(when)),
+            'time_stamp': when,
+        }
+        document = {
+            'network': {
+                'ip_v4_gateways': {
+                    'default': {'2': ['10.0.0.1', 'eth0']},
+                    '2': [['10.0.0.1', 'eth0', True]],
+                },
+                'lo': {
+                    '2': [{'addr': '127.0.0.1', 'netmask': '255.0.0.0',
+                           'peer': '127.0.0.1'}],
+                    '10': [{'addr': '::1', 'netmask':
+                            'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128'}],
+                    '17': [{'addr': '00:00:00:00:00:00',
+                            'peer': '00:00:00:00:00:00'}],
+                },
+                'eth0': {
+                    '2': [{'addr': address, 'broadcast': '10.255.255.255',
+                           'netmask': '255.0.0.0'}],
+                    '17': [{'addr': mac, 'broadcast': 'ff:ff:ff:ff:ff:ff'}],
+                },
+            },
+            'vms': vms,
+            'users': self._users,
+            'mounts': shared['mounts'],
+            'collection_time': moment,
+            'storage': {'get_info': []},
+            'comment': '',
+            'env': _env(variant, hostname, address),
+            'packages': packages,
+            'processes': [{'pid': pid, 'name': rnd.choice(PROCESS_NAMES)}
+                          for pid in pids],
+            'time': moment,
+            'cpu': shared['cpu'],
+            'mpi': {'path': '/usr/bin/mpirun\n',
+                    'version': 'mpirun (Open MPI) 1.10.{}'.format(variant)},
+            'vTorque': 'v0.3-{}-g5f3e2a1'.format(variant),
+        }
+        return hostname, document
+
+    def hosts(self, count):
+        """Yield (host name, document) of hosts 0 to count - 1."""
+        for i in range(count):
+            yield self.document(i)
+
+    def write_files(self, node_dir, count, fmt='json-compact'):
+        """Write one node file per host like collectMetadata.py does."""
+        if not os.path.isdir(node_dir):
+            os.makedirs(node_dir)
+        for hostname, document in self.hosts(count):
+            path = os.path.join(node_dir, hostname + SUFFIXES[fmt])
+            with open(path, 'wb') as fp:
+                fp.write(encode({hostname: document}, fmt))
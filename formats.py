@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Snapshot file formats: plain, compact and compressed JSON, MessagePack."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-16
+
+import io
+import json
+import gzip
+import importlib
+from jsoncodec import loads
+
+# format name to the file name suffix it is written with
+SUFFIXES = {
+    'json': '.json',
+    'json-compact': '.json',
+    'gzip': '.json.gz',
+    'zstd': '.json.zst',
+    'msgpack': '.msgpack',
+}
+FORMATS = sorted(SUFFIXES)
+# suffixes of the files the readers pick up in a directory
+READ_SUFFIXES = ('.json', '.json.gz', '.json.zst', '.msgpack')
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+COMPACT_SEPARATORS = (',', ':')
+
+
+def _optional(name, fmt):
+    """Import the module an optional format needs."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        raise ValueError('format {} needs the python module {}'.format(
+            fmt, name))
+
+
+def format_for_path(file_path, default='json'):
+    """Guess the format of file_path from its suffix."""
+    if file_path.endswith('.gz'):
+        return 'gzip'
+    if file_path.endswith('.zst'):
+        return 'zstd'
+    if file_path.endswith(('.msgpack', '.mpk')):
+        return 'msgpack'
+    return default
+
+
+def detect_format(data):
+    """Detect the format of encoded data from its first bytes.
+
+    Everything starting like a JSON document is taken as JSON, anything
+    else that is not compressed as MessagePack.
+    """
+    if data.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if data.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    if data[:1] in (b'{', b'[', b'"', b' ', b'\n', b'\r', b'\t') or \
+            not data:
+        return 'json'
+    return 'msgpack'
+
+
+def _compact(value):
+    return json.dumps(value, sort_keys=True, separators=COMPACT_SEPARATORS)
+
+
+def encode(value, fmt='json'):
+    """Return value encoded in fmt as bytes."""
+    if fmt == 'json':
+        text = json.dumps(value, sort_keys=True, indent=4)
+    elif fmt in ('json-compact', 'gzip', 'zstd'):
+        text = _compact(value)
+    elif fmt == 'msgpack':
+        return _optional('msgpack', fmt).packb(value, use_bin_type=True)
+    else:
+        raise ValueError('unknown format {}, use one of {}'.format(
+            fmt, ', '.join(FORMATS)))
+    data = text.encode('utf-8')
+    if fmt == 'gzip':
+        buf = io.BytesIO()
+        # mtime=0 keeps the output reproducible
+        with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as fp:
+            fp.write(data)
+        return buf.getvalue()
+    if fmt == 'zstd':
+        return _optional('zstandard', fmt).ZstdCompressor().compress(data)
+    return data
+
+
+def decode(data):
+    """Decode bytes written by encode, in whatever format they are."""
+    fmt = detect_format(data)
+    if fmt == 'gzip':
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as fp:
+            data = fp.read()
+    elif fmt == 'zstd':
+        # frames written by the streaming API have no content size
+        decompressor = _optional('zstandard', fmt).ZstdDecompressor()
+        data = decompressor.decompressobj().decompress(data)
+    elif fmt == 'msgpack':
+        return _optional('msgpack', fmt).unpackb(data, raw=False)
+    return loads(data)
+
+
+def load_path(file_path):
+    """Read and decode the file at file_path."""
+    with open(file_path, 'rb') as fp:
+        return decode(fp.read())
+
+
+def dump_path(value, file_path, fmt='json'):
+    """Encode value in fmt and write it to file_path."""
+    data = encode(value, fmt)
+    with open(file_path, 'wb') as fp:
+        fp.write(data)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Append-only history of the snapshots of every host."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-18
+
+import os
+import json
+import time
+import fcntl
+import datetime
+from database import write_atomic
+try:
+    from urllib import quote, unquote
+except ImportError:
+    from urllib.parse import quote, unquote
+
+HEAD_FILE = 'head.json'
+LOG_FILE = 'log.jsonl'
+LOCK_FILE = 'lock'
+CHECKPOINT_PREFIX = 'checkpoint-'
+SEGMENT_PREFIX = 'segment-'
+# log records folded into a checkpoint at once
+COMPACT_EVERY = 100
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S',
+                '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def parse_time(value):
+    """Parse seconds since the epoch or a local date like 2017-05-18 10:00."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for time_format in TIME_FORMATS:
+        try:
+            moment = datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        return time.mktime(moment.timetuple()) + moment.microsecond / 1e6
+    raise ValueError('can not parse time {}'.format(value))
+
+
+def _stamp(when):
+    """File name part of a time, sorts like the time itself."""
+    return '{:020d}'.format(int(round(when * 1e6)))
+
+
+def _delta(old, new):
+    """Return the sections of new that differ from old and the removed."""
+    changed = dict((k, v) for k, v in new.items() if old.get(k) != v)
+    removed = sorted(k for k in old if k not in new)
+    return changed, removed
+
+
+def _apply(state, record):
+    state.update(record['set'])
+    for section in record['unset']:
+        state.pop(section, None)
+
+
+class HistoryStore(object):
+    """Keeps every snapshot of every host, as deltas and full states.
+
+    Layout of the history directory, one directory per host:
+    <host>/head.json                latest state and number of log records
+    <host>/log.jsonl                deltas since the latest checkpoint
+    <host>/checkpoint-<time>.json   full state at time
+    <host>/segment-<time>.jsonl     compacted deltas, starting at time
+    A delta record is {"time": t, "set": {section: value}, "unset": [..]},
+    deltas are only kept in the log and the segments. Every COMPACT_EVERY
+    records the log is closed as segment and the full state at its last
+    record is written as checkpoint. Queries start at the
+    checkpoint before the asked time and stream the deltas after it, so
+    only one state is held in memory.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        """Class init."""
+        self.path = path
+        self.compact_every = compact_every
+
+    def _host_dir(self, hostname):
+        return os.path.join(self.path, quote(hostname, safe=''))
+
+    def hosts(self):
+        """Return the names of the hosts with a history."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(unquote(d) for d in os.listdir(self.path)
+                      if os.path.isdir(os.path.join(self.path, d)))
+
+    def _read_head(self, host_dir):
+        try:
+            with open(os.path.join(host_dir, HEAD_FILE)) as fp:
+                return json.load(fp)
+        except IOError:
+            return {'time': None, 'state': {}, 'log_records': 0}
+
+    def append(self, hostname, document, when=None):
+        """Record document as state of hostname at when (default now).
+
+        Only the sections that changed are written. Returns False if
+        nothing changed. A when not after the latest record raises
+        ValueError, but without when the time is moved just after it, so
+        a clock step or two runs at the same time lose no snapshot.
+        """
+        clamp = when is None
+        when = time.time() if when is None else when
+        host_dir = self._host_dir(hostname)
+        if not os.path.isdir(host_dir):
+            os.makedirs(host_dir)
+        with open(os.path.join(host_dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            head = self._read_head(host_dir)
+            if clamp and head['time'] is not None and when <= head['time']:
+                when = head['time'] + 1e-6
+            if head['time'] is not None and when <= head['time']:
+                raise ValueError('history of {} already has {}'.format(
+                    hostname, head['time']))
+            changed, removed = _delta(head['state'], document)
+            if not changed and not removed:
+                return False
+            record = {'time': when, 'set': changed, 'unset': removed}
+            with open(os.path.join(host_dir, LOG_FILE), 'a') as fp:
+                fp.write(json.dumps(record, sort_keys=True))
+                fp.write('\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+            _apply(head['state'], record)
+            head['time'] = when
+            head['log_records'] += 1
+            if head['log_records'] >= self.compact_every:
+                self._compact(host_dir, head)
+            write_atomic(os.path.join(host_dir, HEAD_FILE), head,
+                         sort_keys=True)
+        return True
+
+    def _compact(self, host_dir, head):
+        """Close the log as segment and checkpoint the head state."""
+        log_path = os.path.join(host_dir, LOG_FILE)
+        with open(log_path) as fp:
+            first = json.loads(fp.readline())['time']
+        write_atomic(os.path.join(
+            host_dir, CHECKPOINT_PREFIX + _stamp(head['time']) + '.json'),
+            {'time': head['time'], 'state': head['state']}, sort_keys=True)
+        os.rename(log_path, os.path.join(
+            host_dir, SEGMENT_PREFIX + _stamp(first) + '.jsonl'))
+        head['log_records'] = 0
+
+    def compact(self, hostname):
+        """Checkpoint hostname now, whatever the size of its log."""
+        host_dir = self._host_dir(hostname)
+        with open(os.path.join(host_dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            head = self._read_head(host_dir)
+            if head['log_records']:
+                self._compact(host_dir, head)
+                write_atomic(os.path.join(host_dir, HEAD_FILE), head,
+                             sort_keys=True)
+
+    def _files(self, host_dir, prefix):
+        """Return (time stamp, path) of the files with prefix, oldest first."""
+        try:
+            names = os.listdir(host_dir)
+        except OSError:
+            raise KeyError('no history for {}'.format(host_dir))
+        return sorted((n[len(prefix):].split('.')[0],
+                       os.path.join(host_dir, n))
+                      for n in names if n.startswith(prefix))
+
+    def _checkpoint_before(self, host_dir, when):
+        """Return (time, state) of the last checkpoint at or before when."""
+        stamp = _stamp(when)
+        for cp_stamp, cp_path in reversed(self._files(
+                host_dir, CHECKPOINT_PREFIX)):
+            if cp_stamp <= stamp:
+                with open(cp_path) as fp:
+                    checkpoint = json.load(fp)
+                return checkpoint['time'], checkpoint['state']
+        return None, {}
+
+    def _iter_records(self, host_dir, after):
+        """Stream the delta records newer than after, oldest first."""
+        paths = self._files(host_dir, SEGMENT_PREFIX)
+        if after is not None:
+            stamp = _stamp(after)
+            # skip segments that end before the next one starts after
+            paths = [p for i, p in enumerate(paths)
+                     if i + 1 == len(paths) or paths[i + 1][0] > stamp]
+        paths = [p for _, p in paths]
+        paths.append(os.path.join(host_dir, LOG_FILE))
+        for path in paths:
+            try:
+                fp = open(path)
+            except IOError:
+                continue
+            with fp:
+                for line in fp:
+                    record = json.loads(line)
+                    if after is None or record['time'] > after:
+                        yield record
+
+    def state_at(self, hostname, when):
+        """Return the document of hostname as it was at when."""
+        host_dir = self._host_dir(hostname)
+        cp_time, state = self._checkpoint_before(host_dir, when)
+        for record in self._iter_records(host_dir, cp_time):
+            if record['time'] > when:
+                break
+            _apply(state, record)
+        return state
+
+    def value_at(self, hostname, key, when):
+        """Return section key of hostname at when, KeyError if missing."""
+        return self.state_at(hostname, when)[key]
+
+    def changes_since(self, hostname, key, since):
+        """Yield (time, value) of every change of section key after since.
+
+        value is None if the section was removed.
+        """
+        for record in self._iter_records(self._host_dir(hostname), since):
+            if key in record['set']:
+                yield record['time'], record['set'][key]
+            elif key in record['unset']:
+                yield record['time'], None
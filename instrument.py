@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Measure probes: wall and cpu time, peak RSS growth, subprocesses."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-01
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import resource
+import tempfile
+import threading
+import subprocess
+
+STATS_SECTION = '_collection_stats'
+# cpu time of the calling thread, python 2 lacks the constant
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD',
+                        1 if sys.platform.startswith('linux')
+                        else resource.RUSAGE_SELF)
+PROMETHEUS_SUFFIX = '.prom'
+# (metric, stats key, help) written to prometheus metrics files
+PROMETHEUS_METRICS = [
+    ('nmc_probe_wall_seconds', 'wall_s', 'Wall time of the probe.'),
+    ('nmc_probe_cpu_seconds', 'cpu_s', 'CPU time of the probe thread.'),
+    ('nmc_probe_max_rss_delta_kilobytes', 'max_rss_delta_kb',
+     'Growth of the peak RSS while the probe ran.'),
+    ('nmc_probe_subprocesses', 'subprocesses',
+     'Processes the probe started.'),
+    ('nmc_probe_process_children_cpu_seconds', 'process_children_cpu_s',
+     'CPU time of all subprocesses of the collector that finished while '
+     'the probe ran.'),
+]
+
+_local = threading.local()
+
+
+def thread_cpu_seconds():
+    """Return the cpu time the calling thread used so far."""
+    usage = resource.getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def count_spawn(count=1):
+    """Count processes started by the probe measured in this thread.
+
+    Probes call it, or check_output, for every process they start. The
+    stdlib is left alone, so processes started by other modules are not
+    counted.
+    """
+    if getattr(_local, 'spawns', None) is not None:
+        _local.spawns += count
+
+
+def check_output(args, **kwargs):
+    """Run subprocess.check_output as a counted subprocess of the probe."""
+    count_spawn()
+    return subprocess.check_output(args, **kwargs)
+
+
+def _children_cpu_seconds():
+    """Return the cpu time of all waited for subprocesses so far."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class ProbeMeter(object):
+    """Measures the code run in a with block by the calling thread.
+
+    After the block stats holds wall_s, cpu_s, max_rss_delta_kb,
+    subprocesses and process_children_cpu_s, and profile the cProfile
+    stats if asked for. subprocesses counts the count_spawn calls of the
+    thread. The peak RSS and the cpu time of subprocesses are the ones of
+    the whole process, with probes in threads they are shared.
+    """
+
+    def __init__(self, profile=False):
+        """Class init."""
+        self.profiler = cProfile.Profile() if profile else None
+        self.stats = None
+        self.profile = None
+
+    def __enter__(self):
+        self._wall = time.time()
+        self._cpu = thread_cpu_seconds()
+        self._rss = _max_rss_kb()
+        self._children = _children_cpu_seconds()
+        _local.spawns = 0
+        if self.profiler:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            self.profile = self.profiler.stats
+        self.stats = {
+            'wall_s': round(time.time() - self._wall, 6),
+            'cpu_s': round(thread_cpu_seconds() - self._cpu, 6),
+            'max_rss_delta_kb': _max_rss_kb() - self._rss,
+            'subprocesses': _local.spawns,
+            'process_children_cpu_s': round(
+                _children_cpu_seconds() - self._children, 6),
+        }
+        _local.spawns = None
+        return False
+
+
+def collection_stats(probe_stats, started, wall, scheduler):
+    """Build the _collection_stats section of a collection."""
+    return {
+        'time_stamp': started,
+        'wall_s': round(wall, 6),
+        'pool': scheduler.mode,
+        'workers': scheduler.workers,
+        'probes': probe_stats,
+    }
+
+
+def _write_replacing(file_path, text):
+    """Write text to a temporary file and rename it to file_path."""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(text)
+    os.rename(tmp_path, file_path)
+
+
+def _label(value):
+    return '"{}"'.format(
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+
+
+def prometheus_text(hostname, stats):
+    """Return the stats of a collection in the prometheus text format."""
+    lines = []
+    probes = sorted(stats['probes'].items())
+    for metric, key, help_text in PROMETHEUS_METRICS:
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} gauge'.format(metric))
+        for section, probe_stats in probes:
+            if key in probe_stats:
+                lines.append('{}{{host={},probe={}}} {}'.format(
+                    metric, _label(hostname), _label(section),
+                    probe_stats[key]))
+    lines.append('# HELP nmc_probe_ok 1 if the probe returned a result.')
+    lines.append('# TYPE nmc_probe_ok gauge')
+    for section, probe_stats in probes:
+        lines.append('nmc_probe_ok{{host={},probe={}}} {}'.format(
+            _label(hostname), _label(section),
+            int(probe_stats['status'] == 'ok')))
+    lines.append('# HELP nmc_collection_wall_seconds Wall time of the '
+                 'collection.')
+    lines.append('# TYPE nmc_collection_wall_seconds gauge')
+    lines.append('nmc_collection_wall_seconds{{host={}}} {}'.format(
+        _label(hostname), stats['wall_s']))
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(file_path, hostname, stats):
+    """Write the stats of a collection to a metrics file.
+
+    A .prom file is replaced by the prometheus text format, for the node
+    exporter textfile collector. Any other file gets one JSON line per
+    probe appended.
+    """
+    if file_path.endswith(PROMETHEUS_SUFFIX):
+        _write_replacing(file_path, prometheus_text(hostname, stats))
+        return
+    with open(file_path, 'a') as fp:
+        for section, probe_stats in sorted(stats['probes'].items()):
+            record = dict(probe_stats)
+            record.update({'time': stats['time_stamp'], 'host': hostname,
+                           'probe': section})
+            fp.write(json.dumps(record, sort_keys=True))
+            fp.write('\n')
+
+
+class _Profiled(object):
+    """Profile stats in the shape pstats.Stats loads them from."""
+
+    def __init__(self, stats):
+        """Class init."""
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def write_profile(file_path, profiler, probe_profiles):
+    """Dump the profile of the run merged with the profiles of its probes.
+
+    Probes run in their own threads or processes, which the profiler of
+    the main thread does not see.
+    """
+    combined = pstats.Stats(profiler)
+    for profile in probe_profiles:
+        combined.add(_Profiled(profile))
+    combined.dump_stats(file_path)
@@ -21,10 +21,26 @@
 # @COMPANY: HLRS, University of Stuttgart
 # @Date: 2016-02-23
 
+import os
+import json
+import datetime
+import tempfile
 import click
-from collectMetadata import Collector
-from mergeMetadata import MergeMetadata
-from database import JsonConnector
+from collectMetadata import (INVENTORY_SECTIONS, collector_options,
+                             instrument_options, collect_sections,
+                             inventory_document)
+from mergeMetadata import MergeMetadata, validate_tables
+from database import get_connector, write_offset_index
+from probes import select_sections
+from scheduler import error_marker
+from agent import query_agent
+from formats import FORMATS, format_for_path
+from history import HistoryStore, parse_time
+from query import is_query
+from fleet import TRANSPORTS, FleetCollector, fleet_stats, read_hosts
+from jsonstream import JsonObjectWriter
+from valueindex import ValueIndex
+from columnar import BATCH_ROWS, COLUMN_FORMATS, ColumnarExporter
 
 
 def _inventory_show(je, show, list_keys, host):
@@ -38,6 +54,9 @@ def _inventory_show(je, show, list_keys, host):
         je.get_host_value_to_key(host, show)
     elif list_keys and show:
         je.get_all_host_keys(show)
+    elif show and is_query(show) and not je.has_host(show):
+        # a stored host name like node1.example.com is shown as host
+        je.query_hosts(show)
     elif show:
         print('Data for {}:'.format(show))
         je.get_host_infos(show)
@@ -54,19 +73,59 @@ def _inventory_show(je, show, list_keys, host):
         print('Try --help to see help')
 
 
-def _inventory_collect(je, collect, out_path):
+def _collect_agent(agent, sections):
+    try:
+        document = query_agent(agent)
+    except IOError as e:
+        print(e)
+        exit(1)
+    host, probes = list(document.items())[0]
+    results = {}
+    for section, probe_name in sections:
+        results[section] = probes.get(probe_name, error_marker(
+            section, 'unavailable', 'not collected by the agent'))
+    return host, results
+
+
+def _inventory_history(history, host, show, at, since):
+
+    if not host:
+        print('please provide the host -H [host]')
+        exit(1)
+    try:
+        if since:
+            if not show:
+                print('please provide the section -s [key]')
+                exit(1)
+            changes = history.changes_since(host, show, parse_time(since))
+            print('Changes of {} {} since {}:'.format(host, show, since))
+            for when, value in changes:
+                print('Time: {}'.format(datetime.datetime.fromtimestamp(
+                    when)))
+                print(json.dumps(value, sort_keys=True, indent=4))
+        elif show:
+            value = history.value_at(host, show, parse_time(at))
+            print('Data for {} {} at {}:'.format(host, show, at))
+            print(json.dumps(value, sort_keys=True, indent=4))
+        else:
+            state = history.state_at(host, parse_time(at))
+            print('Data for {} at {}:'.format(host, at))
+            print(json.dumps(state, sort_keys=True, indent=4))
+    except KeyError:
+        print('No history found for: {} at {}'.format(
+            ' '.join([host, show or '']).strip(), at or since))
+        exit(1)
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+
+def _inventory_collect(je, collect, out_path, host, results, history=None):
 
-    host_informations = Collector()
-    host = host_informations.hostname
-    update_dict = {host: {}}
-    update_dict[host]['network'] = host_informations.get_network()
-    update_dict[host]['vms'] = host_informations.get_vms()
-    update_dict[host]['users'] = host_informations.get_users()
-    update_dict[host]['mounts'] = host_informations.get_mounts()
-    update_dict[host]['storage'] = {"get_info": []}
-    update_dict[host]['comment'] = ""
-    update_dict[host]['collection_time'] = host_informations.get_date()
+    update_dict = {host: inventory_document(results)}
 
+    if history:
+        history.append(host, update_dict[host])
     if out_path:
         je.dump_dict(update_dict, out_path)
     else:
@@ -74,14 +133,118 @@ def _inventory_collect(je, collect, out_path):
         je.save_dict()
 
 
-def _inventory_mege(je, merge, out_path):
+def _inventory_fleet(je, hosts_path, out_path, fmt, history, transport,
+                     fleet_command, concurrency, host_timeout, retries):
+
+    if out_path and ((fmt or format_for_path(out_path)) != 'json' or
+                     je.dedup):
+        print('--collect_fleet writes plain json')
+        exit(1)
+    hosts = read_hosts(hosts_path)
+    fleet = FleetCollector(
+        TRANSPORTS[transport](fleet_command), concurrency, host_timeout,
+        retries)
+    results = []
+    # reported host name to the name it was collected through
+    collected = {}
+    writer = offsets = index = None
+    if out_path:
+        # every document goes straight into the output, not into files,
+        # which replaces out_path when all hosts are done
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(out_path)), prefix='.tmp-')
+        fp = os.fdopen(fd, 'w')
+        writer = JsonObjectWriter(fp)
+        offsets = {}
+        index = ValueIndex() if je.value_index else None
+    try:
+        for result in fleet.collect(hosts):
+            results.append(result._replace(document=None))
+            if result.document is None:
+                continue
+            name = result.hostname
+            if name in collected:
+                fleet.logger.warning(
+                    '{} reports the host name {} of {}, skipped'.format(
+                        result.host, name, collected[name]))
+                continue
+            collected[name] = result.host
+            document = inventory_document(result.document)
+            if history:
+                history.append(name, document)
+            if writer:
+                offsets[name] = writer.write(name, document)
+                if index:
+                    index.add(name, document)
+            else:
+                je.add_host({name: document})
+        if writer:
+            writer.close()
+            fp.flush()
+            os.fsync(fp.fileno())
+            fp.close()
+            os.rename(tmp_path, out_path)
+    except BaseException:
+        if writer:
+            fp.close()
+            os.remove(tmp_path)
+        raise
+    if writer:
+        write_offset_index(out_path, offsets)
+        if index:
+            index.save(out_path)
+    else:
+        je.save_dict()
+
+    stats = fleet_stats(results)
+    print(json.dumps(stats, sort_keys=True, indent=4))
+    if stats['failed']:
+        exit(1)
+
+
+def _inventory_columns(je, columns_dir, merge, fmt, tables, batch_rows,
+                       read_threads=1, parse_procs=0):
+    """Flatten the hosts of the db, or of the node files of -m, to tables."""
+    try:
+        exporter = ColumnarExporter(columns_dir, tables, fmt, batch_rows)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    if merge:
+        mm = MergeMetadata()
+        rows = mm.export_columns(merge, exporter, read_threads, parse_procs)
+    else:
+        rows = exporter.add_hosts(je._iter_hosts()).close()
+    print(json.dumps({'hosts': exporter.hosts, 'rows': rows,
+                      'files': exporter.paths}, sort_keys=True, indent=4))
+
+
+def _inventory_mege(je, merge, out_path, stream=False, read_threads=1,
+                    parse_procs=0, incremental=False, fmt=None,
+                    value_index=False, dedup=False):
 
     if not merge:
         print('please provide input path -m [path]')
         exit(1)
+    if (stream or incremental) and \
+            ((fmt or format_for_path(out_path or '')) != 'json' or dedup):
+        print('--stream and --incremental write plain json')
+        exit(1)
 
     mm = MergeMetadata()
-    mm.read_files(merge)
+    mm.format = fmt
+    mm.value_index = value_index
+    mm.dedup = dedup
+    if incremental:
+        mm.incremental_merge(merge, out_path or 'data/merge.json',
+                             read_threads=read_threads,
+                             parse_procs=parse_procs)
+        return
+    if stream:
+        mm.stream_merge(merge, out_path or 'data/merge.json',
+                        read_threads=read_threads, parse_procs=parse_procs)
+        return
+    mm.read_files(merge, read_threads, parse_procs)
     mm.merge_files()
     if out_path:
         mm.save_new_json(out_path)
@@ -103,7 +266,8 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
     '--dbfile',
     default='data/servers.json',
     type=click.Path(),
-    help='Use non default db file')
+    help='Use non default db file, a directory for a sharded db or '
+         'a .sqlite file')
 @click.option(
     '-l',
     '--list_keys',
@@ -114,7 +278,8 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
     '-s',
     '--show',
     type=click.STRING,
-    help='Show content of key')
+    help='Show content of key, or of a query like '
+         '"network.eth0.2[*].addr where cpu.count >= 32"')
 @click.option(
     '-c',
     '--collect',
@@ -131,19 +296,184 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
     '--out_path',
     type=click.STRING,
     help='Path to output file.')
-def main(host, dbfile, list_keys, show, collect, merge, out_path):
+@click.option(
+    '--stream',
+    default=False,
+    is_flag=True,
+    help='Merge one file at a time with bounded memory.')
+@click.option(
+    '--incremental',
+    default=False,
+    is_flag=True,
+    help='Merge only files changed since the last -m into the output.')
+@click.option(
+    '--read_threads',
+    default=1,
+    type=click.INT,
+    help='Threads reading the files of -m.')
+@click.option(
+    '--parse_procs',
+    default=0,
+    type=click.INT,
+    help='Processes parsing the files of -m, 0 for none.')
+@click.option(
+    '--format',
+    'fmt',
+    type=click.Choice(FORMATS),
+    help='Format of written files, by default taken from the suffix.')
+@click.option(
+    '--import',
+    'import_path',
+    type=click.Path(exists=True),
+    help='Add all hosts of a JSON db file to the db.')
+@click.option(
+    '--export',
+    'export_path',
+    type=click.Path(),
+    help='Write the db as JSON db file.')
+@click.option(
+    '--agent',
+    type=click.STRING,
+    help='Take -c data from a running agent (socket path or host:port).')
+@click.option(
+    '--diff',
+    'reference',
+    type=click.STRING,
+    help='Show how all hosts (or their key -s) differ from this host.')
+@click.option(
+    '--history',
+    type=click.Path(),
+    help='History directory, -c adds every collection to it.')
+@click.option(
+    '--at',
+    type=click.STRING,
+    help='With --history: show -H host (-s key) as it was at this time.')
+@click.option(
+    '--since',
+    type=click.STRING,
+    help='With --history: show all changes of -H host -s key since then.')
+@click.option(
+    '--lookup',
+    multiple=True,
+    type=click.STRING,
+    help='List the hosts with section.key=value, section.key or '
+         'section=value, repeat to combine.')
+@click.option(
+    '--value_index',
+    default=False,
+    is_flag=True,
+    help='Write the value index for --lookup when saving or merging.')
+@click.option(
+    '--dedup',
+    default=False,
+    is_flag=True,
+    help='Store sections shared by hosts only once when saving or merging.')
+@click.option(
+    '--collect_fleet',
+    'hosts_path',
+    type=click.Path(),
+    help='Collect all hosts listed in this file (- for stdin), one per '
+         'line, into the db or -o.')
+@click.option(
+    '--transport',
+    default='ssh',
+    type=click.Choice(sorted(TRANSPORTS)),
+    help='Run the collector of --collect_fleet through ssh or locally.')
+@click.option(
+    '--fleet_command',
+    type=click.STRING,
+    help='Command printing the document of a host, {host} is replaced '
+         'for the local transport.')
+@click.option(
+    '--concurrency',
+    default=16,
+    type=click.INT,
+    help='Hosts of --collect_fleet collected at the same time.')
+@click.option(
+    '--host_timeout',
+    default=120,
+    type=click.FLOAT,
+    help='Seconds one attempt to collect a host may take.')
+@click.option(
+    '--retries',
+    default=1,
+    type=click.INT,
+    help='Attempts after a failed one per host.')
+@click.option(
+    '--columns',
+    'columns_dir',
+    type=click.Path(),
+    help='Write the hosts of the db, or of the files of -m, as flat '
+         'tables to this directory.')
+@click.option(
+    '--columns_format',
+    default='csv',
+    type=click.Choice(sorted(COLUMN_FORMATS)),
+    help='Format of the --columns tables, parquet and arrow need pyarrow.')
+@click.option(
+    '--tables',
+    callback=validate_tables,
+    help='Comma separated tables of --columns, e.g. hosts,packages.')
+@click.option(
+    '--batch_rows',
+    default=BATCH_ROWS,
+    type=click.IntRange(1, None),
+    help='Rows of a --columns table written at once.')
+@collector_options
+@instrument_options
+def main(host, dbfile, list_keys, show, collect, merge, out_path, stream,
+         incremental, read_threads, parse_procs, fmt, import_path,
+         export_path, agent, reference, history, at, since, lookup,
+         value_index, dedup, hosts_path, transport, fleet_command, concurrency,
+         host_timeout, retries, columns_dir, columns_format, tables,
+         batch_rows, **options):
     """Tool to explore meta data files."""
-    je = JsonConnector(dbfile)
+    history = HistoryStore(history) if history else None
+    if history and (at or since):
+        _inventory_history(history, host, show, at, since)
+        return
+    je = get_connector(dbfile)
+    je.value_index = value_index
+    try:
+        if fmt:
+            je.format = fmt
+        if dedup:
+            je.dedup = True
+    except ValueError as e:
+        # the backend of -d can not store it
+        print(e)
+        exit(1)
 
-    if show or list_keys or host:
+    if lookup:
+        je.lookup_hosts(lookup)
+    elif hosts_path:
+        _inventory_fleet(je, hosts_path, out_path, fmt, history, transport,
+                         fleet_command, concurrency, host_timeout, retries)
+    elif columns_dir:
+        _inventory_columns(je, columns_dir, merge, columns_format, tables,
+                           batch_rows, read_threads, parse_procs)
+    elif reference:
+        je.diff_hosts(reference, show)
+    elif show or list_keys or host:
         # call show stuff
         _inventory_show(je, show, list_keys, host)
     elif collect:
         # collect
-        _inventory_collect(je, collect, out_path)
+        sections = select_sections(
+            INVENTORY_SECTIONS, options['probes'], options['skip'])
+        if agent:
+            host, results = _collect_agent(agent, sections)
+        else:
+            host, results = collect_sections(options, sections)
+        _inventory_collect(je, collect, out_path, host, results, history)
     elif merge:
         # merge stuff
-        _inventory_mege(je, merge, out_path)
+        _inventory_mege(je, merge, out_path, stream, read_threads,
+                        parse_procs, incremental, fmt, value_index, dedup)
+    elif import_path:
+        je.import_file(import_path)
+    elif export_path:
+        je.export_file(export_path)
     else:
         # assume miss use of the tool
         print('Try --help to see help')
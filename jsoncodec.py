@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Parse JSON with the fastest installed codec, stdlib json as fallback."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-12
+
+import json
+import importlib
+
+# tried in this order, the first one installed is used
+CODECS = ['orjson', 'ujson', 'simplejson', 'json']
+
+
+def _import(name):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def get_codec(name=None):
+    """Return (name, module) of codec name or of the fastest installed one.
+
+    Raises ValueError if the requested codec is not installed.
+    """
+    if name:
+        module = _import(name) if name in CODECS else None
+        if module is None:
+            raise ValueError('JSON codec {} is not installed'.format(name))
+        return name, module
+    for codec_name in CODECS:
+        module = _import(codec_name)
+        if module is not None:
+            return codec_name, module
+    return 'json', json
+
+
+CODEC_NAME, _codec = get_codec()
+
+
+def loads(data):
+    """Parse JSON text or bytes with the selected codec."""
+    return _codec.loads(data)
+
+
+def read_bytes(path):
+    """Return the raw content of path, done in threads to hide I/O latency."""
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def load_path(path):
+    """Read and parse the JSON file at path."""
+    return loads(read_bytes(path))
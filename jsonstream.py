@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Write large JSON objects one member at a time."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-10
+
+import json
+
+INDENT = '    '
+# python 2 writes ', ' between members when indenting, python 3 ','
+ITEM_SEPARATOR = json.dumps([0, 0], indent=0).split('\n')[1][1:]
+
+
+def dumps_member(value):
+    """Serialize a member value the way json.dump(indent=4) would."""
+    return json.dumps(value, sort_keys=True, indent=4)
+
+
+def reindent(text, level):
+    """Indent every line but the first of dumped JSON text by level.
+
+    Strings in JSON text can not contain raw newlines, so every newline
+    starts a new line of the structure.
+    """
+    return text.replace('\n', '\n' + INDENT * level)
+
+
+def dedent(text, level):
+    """Undo reindent, for member text copied from a written file."""
+    return text.replace('\n' + INDENT * level, '\n')
+
+
+class JsonObjectWriter(object):
+    """Writes {"key": value, ...} member by member to an open file.
+
+    The output looks like json.dump(sort_keys=True, indent=4) if members
+    are written in sorted order. With root the members are written into
+    {"root": {...}}. Only the member being written is held in memory.
+    """
+
+    def __init__(self, fp, root=None):
+        """Class init."""
+        self.fp = fp
+        self.root = root
+        self.level = 2 if root is not None else 1
+        self.count = 0
+        self.fp.write('{')
+        if root is not None:
+            self.fp.write('\n{}{}: {{'.format(INDENT, json.dumps(root)))
+
+    def write_text(self, key, text):
+        """Write a member whose value is already dumped JSON text.
+
+        Returns (offset, length) of the value in the file, so it can be
+        read again without parsing the rest of the file.
+        """
+        if self.count:
+            self.fp.write(ITEM_SEPARATOR)
+        self.fp.write('\n{}{}: '.format(INDENT * self.level, json.dumps(key)))
+        value = reindent(text, self.level)
+        offset = self.fp.tell()
+        self.fp.write(value)
+        self.count += 1
+        return offset, len(value)
+
+    def write(self, key, value):
+        """Write one member, returns (offset, length) of its value."""
+        return self.write_text(key, dumps_member(value))
+
+    def close(self):
+        """Close the object(s), the file itself stays open."""
+        if self.count:
+            self.fp.write('\n{}}}'.format(INDENT * (self.level - 1)))
+        else:
+            self.fp.write('}')
+        if self.root is not None:
+            self.fp.write('\n}')
@@ -26,6 +26,50 @@ import os
 import json
 import click
 import logging
+import hashlib
+import tempfile
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from jsoncodec import CODEC_NAME, loads, read_bytes
+from formats import FORMATS, READ_SUFFIXES, format_for_path
+from dedup import decode_expanded
+from jsonstream import JsonObjectWriter, dedent, dumps_member
+from database import write_atomic, write_offset_index, dump_format
+from valueindex import ValueIndex
+from columnar import (BATCH_ROWS, COLUMN_FORMATS, ColumnarExporter,
+                      parse_tables)
+
+# files handed to the pools at once, bounds the memory of a parallel read
+WINDOW_PER_WORKER = 8
+MANIFEST_SUFFIX = '.manifest'
+MANIFEST_VERSION = 1
+
+
+def file_hash(path):
+    """Return the sha1 hex digest of the content of path."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(out_file):
+    """Return the manifest of out_file or None if it can not be used.
+
+    The manifest is only valid if out_file is still the file it was
+    written for, checked by size and mtime.
+    """
+    try:
+        with open(out_file + MANIFEST_SUFFIX, 'r') as fp:
+            manifest = json.load(fp)
+        stat = os.stat(out_file)
+    except (IOError, OSError, ValueError):
+        return None
+    if (manifest.get('version') != MANIFEST_VERSION or
+            manifest['output'] != [stat.st_size, stat.st_mtime]):
+        return None
+    return manifest
 
 
 class MergeMetadata(object):
@@ -35,6 +79,14 @@ class MergeMetadata(object):
         """Class init."""
         self.logger = self._get_logger()
         self.json_dicts = []
+        # format written by save_new_json, None picks it from the suffix
+        self.format = None
+        # write the inverted value index next to the output
+        self.value_index = False
+        # write the deduplicated layout of dedup.py
+        self.dedup = False
+        # root the merged hosts are written under, set by the merges
+        self.root = None
 
     def _get_logger(self):
         """Setup the global logger."""
@@ -53,40 +105,329 @@ class MergeMetadata(object):
         logger.debug('Logger setup complete. Start Program ... ')
         return logger
 
-    def read_files(self, input_path):
+    def read_files(self, input_path, read_threads=1, parse_procs=0):
         """Read files from disc out input_path."""
-        for file in os.listdir(input_path):
-            self.logger.info('Reading %s' % file)
-            # found a json file
-            path_to_node_json = str('%s/%s' % (input_path, file))
-
-            # test if exist
-            if os.path.exists(path_to_node_json) and file.endswith('.json'):
-                # read the content
-                with open(path_to_node_json, 'r') as json_file:
-                    tmp_dict = json.load(json_file)
-                    self.json_dicts.append(tmp_dict)
+        for file, tmp_dict in self.iter_documents(
+                input_path, read_threads, parse_procs):
+            self.json_dicts.append(tmp_dict)
+
+    def _node_files(self, input_path):
+        """Return the sorted names of the json files in input_path."""
+        return [file for file in sorted(os.listdir(input_path))
+                if file.endswith(READ_SUFFIXES) and
+                os.path.isfile(os.path.join(input_path, file))]
+
+    def iter_documents(self, input_path, read_threads=1, parse_procs=0,
+                       files=None):
+        """Yield (file, parsed document) of the files in input_path.
+
+        read_threads    threads reading the files, hides open() and read()
+                        latency on network file systems
+        parse_procs     processes parsing the files, 0 parses in this one
+
+        Files are handed to the pools in windows and yielded in sorted
+        order, so the result does not depend on the number of workers and
+        only one window of files is held in memory. files limits the read
+        to these names.
+        """
+        if files is None:
+            files = self._node_files(input_path)
+        files = sorted(files)
+        read_pool = ThreadPool(read_threads) if read_threads > 1 else None
+        parse_pool = multiprocessing.Pool(parse_procs) \
+            if parse_procs > 0 else None
+        workers = max(read_threads if read_pool else 0, parse_procs)
+        window = WINDOW_PER_WORKER * workers or 1
+        self.logger.info('Reading %d files with %s, %d thread(s), %d '
+                         'parser process(es)' % (len(files), CODEC_NAME,
+                                                 read_threads, parse_procs))
+        try:
+            for start in range(0, len(files), window):
+                names = files[start:start + window]
+                paths = [os.path.join(input_path, f) for f in names]
+                if read_pool:
+                    contents = read_pool.map(read_bytes, paths)
+                else:
+                    contents = [read_bytes(p) for p in paths]
+                if parse_pool:
+                    documents = parse_pool.map(decode_expanded, contents)
+                else:
+                    documents = [decode_expanded(c) for c in contents]
+                del contents
+                for file, document in zip(names, documents):
+                    self.logger.info('Reading %s' % file)
+                    yield file, document
+        finally:
+            for pool in (read_pool, parse_pool):
+                if pool:
+                    pool.terminate()
+                    pool.join()
+
+    def _check_root(self, name):
+        """Raise ValueError if the value index is asked for under a root.
+
+        Readers take the root as the only host, the index of the hosts
+        below it would never match.
+        """
+        if self.value_index and name is not None:
+            raise ValueError('the value index needs the hosts at the top '
+                             'level, it can not be written under the root '
+                             '{}'.format(name))
 
     def merge_files_with_new_root(self, name):
         """Merge files with name as new root."""
+        self.root = name
         self.merge_dict = {name: {}}
         for new_dict in self.json_dicts:
             self.merge_dict[name].update(new_dict)
 
     def merge_files(self):
         """Merge files in to on dictionary."""
+        self.root = None
         self.merge_dict = {}
         for new_dict in self.json_dicts:
             self.merge_dict.update(new_dict)
 
+    def stream_merge(self, input_path, out_file, name=None, read_threads=1,
+                     parse_procs=0):
+        """Merge the files in input_path into out_file with bounded memory.
+
+        Every node file is parsed on its own, its hosts are serialized to a
+        spool file and the parsed document is dropped before the next file
+        is read. The hosts are then copied in sorted order from the spool
+        into out_file, under name as root if given. Memory use is bounded
+        by the largest node file (or window of files with workers), not by
+        the fleet. As with merge_files, a host found in several files is
+        taken from the last one. read_threads and parse_procs are passed
+        to iter_documents.
+        """
+        self._check_root(name)
+        spool_index = {}
+        index = ValueIndex() if self.value_index else None
+        with tempfile.TemporaryFile(mode='w+') as spool:
+            for file, node_dict in self.iter_documents(
+                    input_path, read_threads, parse_procs):
+                for host, value in node_dict.items():
+                    if host in spool_index:
+                        self.logger.warning(
+                            'host %s found again in %s, replacing the one'
+                            ' from %s' % (host, file, spool_index[host][2]))
+                    text = dumps_member(value)
+                    if index:
+                        index.add(host, value)
+                    spool_index[host] = (spool.tell(), len(text), file)
+                    spool.write(text)
+                del node_dict
+
+            offsets = {}
+            # written next to out_file and renamed, so a crash leaves the
+            # old file as it was
+            out_dir = os.path.dirname(os.path.abspath(out_file))
+            fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'w') as fp:
+                    writer = JsonObjectWriter(fp, name)
+                    for host in sorted(spool_index):
+                        offset, length, _ = spool_index[host]
+                        spool.seek(offset)
+                        offsets[host] = writer.write_text(
+                            host, spool.read(length))
+                    writer.close()
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                os.rename(tmp_path, out_file)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        if name is None:
+            write_offset_index(out_file, offsets)
+        if index:
+            index.save(out_file)
+        return len(spool_index)
+
+    def _scan_changes(self, input_path, manifest):
+        """Compare the node files against the manifest.
+
+        Returns (files, changed): the manifest entries of all current
+        files and the names of the new or changed ones. A file is only
+        hashed if its size or mtime differ, a file touched without
+        changing its content is not parsed again.
+        """
+        known = manifest['files'] if manifest else {}
+        files, changed = {}, []
+        for file in self._node_files(input_path):
+            stat = os.stat(os.path.join(input_path, file))
+            entry = known.get(file)
+            if (entry and entry['size'] == stat.st_size and
+                    entry['mtime'] == stat.st_mtime):
+                files[file] = entry
+                continue
+            sha1 = file_hash(os.path.join(input_path, file))
+            if entry and entry['sha1'] == sha1:
+                files[file] = dict(entry, size=stat.st_size,
+                                   mtime=stat.st_mtime)
+            else:
+                files[file] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                               'sha1': sha1, 'hosts': []}
+                changed.append(file)
+        return files, changed
+
+    def incremental_merge(self, input_path, out_file, name=None,
+                          read_threads=1, parse_procs=0):
+        """Update out_file with the files changed since the last merge.
+
+        A manifest next to out_file records size, mtime and sha1 of every
+        node file and where the value of every host is in out_file. Only
+        new or changed files are parsed, hosts of removed files are
+        dropped and all other hosts are copied as text from the previous
+        out_file. Without a valid manifest all files are merged. As with
+        merge_files, a host found in several files is taken from the last
+        one. Returns a dict with the number of parsed, copied and removed
+        hosts.
+        """
+        self._check_root(name)
+        manifest = read_manifest(out_file)
+        if manifest and manifest.get('root') != name:
+            manifest = None
+        files, changed = self._scan_changes(input_path, manifest)
+        old_hosts = manifest['hosts'] if manifest else {}
+        index, rebuild = None, False
+        if self.value_index:
+            # must be loaded before the output it belongs to is replaced
+            index = ValueIndex.load(out_file) if manifest else None
+            rebuild = index is None
+            index = index or ValueIndex()
+
+        parsed, parsed_docs = {}, {}
+        for file, node_dict in self.iter_documents(
+                input_path, read_threads, parse_procs, changed):
+            files[file]['hosts'] = sorted(node_dict)
+            parsed[file] = dict(
+                (host, dumps_member(v)) for host, v in node_dict.items())
+            if index:
+                parsed_docs[file] = node_dict
+            del node_dict
+
+        # the last file in sorted order wins
+        owners = {}
+        for file in sorted(files):
+            for host in files[file]['hosts']:
+                owners[host] = file
+        # the old output only has the value of the previous owner
+        stale = set()
+        for host, file in owners.items():
+            previous = old_hosts.get(host)
+            if file not in parsed and (not previous or previous[2] != file):
+                stale.add(file)
+        for file, node_dict in self.iter_documents(
+                input_path, read_threads, parse_procs, stale):
+            parsed[file] = dict(
+                (host, dumps_member(v)) for host, v in node_dict.items())
+            if index:
+                parsed_docs[file] = node_dict
+
+        out_dir = os.path.dirname(os.path.abspath(out_file))
+        fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix='.tmp-')
+        hosts = {}
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                writer = JsonObjectWriter(fp, name)
+                old = open(out_file, 'r') if old_hosts else None
+                try:
+                    for host in sorted(owners):
+                        file = owners[host]
+                        if file in parsed:
+                            text = parsed[file][host]
+                        else:
+                            offset, length, _ = old_hosts[host]
+                            old.seek(offset)
+                            # written indented to the level of the writer
+                            text = dedent(old.read(length), writer.level)
+                        if file in parsed_docs:
+                            index.add(host, parsed_docs[file][host])
+                        elif rebuild:
+                            index.add(host, loads(text))
+                        offset, length = writer.write_text(host, text)
+                        hosts[host] = [offset, length, file]
+                finally:
+                    if old:
+                        old.close()
+                writer.close()
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.rename(tmp_path, out_file)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        stat = os.stat(out_file)
+        write_atomic(out_file + MANIFEST_SUFFIX, {
+            'version': MANIFEST_VERSION,
+            'root': name,
+            'output': [stat.st_size, stat.st_mtime],
+            'files': files,
+            'hosts': hosts,
+        })
+        if name is None:
+            write_offset_index(out_file, dict(
+                (host, entry[:2]) for host, entry in hosts.items()))
+        if index:
+            for host in set(old_hosts) - set(owners):
+                index.remove(host)
+            index.save(out_file)
+        stats = {
+            'parsed': sum(1 for f in owners.values() if f in parsed),
+            'copied': sum(1 for f in owners.values() if f not in parsed),
+            'removed': len(set(old_hosts) - set(owners)),
+        }
+        self.logger.info('merged %d hosts: %d parsed, %d copied, %d removed'
+                         % (len(owners), stats['parsed'], stats['copied'],
+                            stats['removed']))
+        return stats
+
+    def export_columns(self, input_path, exporter, read_threads=1,
+                       parse_procs=0):
+        """Flatten the hosts of the node files in input_path into tables.
+
+        exporter is a columnar.ColumnarExporter, it is closed after the
+        last file. Files are read one window at a time like stream_merge,
+        but a host found again in a later file is skipped, its rows are
+        already written. Returns table name to rows written.
+        """
+        seen = {}
+        for file, node_dict in self.iter_documents(
+                input_path, read_threads, parse_procs):
+            for host in sorted(node_dict):
+                if host in seen:
+                    self.logger.warning(
+                        'host %s found again in %s, keeping the one from %s'
+                        % (host, file, seen[host]))
+                    continue
+                seen[host] = file
+                exporter.add(host, node_dict[host])
+            del node_dict
+        return exporter.close()
+
     def save_new_json(self, out_file):
         """Save merged dictionary as JSON to out_file."""
+        self._check_root(self.root)
         self._dump_dict(self.merge_dict, out_file)
+        if self.value_index:
+            ValueIndex.build(self.merge_dict.items()).save(out_file)
 
     def _dump_dict(self, dict, json_file_path):
-        """Dump the given dict to a json file."""
-        with open(json_file_path, 'w') as fp:
-            json.dump(dict, fp, sort_keys=True, indent=4)
+        """Dump the given dict to a json file with its offset index."""
+        dump_format(dict, json_file_path,
+                    self.format or format_for_path(json_file_path),
+                    self.dedup)
+
+
+def validate_tables(ctx, param, value):
+    """Click callback checking a comma separated list of table names."""
+    try:
+        return parse_tables(value)
+    except KeyError as e:
+        raise click.BadParameter(e.args[0])
 
 
 @click.command()
@@ -98,26 +439,129 @@ class MergeMetadata(object):
 @click.option(
     '--out_file',
     type=click.STRING,
-    help='the file where the merged json gets written to',
-    required=True)
+    help='the file where the merged json gets written to, not needed '
+         'with --columns')
 @click.option(
     '--name',
     type=click.STRING,
-    help='name of the json root',
-    required=True)
-def main(input_path, name, out_file):
+    help='name of the json root, without it the hosts are at the top level')
+@click.option(
+    '--stream',
+    default=False,
+    is_flag=True,
+    help='merge one file at a time with bounded memory')
+@click.option(
+    '--format',
+    'fmt',
+    type=click.Choice(FORMATS),
+    help='format of out_file, by default taken from its suffix')
+@click.option(
+    '--incremental',
+    default=False,
+    is_flag=True,
+    help='parse only files changed since the last merge into out_file')
+@click.option(
+    '--value_index',
+    default=False,
+    is_flag=True,
+    help='write the inverted value index next to out_file')
+@click.option(
+    '--dedup',
+    default=False,
+    is_flag=True,
+    help='store sections shared by hosts only once in out_file')
+@click.option(
+    '--read_threads',
+    default=1,
+    type=click.INT,
+    help='number of threads reading the json files')
+@click.option(
+    '--parse_procs',
+    default=0,
+    type=click.INT,
+    help='number of processes parsing the json files, 0 for none')
+@click.option(
+    '--columns',
+    'columns_dir',
+    type=click.Path(),
+    help='write the hosts as flat tables to this directory instead')
+@click.option(
+    '--columns_format',
+    default='csv',
+    type=click.Choice(sorted(COLUMN_FORMATS)),
+    help='format of the --columns tables, parquet and arrow need pyarrow')
+@click.option(
+    '--tables',
+    callback=validate_tables,
+    help='comma separated tables of --columns, e.g. hosts,packages')
+@click.option(
+    '--batch_rows',
+    default=BATCH_ROWS,
+    type=click.IntRange(1, None),
+    help='rows of a --columns table written at once')
+def main(input_path, name, out_file, stream, fmt, incremental, value_index,
+         dedup, read_threads, parse_procs, columns_dir, columns_format,
+         tables, batch_rows):
     """
     Script to merges json files for the node meta data information.
 
     The annotation will parse the input with click and build the needed
     arguments.
-    --name          name of the root for the new document
+    --name          name of the root for the new document, can not be
+                    combined with --value_index
     --input_path    path to the json files
     --out_file      the file where the new document is written to
+    --stream        keep only one node file in memory at a time
+    --format        json, json-compact, gzip, zstd or msgpack
+    --incremental   update out_file with the changed files only
+    --value_index   index which hosts have which values, see inventory.py
+    --dedup         write the deduplicated layout of dedup.py
+    --read_threads  threads reading the files
+    --parse_procs   processes parsing the files
+    --columns       flatten the hosts into tables (hosts, packages,
+                    addresses, ...) in this directory instead of merging,
+                    see also --columns_format, --tables and --batch_rows
     """
     mm = MergeMetadata()
-    mm.read_files(input_path)
-    mm.merge_files_with_new_root(name)
+    if columns_dir:
+        try:
+            exporter = ColumnarExporter(columns_dir, tables, columns_format,
+                                        batch_rows)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        rows = mm.export_columns(input_path, exporter, read_threads,
+                                 parse_procs)
+        print(json.dumps({'hosts': exporter.hosts, 'rows': rows,
+                          'files': exporter.paths}, sort_keys=True,
+                         indent=4))
+        return
+    if not out_file:
+        raise click.UsageError('--out_file is needed unless --columns')
+    mm.format = fmt
+    mm.value_index = value_index
+    mm.dedup = dedup
+    if (stream or incremental) and \
+            ((fmt or format_for_path(out_file)) != 'json' or dedup):
+        raise click.UsageError('--stream and --incremental write plain json')
+    if dedup and name is not None:
+        raise click.UsageError('--dedup shares sections between the hosts '
+                               'at the top level, leave out --name')
+    if value_index and name is not None:
+        raise click.UsageError('--value_index indexes the hosts at the top '
+                               'level, leave out --name')
+    if incremental:
+        mm.incremental_merge(input_path, out_file, name, read_threads,
+                             parse_procs)
+        return
+    if stream:
+        mm.stream_merge(input_path, out_file, name, read_threads,
+                        parse_procs)
+        return
+    mm.read_files(input_path, read_threads, parse_procs)
+    if name is None:
+        mm.merge_files()
+    else:
+        mm.merge_files_with_new_root(name)
     mm.save_new_json(out_file)
 
 
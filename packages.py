@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Read the installed packages from the package manager databases."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-18
+
+import os
+from distutils.spawn import find_executable
+from cache import file_key
+from instrument import check_output
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+RPM_DB = '/var/lib/rpm'
+
+
+def iter_dpkg_status(status_path=DPKG_STATUS):
+    """Stream (name, arch, version) of the installed packages.
+
+    Only the Package, Architecture, Status and Version fields of a stanza
+    are looked at, everything else (descriptions, dependencies, ...) is
+    skipped line by line without being stored.
+    """
+    name = arch = version = None
+    installed = False
+    with open(status_path) as fp:
+        for line in fp:
+            if line == '\n':
+                if installed and name:
+                    yield name, arch, version
+                name = arch = version = None
+                installed = False
+            elif line[0] in ' \t':
+                continue
+            elif line.startswith('Package:'):
+                name = line[8:].strip()
+            elif line.startswith('Status:'):
+                installed = line.split()[-1] == 'installed'
+            elif line.startswith('Version:'):
+                version = line[8:].strip()
+            elif line.startswith('Architecture:'):
+                arch = line[13:].strip()
+    if installed and name:
+        yield name, arch, version
+
+
+def read_dpkg_status(status_path=DPKG_STATUS):
+    """Return a dict of installed package name to version.
+
+    Packages installed for more than one architecture keep the plain name
+    for the first architecture in sort order and get name:arch for the
+    others, so the names do not depend on the order of the status file.
+    """
+    pkg_list = {}
+    for name, arch, version in sorted(iter_dpkg_status(status_path),
+                                      key=lambda entry: entry[:2]):
+        if name in pkg_list:
+            name = '{}:{}'.format(name, arch)
+        pkg_list[name] = version
+    return pkg_list
+
+
+def read_rpm_db():
+    """Return a dict of installed package name to version from rpm."""
+    out = check_output(
+        ['rpm', '-qa', '--queryformat', '%{NAME}\t%{VERSION}-%{RELEASE}\n'])
+    pkg_list = {}
+    for line in out.decode('utf-8', 'replace').splitlines():
+        name, _, version = line.partition('\t')
+        pkg_list[name] = version
+    return pkg_list
+
+
+def read_apt_cache(rootdir=None):
+    """Return installed packages using python-apt, the former probe."""
+    import apt
+    cache = apt.Cache(rootdir=rootdir)
+    pkg_list = {}
+    for pkg in cache:
+        if pkg.is_installed:
+            pkg_list[pkg.name] = pkg.installed.version
+    return pkg_list
+
+
+def installed_packages(cache=None, status_path=DPKG_STATUS):
+    """Return installed packages of this host.
+
+    The dpkg status file is used when present, the rpm database otherwise.
+    With a cache the result is stored keyed on mtime and size of the
+    database, so it is only parsed again after packages changed.
+    """
+    if os.path.exists(status_path):
+        key = file_key(status_path)
+        reader, args = read_dpkg_status, (status_path,)
+    elif find_executable('rpm'):
+        key = file_key(*[os.path.join(RPM_DB, f)
+                         for f in ('Packages', 'rpmdb.sqlite')])
+        reader, args = read_rpm_db, ()
+    else:
+        return read_apt_cache()
+
+    if cache is None:
+        return reader(*args)
+    return cache.cached('packages', key, reader, *args)
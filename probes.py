@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Registry of the named probes a Collector provides."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-12
+
+import imp
+from collections import OrderedDict
+from distutils.spawn import find_executable
+from scheduler import error_marker
+from cache import boot_key
+
+PROBES = OrderedDict()
+
+
+class Probe(object):
+    """A Collector method declared as named probe."""
+
+    def __init__(self, name, method, requires=(), commands=(), args=(),
+                 static=False, cache_files=(), cache_ttl=None, cache_attrs=(),
+                 cache_if=None):
+        """Class init.
+
+        name        name used on the command line (--probes / --skip)
+        method      name of the Collector method to call
+        requires    python modules the method imports
+        commands    executables the method runs
+        args        arguments the method is called with
+        static      the result only changes with a reboot or with one of
+                    cache_files, it is served from the Collector cache
+        cache_files files the static result is derived from
+        cache_ttl   seconds a static result is served at most
+        cache_attrs Collector attributes changing the result, they are
+                    part of the cache key
+        cache_if    Collector method telling if the result may be cached,
+                    it is collected without the cache when this is False
+        """
+        self.name = name
+        self.method = method
+        self.requires = tuple(requires)
+        self.commands = tuple(commands)
+        self.args = tuple(args)
+        self.static = static
+        self.cache_files = tuple(cache_files)
+        self.cache_ttl = cache_ttl
+        self.cache_attrs = tuple(cache_attrs)
+        self.cache_if = cache_if
+
+    def missing(self):
+        """Return the dependencies not available on this host.
+
+        Modules are only looked up, not imported, so checking a probe
+        costs nothing even if its library is heavy.
+        """
+        missing = []
+        for module in self.requires:
+            try:
+                imp.find_module(module)
+            except ImportError:
+                missing.append(module)
+        for command in self.commands:
+            if find_executable(command) is None:
+                missing.append(command)
+        return missing
+
+    def task(self, coll):
+        """Return the callable collecting this probe for coll."""
+        method = getattr(coll, self.method)
+        if not self.static:
+            return method
+
+        def cached(*args):
+            if self.cache_if and not getattr(coll, self.cache_if)():
+                return method(*args)
+            key = boot_key(*self.cache_files)
+            for attr in self.cache_attrs:
+                key[attr] = getattr(coll, attr)
+            return coll.cache.cached(
+                'probe-{}'.format(self.name), key,
+                method, *args, ttl=self.cache_ttl)
+        return cached
+
+
+def probe(name, requires=(), commands=(), args=(),
+          static=False, cache_files=(), cache_ttl=None, cache_attrs=(),
+          cache_if=None):
+    """Declare a Collector method as probe called name."""
+    def decorator(func):
+        PROBES[name] = Probe(
+            name, func.__name__, requires, commands, args,
+            static, cache_files, cache_ttl, cache_attrs, cache_if)
+        return func
+    return decorator
+
+
+def parse_names(value):
+    """Split a comma separated probe list as given on the command line."""
+    if not value:
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def select_sections(default_sections, probes=None, skip=None):
+    """Return the (section, probe name) pairs that should be collected.
+
+    default_sections    (section, probe name) pairs of an entry point
+    probes              probe names to collect instead of the defaults;
+                        probes without default section use their name
+    skip                probe names to leave out
+    """
+    unknown = [n for n in (probes or []) + (skip or []) if n not in PROBES]
+    if unknown:
+        raise KeyError(
+            'unknown probe(s) {}, available: {}'.format(
+                ', '.join(unknown), ', '.join(PROBES)))
+
+    if probes:
+        by_probe = dict((p, s) for s, p in default_sections)
+        sections = [(by_probe.get(p, p), p) for p in probes]
+    else:
+        sections = list(default_sections)
+    return [(s, p) for s, p in sections if p not in (skip or [])]
+
+
+def build_probes(coll, sections):
+    """Turn (section, probe name) pairs into scheduler tasks for coll.
+
+    Probes with missing dependencies are not scheduled, their sections
+    get an 'unavailable' error marker instead. They are returned as second
+    value so they can be merged into the result.
+    """
+    tasks = []
+    unavailable = {}
+    for section, name in sections:
+        entry = PROBES[name]
+        missing = entry.missing()
+        if missing:
+            unavailable[section] = error_marker(
+                section, 'unavailable',
+                'missing {}'.format(', '.join(missing)))
+            continue
+        tasks.append((section, entry.task(coll), entry.args))
+    return tasks, unavailable
+
+
+def run_sections(coll, scheduler, sections, stats=None, profiles=None):
+    """Collect the given (section, probe name) pairs of coll.
+
+    stats and profiles are filled like by ProbeScheduler.run, unavailable
+    probes get the status 'unavailable'.
+    """
+    tasks, result = build_probes(coll, sections)
+    if stats is not None:
+        stats.update((s, {'status': 'unavailable'}) for s in result)
+    result.update(scheduler.run(tasks, stats, profiles))
+    return result
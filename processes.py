@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Snapshot the running processes with a configurable set of attributes."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-26
+
+import os
+import re
+import json
+
+ATTRS = ['pid', 'name', 'ppid', 'cmdline', 'username', 'status', 'nice',
+         'num_threads', 'cpu_affinity', 'cpu_times', 'rss', 'cgroup']
+DEFAULT_ATTRS = ['pid', 'name']
+PROC = '/proc'
+# /proc/<pid>/stat fields after the command name, counted from 0
+STAT_STATE, STAT_PPID, STAT_UTIME, STAT_STIME = 0, 1, 11, 12
+STAT_NICE, STAT_THREADS, STAT_RSS = 16, 17, 21
+# attributes read from /proc/<pid>/stat and /proc/<pid>/status
+STAT_ATTRS = frozenset(['name', 'ppid', 'status', 'nice', 'num_threads',
+                        'cpu_times', 'rss'])
+STATUS_ATTRS = frozenset(['username', 'cpu_affinity'])
+# the kernel cuts the command name of /proc/<pid>/stat to this length
+COMM_LEN = 15
+# state letters of /proc/<pid>/stat, named like psutil does
+PROC_STATUS = {
+    'R': 'running', 'S': 'sleeping', 'D': 'disk-sleep', 'T': 'stopped',
+    't': 'tracing-stop', 'Z': 'zombie', 'X': 'dead', 'x': 'dead',
+    'K': 'wake-kill', 'W': 'waking', 'P': 'parked', 'I': 'idle',
+}
+
+
+def parse_cpu_list(value):
+    """Parse a cpu list like 0-3,8 into [0, 1, 2, 3, 8]."""
+    cpus = []
+    for part in value.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def read_cgroup(pid, proc=PROC):
+    """Return the cgroups of pid as dict of controllers to path.
+
+    The unified cgroup v2 hierarchy has no controllers, its key is ''.
+    """
+    cgroups = {}
+    try:
+        with open('{}/{}/cgroup'.format(proc, pid)) as fp:
+            for line in fp:
+                _, controllers, cgroup_path = line.rstrip('\n').split(':', 2)
+                cgroups[controllers] = cgroup_path
+    except (IOError, ValueError):
+        return None
+    return cgroups
+
+
+def read_cmdline(pid, proc=PROC):
+    """Return the arguments of pid, split the way psutil does.
+
+    Processes that rewrote their arguments may use spaces instead of
+    NUL characters as separator.
+    """
+    with open('{}/{}/cmdline'.format(proc, pid)) as fp:
+        data = fp.read()
+    if not data:
+        return []
+    sep = '\0' if data.endswith('\0') else ' '
+    if data.endswith(sep):
+        data = data[:-1]
+    cmdline = data.split(sep)
+    if sep == '\0' and len(cmdline) == 1 and ' ' in data:
+        cmdline = data.split(' ')
+    return cmdline
+
+
+class ProcessSnapshot(object):
+    """Lists the processes of this host, one dict per process."""
+
+    def __init__(self, attrs=None, backend='psutil', user=None, name=None,
+                 cgroup=None):
+        """Class init.
+
+        attrs       attributes recorded per process, see ATTRS
+        backend     'psutil' (oneshot per process) or 'proc', which reads
+                    only the /proc files the attributes need
+        user        only processes of this user name
+        name        only processes whose name matches this regex
+        cgroup      only processes with a cgroup path containing this
+        """
+        self.attrs = list(attrs or DEFAULT_ATTRS)
+        unknown = [a for a in self.attrs if a not in ATTRS]
+        if unknown:
+            raise ValueError('unknown process attribute(s): {}'.format(
+                ', '.join(unknown)))
+        self.backend = backend
+        self.user = user
+        self.name = re.compile(name) if name else None
+        self.cgroup = cgroup
+        # attributes needed by the filters, even if not recorded
+        self.needed = set(self.attrs)
+        if user:
+            self.needed.add('username')
+        if name:
+            self.needed.add('name')
+        if cgroup:
+            self.needed.add('cgroup')
+        self._users = {}
+
+    def _keep(self, info):
+        """Test a process against the filters."""
+        if self.user and info.get('username') != self.user:
+            return False
+        if self.name and not self.name.search(info.get('name') or ''):
+            return False
+        if self.cgroup and not any(
+                self.cgroup in p for p in (info.get('cgroup') or {}).values()):
+            return False
+        return True
+
+    def _username(self, uid):
+        """Resolve a uid once per snapshot."""
+        if uid not in self._users:
+            import pwd
+            try:
+                self._users[uid] = pwd.getpwuid(uid)[0]
+            except KeyError:
+                self._users[uid] = str(uid)
+        return self._users[uid]
+
+    def _iter_psutil(self):
+        import psutil
+        getters = {
+            'pid': lambda p: p.pid,
+            'name': lambda p: p.name(),
+            'ppid': lambda p: p.ppid(),
+            'cmdline': lambda p: p.cmdline(),
+            'username': lambda p: p.username(),
+            'status': lambda p: p.status(),
+            'nice': lambda p: p.nice(),
+            'num_threads': lambda p: p.num_threads(),
+            'cpu_affinity': lambda p: p.cpu_affinity(),
+            'cpu_times': lambda p: list(p.cpu_times()[:2]),
+            'rss': lambda p: p.memory_info().rss,
+            'cgroup': lambda p: read_cgroup(p.pid),
+        }
+        for proc in psutil.process_iter():
+            info = {}
+            try:
+                with proc.oneshot():
+                    for attr in self.needed:
+                        try:
+                            info[attr] = getters[attr](proc)
+                        except psutil.AccessDenied:
+                            info[attr] = None
+            except psutil.NoSuchProcess:
+                continue
+            yield info
+
+    def _read_proc(self, pid):
+        """Read the attributes of one pid from /proc."""
+        base = '{}/{}'.format(PROC, pid)
+        info = {'pid': pid}
+        needed = self.needed
+        if needed & STAT_ATTRS:
+            with open(base + '/stat') as fp:
+                stat = fp.read()
+            # the command name may contain spaces and parentheses
+            left, right = stat.index('('), stat.rindex(')')
+            fields = stat[right + 2:].split()
+            info['name'] = stat[left + 1:right]
+            info['ppid'] = int(fields[STAT_PPID])
+            info['status'] = PROC_STATUS.get(
+                fields[STAT_STATE], fields[STAT_STATE])
+            info['nice'] = int(fields[STAT_NICE])
+            info['num_threads'] = int(fields[STAT_THREADS])
+            info['cpu_times'] = [
+                int(fields[STAT_UTIME]) / self._ticks,
+                int(fields[STAT_STIME]) / self._ticks]
+            info['rss'] = int(fields[STAT_RSS]) * self._page_size
+        name = info.get('name')
+        if 'cmdline' in needed or (name and len(name) >= COMM_LEN):
+            cmdline = read_cmdline(pid)
+            if 'cmdline' in needed:
+                info['cmdline'] = cmdline
+            # like psutil, a cut name is completed from the executable
+            if name and len(name) >= COMM_LEN and cmdline:
+                extended = os.path.basename(cmdline[0])
+                if extended.startswith(name):
+                    info['name'] = extended
+        if needed & STATUS_ATTRS:
+            with open(base + '/status') as fp:
+                for line in fp:
+                    if line.startswith('Uid:'):
+                        info['username'] = self._username(
+                            int(line.split()[1]))
+                    elif line.startswith('Cpus_allowed_list:'):
+                        info['cpu_affinity'] = parse_cpu_list(
+                            line.split()[1])
+        if 'cgroup' in needed:
+            info['cgroup'] = read_cgroup(pid)
+        return info
+
+    def _iter_proc(self):
+        self._ticks = float(os.sysconf('SC_CLK_TCK'))
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+        for entry in os.listdir(PROC):
+            if not entry.isdigit():
+                continue
+            try:
+                yield self._read_proc(int(entry))
+            except (IOError, OSError, ValueError):
+                # the process ended while it was read
+                continue
+
+    def __iter__(self):
+        """Stream the matching processes with the configured attributes."""
+        if self.backend == 'proc':
+            infos = self._iter_proc()
+        else:
+            infos = self._iter_psutil()
+        for info in infos:
+            if self._keep(info):
+                yield dict((a, info.get(a)) for a in self.attrs)
+
+    def write_jsonl(self, out_path):
+        """Write the snapshot as one JSON document per line.
+
+        Only one process is held in memory at a time. Returns the number
+        of processes written.
+        """
+        count = 0
+        with open(out_path, 'w') as fp:
+            for info in self:
+                fp.write(json.dumps(info, sort_keys=True))
+                fp.write('\n')
+                count += 1
+        return count
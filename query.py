@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Compile path expressions like network.eth0.2[*].addr for host documents.
+
+A query is a path, a filter or both:
+    network.eth0.2[*].addr              values found at the path
+    packages["openmpi"]                 a key with any characters
+    where cpu.count >= 32               hosts matching the filter
+    packages.openmpi where cpu.count >= 32 and vms.active_vms != {}
+Path steps are keys (.key or ["key"]), list indices (.0 or [0]) and
+the wildcard * for all keys or items. Filters compare a path with ==,
+!=, <, <=, >, >= or ~ (regular expression) against a number, a quoted
+string, true, false, null, {} or [] and are joined with and / or. A
+filter holds if any value found at its path matches.
+"""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-24
+
+import re
+import json
+import operator
+
+TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|<=|>=|<|>|~)
+      | (?P<punct>\{\}|\[\]|[.\[\]*])
+      | (?P<number>-?\d+(?:\.\d+)?(?![\w-]))
+      | (?P<word>[^\s.\[\]"'=!<>~*]+)
+    )''', re.VERBOSE)
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '~': lambda value, pattern: pattern.search(value) is not None,
+}
+CONSTANTS = {'true': True, 'false': False, 'null': None}
+STRING_TYPES = (str, type(u''))
+
+
+class QueryError(ValueError):
+    """Raised for an expression that can not be compiled."""
+
+
+def tokenize(expression):
+    """Split expression into (kind, text) tokens."""
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match or match.end() == position:
+            raise QueryError("can not parse '{}' at {}".format(
+                expression[position:], position))
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def _unquote(text):
+    """Decode a quoted string token, backslash escapes work as in JSON."""
+    if text[0] == "'":
+        text = '"{}"'.format(
+            text[1:-1].replace("\\'", "'").replace('"', '\\"'))
+    return json.loads(text)
+
+
+def _step(key):
+    """Return a function mapping a value to its children at key."""
+    if key is None:
+        def wildcard(value):
+            if isinstance(value, dict):
+                return [value[k] for k in sorted(value)]
+            if isinstance(value, list):
+                return value
+            return []
+        return wildcard
+
+    index = int(key) if key.lstrip('-').isdigit() else None
+
+    def child(value):
+        if isinstance(value, dict):
+            return [value[key]] if key in value else []
+        if isinstance(value, list) and index is not None:
+            try:
+                return [value[index]]
+            except IndexError:
+                return []
+        return []
+    return child
+
+
+class Path(object):
+    """A compiled path, select() returns every value found in a document."""
+
+    def __init__(self, keys):
+        """Class init, keys are strings or None for the wildcard."""
+        self.keys = keys
+        self.steps = [_step(k) for k in keys]
+
+    def select(self, document):
+        values = [document]
+        for step in self.steps:
+            values = [child for value in values for child in step(value)]
+            if not values:
+                break
+        return values
+
+    def __str__(self):
+        return '.'.join('*' if k is None else k for k in self.keys)
+
+
+class Comparison(object):
+    """path op literal, holds if any value at path compares true."""
+
+    def __init__(self, path, op, literal):
+        """Class init."""
+        self.path = path
+        self.op = op
+        self.compare = OPERATORS[op]
+        if op == '~':
+            literal = re.compile(literal)
+        self.literal = literal
+
+    def matches(self, document):
+        for value in self.path.select(document):
+            if self.op == '~' and not isinstance(value, STRING_TYPES):
+                continue
+            try:
+                if self.compare(value, self.literal):
+                    return True
+            except TypeError:
+                # python 3 does not order values of different types
+                continue
+        return False
+
+
+class Query(object):
+    """A compiled query, apply it to every host document."""
+
+    def __init__(self, expression):
+        """Compile expression, raises QueryError if it is invalid."""
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.path = None
+        self.condition = None
+        if not self._at('word', 'where'):
+            self.path = self._path()
+        if self._at('word', 'where'):
+            self.position += 1
+            self.condition = self._or()
+        if self.position != len(self.tokens):
+            raise QueryError("unexpected '{}' in '{}'".format(
+                self.tokens[self.position][1], expression))
+        if self.path is None and self.condition is None:
+            raise QueryError('empty query')
+        del self.tokens
+
+    def _at(self, kind, text=None):
+        if self.position >= len(self.tokens):
+            return False
+        token = self.tokens[self.position]
+        return token[0] == kind and (text is None or token[1] == text)
+
+    def _next(self, what):
+        if self.position >= len(self.tokens):
+            raise QueryError("{} expected at the end of '{}'".format(
+                what, self.expression))
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _keys(self):
+        """Return the keys of one step, a number like 2.1 holds two."""
+        kind, text = self._next('key')
+        if kind == 'punct' and text == '*':
+            return [None]
+        if kind == 'string':
+            return [_unquote(text)]
+        if kind == 'word':
+            return [text]
+        if kind == 'number':
+            return text.split('.')
+        raise QueryError("key expected, found '{}'".format(text))
+
+    def _path(self):
+        keys = self._keys()
+        while self._at('punct', '.') or self._at('punct', '['):
+            kind, text = self._next('path')
+            keys.extend(self._keys())
+            if text == '[':
+                if self._next(']') != ('punct', ']'):
+                    raise QueryError("] expected in '{}'".format(
+                        self.expression))
+        return Path(keys)
+
+    def _literal(self):
+        kind, text = self._next('value')
+        if kind == 'string':
+            return _unquote(text)
+        if kind == 'number':
+            return float(text) if '.' in text else int(text)
+        if kind == 'punct' and text in ('{}', '[]'):
+            return {} if text == '{}' else []
+        if kind == 'word':
+            return CONSTANTS.get(text, text)
+        raise QueryError("value expected, found '{}'".format(text))
+
+    def _comparison(self):
+        path = self._path()
+        kind, op = self._next('operator')
+        if kind != 'op':
+            raise QueryError("operator expected, found '{}'".format(op))
+        return Comparison(path, op, self._literal())
+
+    def _and(self):
+        terms = [self._comparison()]
+        while self._at('word', 'and'):
+            self.position += 1
+            terms.append(self._comparison())
+        return terms
+
+    def _or(self):
+        alternatives = [self._and()]
+        while self._at('word', 'or'):
+            self.position += 1
+            alternatives.append(self._and())
+        return alternatives
+
+    def sections(self):
+        """Return the top-level keys the query reads, None for all."""
+        paths = [c.path for terms in self.condition or [] for c in terms]
+        if self.path is None:
+            return None
+        paths.append(self.path)
+        if any(p.keys[0] is None for p in paths):
+            return None
+        return set(p.keys[0] for p in paths)
+
+    def matches(self, document):
+        """Test a host document against the where part."""
+        if self.condition is None:
+            return True
+        return any(all(c.matches(document) for c in terms)
+                   for terms in self.condition)
+
+    def apply(self, document):
+        """Return the values of the path, None if the host is filtered.
+
+        A query without path returns [document].
+        """
+        if not self.matches(document):
+            return None
+        if self.path is None:
+            return [document]
+        return self.path.select(document)
+
+    def run(self, hosts):
+        """Yield (host name, values) of the hosts with values.
+
+        hosts is an iterable of (host name, document), it is consumed one
+        host at a time.
+        """
+        for hostname, document in hosts:
+            values = self.apply(document)
+            if values:
+                yield hostname, values
+
+
+def is_query(show):
+    """Tell a query from a plain top-level key as given to -s."""
+    return bool(re.search(r'[.\[\]\s*]', show))
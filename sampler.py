@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Sample cheap dynamic data while an experiment runs.
+
+A sample holds the load average, cpu time and RSS of the processes of
+the experiment, the cpu time of the active VMs and the I/O counters of
+the mounted disks. Samples go into a ring buffer of a fixed size, the
+first and last value of every counter are kept aside, so the rates
+cover the whole run even when early samples were dropped. Everything
+else the sampler keeps is a running total or bounded by the size of the
+ring buffer, so long runs cost no more memory than short ones.
+"""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-02
+
+import os
+import time
+import logging
+import threading
+import collections
+from instrument import thread_cpu_seconds
+
+# longest interval the sampler backs off to
+MAX_INTERVAL = 60.0
+DISK_FIELDS = ('read_bytes', 'write_bytes', 'read_count', 'write_count')
+
+
+def _mounted_disks():
+    """Return the names of the block devices with a mounted file system."""
+    import psutil
+    return set(os.path.basename(p.device)
+               for p in psutil.disk_partitions(all=False)
+               if p.device.startswith('/dev/'))
+
+
+def _rate(first, last, seconds):
+    return round((last - first) / seconds, 3) if seconds > 0 else None
+
+
+class RunningStats(object):
+    """Count, sum, min and max of a series without keeping it."""
+
+    def __init__(self):
+        """Class init."""
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class Sampler(object):
+    """Samples the process tree of pid in a thread until stop() is called.
+
+    When sampling takes more than max_overhead of the interval in cpu
+    time, the interval is doubled, so the sampler stays below its share.
+    The stats of at most size finished processes are kept, older ones
+    only count in the totals of the dropped processes.
+    """
+
+    def __init__(self, pid, interval=1.0, size=600, max_overhead=0.01,
+                 libvirt_uri=None):
+        """Class init.
+
+        pid             root of the process tree to sample
+        interval        seconds between two samples
+        size            samples kept in the ring buffer
+        max_overhead    share of one cpu the sampling may use
+        libvirt_uri     connection the VM cpu time is read from, None to
+                        not sample VMs
+        """
+        self.logger = self._get_logger()
+        self.pid = pid
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.libvirt_uri = libvirt_uri
+        self.samples = collections.deque(maxlen=max(1, size))
+        self.count = 0
+        self.backoffs = 0
+        self._cpu_times = RunningStats()
+        self._wall_times = RunningStats()
+        self._processes = {}
+        # pid to [name, create time, last t, last cpu, peak rss] of the
+        # running processes, (pid, stats) of the finished ones
+        self._process_stats = {}
+        self._finished = collections.deque()
+        self._finished_size = max(1, size)
+        self._dropped = {'processes': 0, 'cpu_s': 0.0, 'peak_rss_kb': 0}
+        # counter group to (first sample, last sample)
+        self._first = {}
+        self._last = {}
+        self._loads = RunningStats()
+        self._libvirt = None
+        self._virt = None
+        self._disks = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.stopped = None
+
+    def _get_logger(self):
+        """Setup the global logger."""
+        logger = logging.getLogger(__name__)
+
+        logger.setLevel(logging.INFO)
+        # create console handler with a higher log level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        # create formatter and add it to the handlers
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch.setFormatter(formatter)
+        # add the handlers to the logger
+        logger.addHandler(ch)
+        logger.debug('Logger setup complete. Start Program ... ')
+        return logger
+
+    def _open_libvirt(self):
+        if self.libvirt_uri is None:
+            return
+        try:
+            import libvirt
+            self._libvirt = libvirt.openReadOnly(self.libvirt_uri)
+            self._virt = libvirt
+        except Exception as e:
+            self.logger.warning('not sampling vms: {}'.format(e))
+
+    def _tree(self):
+        """Return the psutil processes of the tree, reusing known ones."""
+        import psutil
+        try:
+            root = self._processes.get(self.pid) or psutil.Process(self.pid)
+            found = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return []
+        processes = {}
+        for proc in found:
+            processes[proc.pid] = self._processes.get(proc.pid, proc)
+        self._processes = processes
+        return processes.values()
+
+    def _sample_processes(self, now):
+        import psutil
+        sample = {}
+        for proc in self._tree():
+            try:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    cpu = times.user + times.system
+                    rss = proc.memory_info().rss // 1024
+                    name = proc.name()
+                    created = proc.create_time()
+            except psutil.Error:
+                continue
+            sample[str(proc.pid)] = [round(cpu, 3), rss]
+            stats = self._process_stats.get(proc.pid)
+            if stats is None:
+                self._process_stats[proc.pid] = [name, created, now, cpu,
+                                                 rss]
+            else:
+                stats[2:4] = [now, cpu]
+                stats[4] = max(stats[4], rss)
+        for pid in list(self._process_stats):
+            if str(pid) not in sample:
+                self._finish(pid)
+        return sample
+
+    def _finish(self, pid):
+        """Move the stats of a process that is gone to the finished ones."""
+        if len(self._finished) >= self._finished_size:
+            _, (name, created, seen, cpu, rss) = self._finished.popleft()
+            self._dropped['processes'] += 1
+            self._dropped['cpu_s'] += cpu
+            self._dropped['peak_rss_kb'] = max(
+                self._dropped['peak_rss_kb'], rss)
+        self._finished.append((pid, self._process_stats.pop(pid)))
+
+    def _sample_vms(self):
+        """Return domain name to cpu time of the active VMs, one call."""
+        if self._libvirt is None:
+            return None
+        from vms import active_stats
+        records = active_stats(self._libvirt, self._virt,
+                               self._virt.VIR_DOMAIN_STATS_CPU_TOTAL)
+        return dict((domain.name(), stats.get('cpu.time'))
+                    for domain, stats in records)
+
+    def _sample_disks(self):
+        import psutil
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        return dict((disk, [getattr(io, f) for f in DISK_FIELDS])
+                    for disk, io in counters.items() if disk in self._disks)
+
+    def sample(self):
+        """Take one sample and add it to the ring buffer."""
+        now = time.time()
+        sample = {
+            't': round(now, 3),
+            'load': list(os.getloadavg()),
+            'processes': self._sample_processes(now),
+            'disks': self._sample_disks(),
+        }
+        try:
+            vms = self._sample_vms()
+        except self._virt.libvirtError as e:
+            # keep the processes and disks of this sample
+            self.logger.warning('sampling vms failed: {}'.format(e))
+            vms = None
+        if vms is not None:
+            sample['vms'] = vms
+        for group in ('disks', 'vms'):
+            if group in sample:
+                self._first.setdefault(group, (now, sample[group]))
+                self._last[group] = (now, sample[group])
+        self._loads.add(sample['load'][0])
+        self.samples.append(sample)
+        self.count += 1
+        return sample
+
+    def _run(self):
+        while True:
+            wall = time.time()
+            cpu = thread_cpu_seconds()
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.warning('sample failed: {}'.format(e))
+            cpu = thread_cpu_seconds() - cpu
+            self._cpu_times.add(cpu)
+            self._wall_times.add(time.time() - wall)
+            if (cpu > self.interval * self.max_overhead and
+                    self.interval < MAX_INTERVAL):
+                self.interval = min(MAX_INTERVAL, self.interval * 2)
+                self.backoffs += 1
+                self.logger.info(
+                    'sampling took {:.4f}s cpu, interval now {}s'.format(
+                        cpu, self.interval))
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """Start sampling in a background thread."""
+        self._disks = _mounted_disks()
+        self._open_libvirt()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run,
+                                        name='experiment-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling after a last sample of the final counters."""
+        if self._thread is None:
+            # start() failed
+            return
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        self.stopped = time.time()
+        if self._libvirt is not None:
+            self._libvirt.close()
+
+    def rates(self):
+        """Return the deltas and rates of the counters over the run.
+
+        The processes were all started by the experiment, their cpu time
+        is counted from their creation up to the last sample seeing them.
+        """
+        processes = {}
+        for pid, (name, created, seen, cpu, rss) in sorted(
+                list(self._finished) + list(self._process_stats.items())):
+            processes[str(pid)] = {
+                'name': name,
+                'cpu_s': round(cpu, 3),
+                'cpu_utilization': _rate(0, cpu, seen - created),
+                'peak_rss_kb': rss,
+            }
+        rates = {'processes': processes}
+        if self._dropped['processes']:
+            rates['dropped_processes'] = dict(
+                self._dropped, cpu_s=round(self._dropped['cpu_s'], 3))
+        if 'disks' in self._first:
+            (t0, first), (t1, last) = self._first['disks'], self._last['disks']
+            disks = {}
+            for disk in sorted(set(first) & set(last)):
+                delta = [b - a for a, b in zip(first[disk], last[disk])]
+                disks[disk] = dict(zip(DISK_FIELDS, delta))
+                disks[disk]['read_bytes_per_s'] = _rate(0, delta[0], t1 - t0)
+                disks[disk]['write_bytes_per_s'] = _rate(0, delta[1], t1 - t0)
+                disks[disk]['ops_per_s'] = _rate(
+                    0, delta[2] + delta[3], t1 - t0)
+            rates['disks'] = disks
+        if 'vms' in self._first:
+            (t0, first), (t1, last) = self._first['vms'], self._last['vms']
+            # cpu_time is in nanoseconds
+            rates['vms'] = dict(
+                (name, {'cpu_s': round((last[name] - first[name]) / 1e9, 3),
+                        'cpus_used': _rate(first[name] / 1e9,
+                                           last[name] / 1e9, t1 - t0)})
+                for name in sorted(set(first) & set(last)))
+        if self._loads.count:
+            rates['load_1m'] = {
+                'min': self._loads.min,
+                'max': self._loads.max,
+                'mean': round(self._loads.mean(), 3),
+            }
+        return rates
+
+    def overhead(self):
+        """Return what the sampling itself cost."""
+        run = (self.stopped or time.time()) - self.started
+        cpu = self._cpu_times.total
+        walls = self._wall_times
+        return {
+            'samples': self.count,
+            'kept': len(self.samples),
+            'interval_s': self.interval,
+            'backoffs': self.backoffs,
+            'max_overhead': self.max_overhead,
+            'cpu_s': round(cpu, 6),
+            'share': round(cpu / run, 6) if run > 0 else None,
+            'mean_sample_s': round(walls.mean(), 6) if walls.count else None,
+            'max_sample_s': round(walls.max, 6) if walls.count else None,
+        }
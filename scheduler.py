@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Run collector probes concurrently with a deadline per probe."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-10
+
+import os
+import signal
+import time
+import logging
+import threading
+import traceback
+import multiprocessing
+from instrument import ProbeMeter
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+def error_marker(section, kind, message, timeout=None):
+    """Build the marker stored in place of a section that failed."""
+    marker = {'probe': section, 'type': kind, 'message': message}
+    if timeout is not None:
+        marker['timeout'] = timeout
+    return {'_error': marker}
+
+
+def _run_probe(section, func, args, done, profile=False):
+    """Run one probe and report the outcome and its stats to done."""
+    meter = ProbeMeter(profile)
+    try:
+        with meter:
+            value = func(*args)
+        done.put((section, True, value, meter.stats, meter.profile))
+    except Exception as e:
+        done.put((section, False, '{}: {}\n{}'.format(
+            type(e).__name__, e, traceback.format_exc()),
+            meter.stats, meter.profile))
+
+
+def _run_probe_in_group(section, func, args, done, profile=False):
+    """Run one probe in its own process group so it can be killed."""
+    os.setpgrp()
+    _run_probe(section, func, args, done, profile)
+
+
+class ProbeScheduler(object):
+    """Runs independent probes in a thread or process pool."""
+
+    def __init__(self, workers=4, timeout=60, mode='thread', timeouts=None):
+        """Class init.
+
+        workers     number of probes running at the same time
+        timeout     default deadline in seconds for one probe
+        mode        'thread' or 'process'; only processes can be cancelled,
+                    a timed out thread is abandoned and left to finish
+        timeouts    dict of per probe deadlines overriding timeout
+        """
+        self.logger = self._get_logger()
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.mode = mode
+        self.timeouts = timeouts or {}
+
+    def _get_logger(self):
+        """Setup the global logger."""
+        logger = logging.getLogger(__name__)
+
+        logger.setLevel(logging.INFO)
+        # create console handler with a higher log level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        # create formatter and add it to the handlers
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch.setFormatter(formatter)
+        # add the handlers to the logger
+        logger.addHandler(ch)
+        logger.debug('Logger setup complete. Start Program ... ')
+        return logger
+
+    def _start(self, section, func, args, done, profile=False):
+        """Start a probe in a new thread or process."""
+        if self.mode == 'process':
+            worker = multiprocessing.Process(
+                target=_run_probe_in_group,
+                args=(section, func, args, done, profile))
+        else:
+            worker = threading.Thread(
+                target=_run_probe,
+                args=(section, func, args, done, profile))
+        worker.daemon = True
+        worker.start()
+        return worker
+
+    def _cancel(self, worker):
+        """Stop a probe that ran out of time."""
+        if self.mode != 'process':
+            return
+        try:
+            # kill the whole group to also catch helpers like mpirun
+            os.killpg(worker.pid, signal.SIGKILL)
+        except OSError:
+            # the probe did not run setpgrp yet, its group does not exist
+            try:
+                os.kill(worker.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        worker.join(1)
+
+    def run(self, probes, stats=None, profiles=None):
+        """Run probes and return a dict of section to result.
+
+        probes is a list of (section, callable, args) tuples. A probe that
+        raises or misses its deadline gets an error marker as its section,
+        all other sections are returned as usual. The measurements of
+        every probe are stored in the dict stats by section, with profiles
+        every probe is profiled and its stats appended to the list.
+        """
+        if stats is None:
+            stats = {}
+        if self.mode == 'process':
+            done = multiprocessing.Queue()
+        else:
+            done = queue.Queue()
+        pending = list(probes)
+        pending.reverse()
+        running = {}
+        results = {}
+
+        while pending or running:
+            while pending and len(running) < self.workers:
+                section, func, args = pending.pop()
+                deadline = time.time() + self.timeouts.get(
+                    section, self.timeout)
+                running[section] = (
+                    self._start(section, func, args, done,
+                                profiles is not None), deadline)
+
+            next_deadline = min(d for _, d in running.values())
+            try:
+                section, ok, payload, measured, profile = done.get(
+                    timeout=max(0, next_deadline - time.time()))
+            except queue.Empty:
+                section = None
+            if section in running:
+                worker = running.pop(section)[0]
+                if self.mode == 'process':
+                    worker.join()
+                stats[section] = dict(
+                    measured, status='ok' if ok else 'exception')
+                if profile is not None and profiles is not None:
+                    profiles.append(profile)
+                if ok:
+                    results[section] = payload
+                else:
+                    message = payload.split('\n')[0]
+                    self.logger.warning(
+                        'probe {} failed: {}'.format(section, message))
+                    self.logger.debug(payload)
+                    results[section] = error_marker(
+                        section, 'exception', message)
+
+            now = time.time()
+            for section, (worker, deadline) in list(running.items()):
+                if deadline <= now:
+                    timeout = self.timeouts.get(section, self.timeout)
+                    self.logger.warning(
+                        'probe {} timed out after {}s'.format(
+                            section, timeout))
+                    self._cancel(worker)
+                    del running[section]
+                    stats[section] = {'status': 'timeout', 'wall_s': timeout}
+                    results[section] = error_marker(
+                        section, 'timeout',
+                        'no result within {}s'.format(timeout), timeout)
+        return results
+
+
+def parse_timeouts(values):
+    """Parse NAME=SECONDS pairs as given on the command line.
+
+    Raises ValueError for a pair without name or with seconds that are
+    not a positive number.
+    """
+    timeouts = {}
+    for value in values:
+        name, _, seconds = value.partition('=')
+        name = name.strip()
+        try:
+            seconds = float(seconds)
+        except ValueError:
+            seconds = 0
+        if not name or not seconds > 0:
+            raise ValueError(
+                '{} is no NAME=SECONDS pair with positive seconds'.format(
+                    value))
+        timeouts[name] = seconds
+    return timeouts
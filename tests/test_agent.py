@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import agent  # noqa
+from agent import (UnixHTTPServer, AgentRequestHandler, private_dir,  # noqa
+                   remove_stale_socket)
+
+
+class SocketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def path(self, *names):
+        return os.path.join(self.work_dir, *names)
+
+    def test_socket_is_private(self):
+        server = UnixHTTPServer(self.path('agent.sock'), AgentRequestHandler)
+        try:
+            mode = os.lstat(self.path('agent.sock')).st_mode
+            self.assertTrue(stat.S_ISSOCK(mode))
+            self.assertEqual(stat.S_IMODE(mode), 0o600)
+        finally:
+            server.server_close()
+        remove_stale_socket(self.path('agent.sock'))
+        self.assertFalse(os.path.exists(self.path('agent.sock')))
+
+    def test_other_files_are_kept(self):
+        with open(self.path('agent.sock'), 'w') as fp:
+            fp.write('data')
+        self.assertRaises(OSError, remove_stale_socket,
+                          self.path('agent.sock'))
+        self.assertTrue(os.path.exists(self.path('agent.sock')))
+
+    def test_private_dir(self):
+        private_dir(self.path('run', 'nmc'))
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.path('run', 'nmc')).st_mode), 0o700)
+        os.chmod(self.path('run', 'nmc'), 0o755)
+        self.assertRaises(OSError, private_dir, self.path('run', 'nmc'))
+
+    def test_cli_rejects_malformed_interval(self):
+        result = CliRunner().invoke(agent.main, ['--interval', 'processes'])
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn('NAME=SECONDS', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from cache import FileCache, file_key  # noqa
+from probes import Probe  # noqa
+from users import local_only, nss_sources  # noqa
+
+NSSWITCH = """# /etc/nsswitch.conf
+passwd:         files sss
+group:          files [NOTFOUND=return] sss  # groups of the cluster
+shadow:         files
+"""
+
+
+class FakeCollector(object):
+    """Stands in for the Collector a probe is run for."""
+
+    def __init__(self, cache, local):
+        self.cache = cache
+        self.local = local
+        self.calls = 0
+
+    def read(self, path):
+        self.calls += 1
+        with open(path) as fp:
+            return fp.read()
+
+    def is_local(self):
+        return self.local
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.work_dir = tempfile.mkdtemp()
+        self.cache = FileCache(os.path.join(self.work_dir, 'cache'))
+        self.source = os.path.join(self.work_dir, 'source')
+        self.write_source('first', 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        logging.disable(logging.NOTSET)
+
+    def write_source(self, text, mtime):
+        with open(self.source, 'w') as fp:
+            fp.write(text)
+        os.utime(self.source, (mtime, mtime))
+
+    def test_invalidated_on_mtime_change(self):
+        coll = FakeCollector(self.cache, True)
+
+        def read():
+            return self.cache.cached('source', file_key(self.source),
+                                     coll.read, self.source)
+        self.assertEqual(read(), 'first')
+        self.assertEqual(read(), 'first')
+        self.assertEqual(coll.calls, 1)
+        # same size, only the mtime tells the content changed
+        self.write_source('again', 2000)
+        self.assertEqual(read(), 'again')
+        self.assertEqual(coll.calls, 2)
+
+    def test_probe_skips_cache_for_remote_sources(self):
+        probe = Probe('source', 'read', args=[self.source], static=True,
+                      cache_files=[self.source], cache_if='is_local')
+        coll = FakeCollector(self.cache, False)
+        task = probe.task(coll)
+        self.assertEqual(task(self.source), 'first')
+        self.assertEqual(task(self.source), 'first')
+        self.assertEqual(coll.calls, 2)
+        coll.local = True
+        task(self.source)
+        task(self.source)
+        self.assertEqual(coll.calls, 3)
+
+    def test_nss_sources(self):
+        nsswitch = os.path.join(self.work_dir, 'nsswitch.conf')
+        with open(nsswitch, 'w') as fp:
+            fp.write(NSSWITCH)
+        self.assertEqual(nss_sources('group', nsswitch), ['files', 'sss'])
+        self.assertEqual(nss_sources('shadow', nsswitch), ['files'])
+        self.assertFalse(local_only('nss', nsswitch))
+        self.assertTrue(local_only('files', nsswitch))
+        missing = os.path.join(self.work_dir, 'missing')
+        self.assertEqual(nss_sources('passwd', missing), ['files'])
+        self.assertTrue(local_only('nss', missing))
+
+
+if __name__ == '__main__':
+    unittest.main()
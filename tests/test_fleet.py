@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import unittest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import inventory  # noqa
+from fleet import (LOCAL_COMMAND, FleetCollector, LocalTransport,  # noqa
+                   fleet_stats, read_hosts)
+
+# stands in for the collector, the host name decides how it behaves
+FAKE_COLLECTOR = """import sys, json, subprocess
+host = sys.argv[1]
+if host == 'broken':
+    sys.stderr.write('no route to host\\n')
+    sys.exit(255)
+if host == 'hanging':
+    # a child holding the pipes has to be killed as well
+    subprocess.call(['sleep', '30'])
+if host == 'garbled':
+    print('Welcome to node garbled')
+    sys.exit(0)
+print(json.dumps({host.split('.')[0]: {'comment': host}}))
+"""
+
+
+class LocalTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        # failed hosts are logged as warnings
+        logging.disable(logging.WARNING)
+        self.work_dir = tempfile.mkdtemp()
+        self.script = self.path('collector.py')
+        with open(self.script, 'w') as fp:
+            fp.write(FAKE_COLLECTOR)
+        self.command = [sys.executable, self.script, '{host}']
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.work_dir)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def collect(self, hosts, command=None, **kwargs):
+        fleet = FleetCollector(LocalTransport(command or self.command),
+                               retry_delay=0, **kwargs)
+        return dict((r.host, r) for r in fleet.collect(hosts))
+
+    def test_collects_hosts(self):
+        results = self.collect(['node1.example.com', 'node2'], concurrency=2)
+        result = results['node1.example.com']
+        self.assertEqual((result.hostname, result.document, result.error),
+                         ('node1', {'comment': 'node1.example.com'}, None))
+        self.assertEqual(results['node2'].attempts, 1)
+        stats = fleet_stats(list(results.values()))
+        self.assertEqual((stats['hosts'], stats['ok'], stats['failed']),
+                         (2, 2, {}))
+
+    def test_failed_hosts_are_retried(self):
+        results = self.collect(['broken', 'garbled', 'node1'], retries=2)
+        self.assertEqual(results['broken'].error,
+                         'exit status 255: no route to host')
+        self.assertEqual(results['broken'].attempts, 3)
+        self.assertTrue(results['garbled'].error.startswith(
+            'invalid output'))
+        stats = fleet_stats(list(results.values()))
+        self.assertEqual(sorted(stats['failed']), ['broken', 'garbled'])
+        self.assertEqual(stats['retried'], ['broken', 'garbled'])
+
+    def test_timeout_kills_the_process_group(self):
+        start = time.time()
+        results = self.collect(['hanging'], timeout=0.5, retries=0)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(results['hanging'].error, 'timed out after 0.5s')
+
+    def test_collector_command(self):
+        # the default command runs collectMetadata.py of this checkout
+        results = self.collect(['localhost'], command=LOCAL_COMMAND,
+                               retries=0)
+        result = results['localhost']
+        self.assertIsNone(result.error)
+        self.assertIn('collection_time', result.document)
+
+    def test_read_hosts(self):
+        hosts_path = self.path('hosts')
+        with open(hosts_path, 'w') as fp:
+            fp.write('# rack 1\nnode1\nnode2  # spare\n\nnode1\n')
+        self.assertEqual(read_hosts(hosts_path), ['node1', 'node2'])
+
+    def test_inventory_collect_fleet(self):
+        hosts_path = self.path('hosts')
+        with open(hosts_path, 'w') as fp:
+            fp.write('node1.example.com\nnode2\n')
+        out_path = self.path('fleet.json')
+        result = CliRunner().invoke(inventory.main, [
+            '-d', self.path('db.json'), '--collect_fleet', hosts_path,
+            '--transport', 'local', '--fleet_command',
+            ' '.join(self.command), '-o', out_path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(out_path) as fp:
+            self.assertEqual(sorted(json.load(fp)), ['node1', 'node2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
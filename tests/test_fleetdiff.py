@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import inventory  # noqa
+from fleetgen import FleetGenerator  # noqa
+from fleetdiff import FleetDiff, REMOVED, format_path  # noqa
+
+# even hosts are of the first variant, odd hosts of the second
+EVEN = ['node00000', 'node00002', 'node00004']
+ODD = ['node00001', 'node00003', 'node00005']
+
+
+def _fleet(seed=0):
+    return FleetGenerator(packages=20, processes=5, users=3, variants=2,
+                          seed=seed)
+
+
+class FleetDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = _fleet()
+        _, self.reference = self.generator.document(0)
+
+    def test_variants_form_classes(self):
+        diff = FleetDiff(self.reference, ['cpu', 'packages', 'users'])
+        found = dict((host, diff.compare(host, document))
+                     for host, document in self.generator.hosts(6))
+        for host in EVEN:
+            self.assertEqual(found[host], [])
+        self.assertIn((('cpu', 'count'), 'changed'), found['node00001'])
+        self.assertEqual(set(p[0] for p, _ in found['node00001']),
+                         set(['cpu', 'packages']))
+        self.assertEqual(dict(diff.section_classes()), {
+            'cpu': [('reference', EVEN), ('other', ODD)],
+            'packages': [('reference', EVEN), ('other', ODD)],
+            'users': [('reference', sorted(EVEN + ODD))],
+        })
+
+    def test_fleets_of_two_seeds(self):
+        # the variants are the same, only the per host values differ
+        diff = FleetDiff(self.reference)
+        _, other = _fleet(seed=1).document(0)
+        sections = set(p[0] for p, _ in diff.compare('node00000', other))
+        self.assertIn('processes', sections)
+        self.assertIn('collection_time', sections)
+        self.assertFalse(sections & set(['cpu', 'packages', 'users', 'mpi']))
+
+    def test_missing_section(self):
+        diff = FleetDiff(self.reference, ['mpi'])
+        hostname, document = self.generator.document(2)
+        del document['mpi']
+        self.assertEqual(diff.compare(hostname, document),
+                         [(('mpi', ), REMOVED)])
+        diff.compare('node00000', self.reference)
+        self.assertEqual(diff.section_classes(), [
+            ('mpi', [('reference', ['node00000']),
+                     ('missing', ['node00002'])])])
+
+    def test_inventory_diff(self):
+        logging.disable(logging.INFO)
+        work_dir = tempfile.mkdtemp()
+        try:
+            db = os.path.join(work_dir, 'fleet.json')
+            with open(db, 'w') as fp:
+                json.dump(dict(self.generator.hosts(6)), fp)
+            result = CliRunner().invoke(inventory.main, [
+                '-d', db, '--diff', 'node00000', '-s', 'cpu'])
+        finally:
+            logging.disable(logging.NOTSET)
+            shutil.rmtree(work_dir)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Section: cpu Classes: 2', result.output)
+        self.assertIn('node00003: {} changed'.format(
+            format_path(('cpu', 'count'))), result.output)
+        self.assertIn('Hosts equal to node00000: 2', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from history import HistoryStore, CHECKPOINT_PREFIX  # noqa
+
+
+def _snapshot(i):
+    """Document of run i, packages change every run, cpu never."""
+    document = {'cpu': {'count': 16}, 'packages': {'openmpi': '1.10.{}'.format(
+        i)}}
+    if i % 2:
+        document['comment'] = 'odd run {}'.format(i)
+    return document
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.store = HistoryStore(self.work_dir, compact_every=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_replay_across_checkpoints(self):
+        for i in range(8):
+            self.assertTrue(self.store.append('node1.example.com',
+                                              _snapshot(i), 100.0 + i))
+        host_dir = os.path.join(self.work_dir, 'node1.example.com')
+        self.assertEqual(len([n for n in os.listdir(host_dir)
+                              if n.startswith(CHECKPOINT_PREFIX)]), 2)
+        self.assertEqual(self.store.hosts(), ['node1.example.com'])
+        for i in range(8):
+            self.assertEqual(
+                self.store.state_at('node1.example.com', 100.5 + i),
+                _snapshot(i))
+        self.assertEqual(self.store.state_at('node1.example.com', 99), {})
+        self.assertEqual(
+            self.store.value_at('node1.example.com', 'packages', 104),
+            {'openmpi': '1.10.4'})
+        self.assertEqual(
+            list(self.store.changes_since('node1.example.com', 'comment',
+                                          102.5)),
+            [(103.0, 'odd run 3'), (104.0, None), (105.0, 'odd run 5'),
+             (106.0, None), (107.0, 'odd run 7')])
+
+    def test_unchanged_snapshot_is_not_written(self):
+        self.assertTrue(self.store.append('node2', _snapshot(0), 100.0))
+        self.assertFalse(self.store.append('node2', _snapshot(0), 101.0))
+
+    def test_time_must_grow(self):
+        self.store.append('node2', _snapshot(0), 100.0)
+        self.assertRaises(ValueError, self.store.append, 'node2',
+                          _snapshot(1), 100.0)
+
+    def test_clock_step_is_clamped(self):
+        future = 4e9
+        self.store.append('node2', _snapshot(0), future)
+        self.assertTrue(self.store.append('node2', _snapshot(1)))
+        self.assertEqual(self.store.state_at('node2', future + 1),
+                         _snapshot(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from instrument import ProbeMeter, check_output, prometheus_text  # noqa
+
+
+def _spawn(times):
+    for _ in range(times):
+        check_output(['true'])
+
+
+class ProbeMeterTest(unittest.TestCase):
+
+    def test_counts_subprocesses_of_the_thread(self):
+        other = threading.Thread(target=_spawn, args=(3, ))
+        meter = ProbeMeter()
+        with meter:
+            other.start()
+            _spawn(2)
+            other.join()
+        self.assertEqual(meter.stats['subprocesses'], 2)
+        self.assertGreaterEqual(meter.stats['process_children_cpu_s'], 0)
+
+    def test_unmeasured_spawns_are_not_counted(self):
+        _spawn(1)
+        meter = ProbeMeter()
+        with meter:
+            pass
+        self.assertEqual(meter.stats['subprocesses'], 0)
+
+    def test_prometheus_text(self):
+        meter = ProbeMeter()
+        with meter:
+            _spawn(1)
+        stats = dict(meter.stats, status='ok')
+        text = prometheus_text('node1', {'probes': {'mpi': stats},
+                                         'wall_s': 0.1})
+        self.assertIn('nmc_probe_subprocesses{host="node1",probe="mpi"} 1',
+                      text)
+        self.assertIn('nmc_probe_process_children_cpu_seconds{', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
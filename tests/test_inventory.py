@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Tests of the inventory.py command line."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import inventory  # noqa
+from valueindex import ValueIndex  # noqa
+
+HOSTS = {
+    'node1.example.com': {'cpu': {'count': 16}, 'comment': 'fqdn'},
+    'node2': {'cpu': {'count': 32}, 'comment': ''},
+}
+
+
+class InventoryTestCase(unittest.TestCase):
+    """Runs inventory.py on databases in a temporary directory."""
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.work_dir)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def write_db(self, name, hosts=HOSTS):
+        db = self.path(name)
+        with open(db, 'w') as fp:
+            json.dump(hosts, fp)
+        return db
+
+    def inventory(self, *args):
+        result = CliRunner().invoke(inventory.main, list(args))
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result.output
+
+
+class ShowTest(InventoryTestCase):
+
+    def test_dotted_host_name(self):
+        for db in (self.write_db('servers.json'),
+                   self.path('servers.sqlite')):
+            if db.endswith('.sqlite'):
+                self.inventory('-d', db, '--import',
+                               self.path('servers.json'))
+            output = self.inventory('-d', db, '-s', 'node1.example.com')
+            self.assertIn('Data for node1.example.com:', output)
+            self.assertIn('"fqdn"', output)
+
+    def test_query(self):
+        db = self.write_db('servers.json')
+        output = self.inventory('-d', db, '-s', 'cpu.count where '
+                                'cpu.count > 20')
+        self.assertIn('Host: node2', output)
+        self.assertNotIn('node1.example.com', output)
+
+
+class ShardedTest(InventoryTestCase):
+
+    def test_value_index_follows_added_hosts(self):
+        db = self.path('servers') + os.sep
+        self.inventory('-d', db, '--import', self.write_db('servers.json'),
+                       '--value_index')
+        index_file = os.path.join(db, 'index.json')
+        # a new database starts with the structure host
+        self.assertEqual(ValueIndex.load(index_file).hosts,
+                         ['node1.example.com', 'node2', 'structure'])
+        self.inventory('-d', db, '--import', self.write_db(
+            'more.json', {'node3': {'cpu': {'count': 16}}}), '--value_index')
+        output = self.inventory('-d', db, '--lookup', 'cpu.count=16')
+        self.assertNotIn('scanning', output)
+        self.assertIn('Hosts with cpu.count=16: 2', output)
+        self.assertIn('node3', output)
+
+    def test_rejects_dedup(self):
+        db = self.path('servers') + os.sep
+        result = CliRunner().invoke(inventory.main, [
+            '-d', db, '--import', self.write_db('servers.json'), '--dedup'])
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('can not be deduplicated', result.output)
+        self.assertEqual(os.listdir(os.path.join(db, 'hosts')),
+                         ['structure.json'])
+
+    def test_rejects_format(self):
+        db = self.path('servers') + os.sep
+        result = CliRunner().invoke(inventory.main, [
+            '-d', db, '--import', self.write_db('servers.json'),
+            '--format', 'gzip'])
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('always written as json', result.output)
+        self.inventory('-d', db, '--import', self.path('servers.json'),
+                       '--format', 'json')
+        self.assertIn('node2.json', os.listdir(os.path.join(db, 'hosts')))
+
+
+class SqliteTest(InventoryTestCase):
+
+    def test_value_index_follows_added_hosts(self):
+        db = self.path('servers.sqlite')
+        self.inventory('-d', db, '--import', self.write_db('servers.json'),
+                       '--value_index')
+        self.assertEqual(ValueIndex.load(db).hosts,
+                         ['node1.example.com', 'node2', 'structure'])
+        self.inventory('-d', db, '--import', self.write_db(
+            'more.json', {'node3': {'cpu': {'count': 16}}}), '--value_index')
+        self.assertEqual(ValueIndex.load(db).hosts,
+                         ['node1.example.com', 'node2', 'node3', 'structure'])
+        output = self.inventory('-d', db, '--lookup', 'cpu.count=16')
+        self.assertIn('Hosts with cpu.count=16: 2', output)
+
+    def test_rejects_dedup(self):
+        db = self.path('servers.sqlite')
+        result = CliRunner().invoke(inventory.main, [
+            '-d', db, '--import', self.write_db('servers.json'), '--dedup'])
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('can not be deduplicated', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
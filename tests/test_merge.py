@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Tests of the merge modes of mergeMetadata.py."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from fleetgen import FleetGenerator  # noqa
+import mergeMetadata  # noqa
+from mergeMetadata import MergeMetadata  # noqa
+from valueindex import ValueIndex, parse_lookup  # noqa
+from formats import decode  # noqa
+from dedup import is_deduplicated, expand  # noqa
+
+
+def _read(file_path):
+    with open(file_path, 'rb') as fp:
+        return fp.read()
+
+
+class MergeTestCase(unittest.TestCase):
+    """Merges a small synthetic fleet in a temporary directory."""
+
+    def setUp(self):
+        # the loggers reset their level whenever a merger is created
+        logging.disable(logging.INFO)
+        self.work_dir = tempfile.mkdtemp()
+        self.node_dir = os.path.join(self.work_dir, 'nodes')
+        FleetGenerator(packages=20, processes=5, users=3).write_files(
+            self.node_dir, 12)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.work_dir)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def merger(self):
+        return MergeMetadata()
+
+    def full_merge(self, out_file, name=None):
+        mm = self.merger()
+        mm.read_files(self.node_dir)
+        if name is None:
+            mm.merge_files()
+        else:
+            mm.merge_files_with_new_root(name)
+        mm.save_new_json(out_file)
+
+
+class IncrementalMergeTest(MergeTestCase):
+
+    def _check_repeated(self, name):
+        full = self.path('full.json')
+        inc = self.path('inc.json')
+        self.full_merge(full, name)
+        self.merger().incremental_merge(self.node_dir, inc, name)
+        stats = self.merger().incremental_merge(self.node_dir, inc, name)
+        self.assertEqual(stats['copied'], 12)
+        self.assertEqual(_read(inc), _read(full))
+        self.merger().incremental_merge(self.node_dir, inc, name)
+        self.assertEqual(_read(inc), _read(full))
+
+    def test_copied_hosts_match_full_merge(self):
+        self._check_repeated(None)
+
+    def test_copied_hosts_match_full_merge_with_root(self):
+        self._check_repeated('fleet')
+
+
+class StreamMergeTest(MergeTestCase):
+
+    def test_matches_full_merge(self):
+        full = self.path('full.json')
+        out = self.path('stream.json')
+        self.full_merge(full)
+        self.assertEqual(self.merger().stream_merge(self.node_dir, out), 12)
+        self.assertEqual(_read(out), _read(full))
+
+    def test_failed_merge_keeps_old_file(self):
+        out = self.path('stream.json')
+        with open(out, 'w') as fp:
+            fp.write('{}')
+
+        class BrokenWriter(mergeMetadata.JsonObjectWriter):
+            def write_text(self, host, text):
+                raise IOError('disk full')
+
+        writer = mergeMetadata.JsonObjectWriter
+        mergeMetadata.JsonObjectWriter = BrokenWriter
+        try:
+            self.assertRaises(IOError, self.merger().stream_merge,
+                              self.node_dir, out)
+        finally:
+            mergeMetadata.JsonObjectWriter = writer
+        self.assertEqual(_read(out), b'{}')
+        self.assertEqual(sorted(os.listdir(self.work_dir)),
+                         ['nodes', 'stream.json'])
+
+
+class ValueIndexMergeTest(MergeTestCase):
+
+    def test_index_lists_the_merged_hosts(self):
+        out = self.path('merge.json')
+        result = CliRunner().invoke(mergeMetadata.main, [
+            '--input_path', self.node_dir, '--out_file', out,
+            '--value_index'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        index = ValueIndex.load(out)
+        self.assertEqual(sorted(index.lookup(parse_lookup('cpu.count=16'))),
+                         ['node00000', 'node00004', 'node00008'])
+
+    def test_cli_rejects_index_under_root(self):
+        out = self.path('merge.json')
+        for mode in ([], ['--stream'], ['--incremental']):
+            result = CliRunner().invoke(mergeMetadata.main, [
+                '--input_path', self.node_dir, '--out_file', out,
+                '--name', 'fleet', '--value_index'] + mode)
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertIn('--value_index', result.output)
+            self.assertFalse(os.path.exists(out))
+
+    def test_merges_reject_index_under_root(self):
+        out = self.path('merge.json')
+        mm = self.merger()
+        mm.value_index = True
+        self.assertRaises(ValueError, mm.stream_merge, self.node_dir, out,
+                          'fleet')
+        self.assertRaises(ValueError, mm.incremental_merge, self.node_dir,
+                          out, 'fleet')
+        mm.read_files(self.node_dir)
+        mm.merge_files_with_new_root('fleet')
+        self.assertRaises(ValueError, mm.save_new_json, out)
+        self.assertFalse(os.path.exists(out))
+
+
+class DedupMergeTest(MergeTestCase):
+
+    def test_cli_writes_deduplicated_layout(self):
+        full = self.path('full.json')
+        out = self.path('dedup.json')
+        self.full_merge(full)
+        result = CliRunner().invoke(mergeMetadata.main, [
+            '--input_path', self.node_dir, '--out_file', out, '--dedup'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        document = decode(_read(out))
+        self.assertTrue(is_deduplicated(document))
+        self.assertEqual(expand(document), decode(_read(full)))
+
+    def test_cli_rejects_dedup_with_stream_or_root(self):
+        out = self.path('dedup.json')
+        for extra in (['--stream'], ['--incremental'], ['--name', 'fleet']):
+            result = CliRunner().invoke(mergeMetadata.main, [
+                '--input_path', self.node_dir, '--out_file', out,
+                '--dedup'] + extra)
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertFalse(os.path.exists(out))
+
+
+class ColumnsMergeTest(MergeTestCase):
+
+    def test_cli_writes_tables_without_out_file(self):
+        out_dir = self.path('tables')
+        result = CliRunner().invoke(mergeMetadata.main, [
+            '--input_path', self.node_dir, '--columns', out_dir,
+            '--tables', 'hosts,packages'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(sorted(os.listdir(out_dir)),
+                         ['hosts.csv', 'packages.csv'])
+        with open(os.path.join(out_dir, 'hosts.csv')) as fp:
+            self.assertEqual(len(fp.read().splitlines()), 13)
+
+    def test_cli_needs_out_file_or_columns(self):
+        result = CliRunner().invoke(mergeMetadata.main, [
+            '--input_path', self.node_dir])
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn('--out_file', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import packages  # noqa
+
+STATUS = """Package: libc6
+Status: install ok installed
+Architecture: i386
+Version: 2.24-11
+Description: GNU C Library: Shared libraries
+ Contains the standard libraries that are used by nearly all programs.
+
+Package: vim
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 2:8.0.0197-4
+
+Package: openmpi-bin
+Status: install ok installed
+Architecture: amd64
+Version: 2.0.2-2
+Depends: libc6 (>= 2.14), openmpi-common
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.24-11+deb9u1
+"""
+
+
+class DpkgStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write_status(self, stanzas):
+        path = os.path.join(self.work_dir, 'status')
+        with open(path, 'w') as fp:
+            fp.write('\n\n'.join(s.strip() for s in stanzas))
+        return path
+
+    def test_installed_packages(self):
+        status_path = self.write_status([STATUS])
+        self.assertEqual(packages.read_dpkg_status(status_path),
+                         {'libc6': '2.24-11+deb9u1',
+                          'libc6:i386': '2.24-11',
+                          'openmpi-bin': '2.0.2-2'})
+
+    def test_multi_arch_names_do_not_depend_on_order(self):
+        stanzas = STATUS.split('\n\n')
+        expected = packages.read_dpkg_status(self.write_status(stanzas))
+        stanzas.reverse()
+        self.assertEqual(packages.read_dpkg_status(self.write_status(stanzas)),
+                         expected)
+
+
+class RpmDbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.check_output = packages.check_output
+
+    def tearDown(self):
+        packages.check_output = self.check_output
+
+    def test_non_ascii_output(self):
+        packages.check_output = lambda args: (
+            b'bash\t4.2.46-30.el7\nlibf\xc3\xbc\t1.0-1\nbad\xff\t2.0-1\n')
+        pkg_list = packages.read_rpm_db()
+        self.assertEqual(pkg_list['bash'], u'4.2.46-30.el7')
+        self.assertEqual(pkg_list[u'libf\xfc'], u'1.0-1')
+        self.assertEqual(pkg_list[u'bad\ufffd'], u'2.0-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
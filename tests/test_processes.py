@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from distutils.spawn import find_executable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from processes import ProcessSnapshot  # noqa
+
+try:
+    import psutil  # noqa
+except ImportError:
+    psutil = None
+
+# longer than the 15 characters the kernel keeps of a command name
+LONG_NAME = 'nmc-test-sleeper-with-a-long-name'
+ATTRS = ['pid', 'name', 'ppid', 'cmdline', 'status', 'nice', 'num_threads']
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'no /proc file system')
+class ProcBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        executable = os.path.join(self.work_dir, LONG_NAME)
+        shutil.copy(find_executable('sleep'), executable)
+        self.proc = subprocess.Popen([executable, '30', '0.5'])
+
+    def tearDown(self):
+        self.proc.kill()
+        self.proc.wait()
+        shutil.rmtree(self.work_dir)
+
+    def snapshot(self, backend):
+        found = [p for p in ProcessSnapshot(ATTRS, backend, name='^nmc-test')
+                 if p['pid'] == self.proc.pid]
+        self.assertEqual(len(found), 1)
+        return found[0]
+
+    def test_long_name_and_cmdline(self):
+        info = self.snapshot('proc')
+        self.assertEqual(info['name'], LONG_NAME)
+        self.assertEqual(info['cmdline'][1:], ['30', '0.5'])
+        self.assertEqual(info['ppid'], os.getpid())
+
+    @unittest.skipIf(psutil is None, 'psutil can not be imported')
+    def test_backends_agree(self):
+        self.assertEqual(self.snapshot('proc'), self.snapshot('psutil'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import time
+import logging
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sampler import RunningStats, Sampler  # noqa
+
+
+class SamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_running_stats(self):
+        stats = RunningStats()
+        self.assertIsNone(stats.mean())
+        for value in (3, 1, 2):
+            stats.add(value)
+        self.assertEqual((stats.count, stats.min, stats.max, stats.mean()),
+                         (3, 1, 3, 2.0))
+
+    def test_finished_processes_are_bounded(self):
+        sampler = Sampler(os.getpid(), size=2)
+        for pid in range(5):
+            sampler._process_stats[pid] = ['p', 0.0, 1.0, 1.0, 10 * pid]
+            sampler._finish(pid)
+        rates = sampler.rates()
+        self.assertEqual(sorted(rates['processes']), ['3', '4'])
+        self.assertEqual(rates['dropped_processes'],
+                         {'processes': 3, 'cpu_s': 3.0, 'peak_rss_kb': 20})
+
+    def test_samples_a_command(self):
+        proc = subprocess.Popen(['sleep', '0.5'])
+        sampler = Sampler(proc.pid, interval=0.05, size=3, max_overhead=1)
+        sampler.start()
+        proc.wait()
+        sampler.stop()
+        self.assertLessEqual(len(sampler.samples), 3)
+        overhead = sampler.overhead()
+        self.assertEqual(overhead['samples'], sampler.count)
+        self.assertGreater(overhead['samples'], 3)
+        self.assertEqual(sampler.rates()['processes'][str(proc.pid)]['name'],
+                         'sleep')
+
+
+if __name__ == '__main__':
+    unittest.main()
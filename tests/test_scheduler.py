@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import time
+import logging
+import unittest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import collectMetadata  # noqa
+from scheduler import ProbeScheduler, error_marker, parse_timeouts  # noqa
+
+
+def _value(value):
+    return value
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return 'late'
+
+
+def _fail():
+    raise RuntimeError('probe broke')
+
+
+class ProbeSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _run(self, mode):
+        stats = {}
+        scheduler = ProbeScheduler(workers=3, timeout=5, mode=mode,
+                                   timeouts={'slow': 0.2})
+        start = time.time()
+        results = scheduler.run([('fast', _value, (1, )),
+                                 ('slow', _sleep, (3, )),
+                                 ('broken', _fail, ())], stats)
+        self.assertLess(time.time() - start, 2)
+        return results, stats
+
+    def _check(self, results, stats):
+        self.assertEqual(results['fast'], 1)
+        self.assertEqual(results['slow'], error_marker(
+            'slow', 'timeout', 'no result within 0.2s', 0.2))
+        marker = results['broken']['_error']
+        self.assertEqual(marker['type'], 'exception')
+        self.assertEqual(marker['message'], 'RuntimeError: probe broke')
+        self.assertEqual(stats['fast']['status'], 'ok')
+        self.assertEqual(stats['slow']['status'], 'timeout')
+        self.assertEqual(stats['broken']['status'], 'exception')
+
+    def test_thread_timeout_and_error_marker(self):
+        self._check(*self._run('thread'))
+
+    def test_process_timeout_kills_probe(self):
+        self._check(*self._run('process'))
+
+
+class ParseTimeoutsTest(unittest.TestCase):
+
+    def test_pairs(self):
+        self.assertEqual(parse_timeouts(['mpi=5', 'vms = 0.5']),
+                         {'mpi': 5.0, 'vms': 0.5})
+
+    def test_rejects_malformed_pairs(self):
+        for value in ('mpi', 'mpi=', '=5', 'mpi=soon', 'mpi=0', 'mpi=-1'):
+            self.assertRaises(ValueError, parse_timeouts, [value])
+
+    def test_cli_reports_bad_parameter(self):
+        result = CliRunner().invoke(collectMetadata.main,
+                                    ['--probe_timeout', 'mpi'])
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn('NAME=SECONDS', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import grp
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from users import get_entries, resolve_users  # noqa
+
+PASSWD = """root:x:0:0:root:/root:/bin/bash
+alice:x:1000:1000:Alice:/home/alice:/bin/bash
+bob:x:1001:0:Bob:/home/bob:/bin/bash
+carol:x:1002:4242424:Carol:/home/carol:/bin/bash
+daemon:x:1:1:daemon:/usr/sbin:/usr/sbin/nologin
+"""
+# the primary groups of bob and carol are not listed, like on LDAP hosts
+# without enumeration
+GROUP = """alice:x:1000:
+hpc:x:2000:alice,bob
+"""
+
+
+class ResolveUsersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.passwd = os.path.join(self.work_dir, 'passwd')
+        self.group = os.path.join(self.work_dir, 'group')
+        with open(self.passwd, 'w') as fp:
+            fp.write(PASSWD)
+        with open(self.group, 'w') as fp:
+            fp.write(GROUP)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_primary_group_missing_from_group_list(self):
+        users, scanned = resolve_users(
+            *get_entries('files', self.passwd, self.group))
+        self.assertEqual(scanned, {'passwd': 5, 'group': 2})
+        self.assertEqual(users, {
+            'alice': ['alice', 'hpc'],
+            # looked up by gid through the name service
+            'bob': [grp.getgrgid(0).gr_name, 'hpc'],
+            # a gid without any group stays a number
+            'carol': ['4242424'],
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
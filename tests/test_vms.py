@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-06-06
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from vms import collect_domains  # noqa
+
+try:
+    import libvirt  # noqa
+except ImportError:
+    libvirt = None
+
+# the test driver runs one domain named test
+TEST_URI = 'test:///default'
+
+
+@unittest.skipIf(libvirt is None, 'libvirt can not be imported')
+class CollectDomainsTest(unittest.TestCase):
+
+    def test_default_domain(self):
+        result = collect_domains(TEST_URI)
+        self.assertEqual(sorted(result), ['active_vms', 'inactive_vms'])
+        self.assertNotIn('test', result['inactive_vms'])
+        entry = result['active_vms']['test']
+        self.assertEqual(entry['infos']['state'],
+                         libvirt.VIR_DOMAIN_RUNNING)
+        self.assertGreater(entry['infos']['nb_virt_cpu'], 0)
+        self.assertIsNotNone(entry['infos']['cpu_time'])
+        self.assertEqual(sorted(entry), ['id', 'infos', 'os_type'])
+
+    def test_details(self):
+        entry = collect_domains(TEST_URI, ['vcpu'])['active_vms']['test']
+        self.assertIsInstance(entry['vcpu'], list)
+
+
+if __name__ == '__main__':
+    unittest.main()
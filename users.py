@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Resolve the login users of a host and the groups they are in."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-20
+
+PASSWD = '/etc/passwd'
+GROUP = '/etc/group'
+NSSWITCH = '/etc/nsswitch.conf'
+# shells of accounts that are not allowed/capable to login
+NOLOGIN_SHELLS = ('/bin/false', '/usr/sbin/nologin')
+
+
+def iter_passwd_file(passwd_path=PASSWD):
+    """Stream passwd entries as (name, passwd, uid, gid, gecos, dir, shell)."""
+    with open(passwd_path) as fp:
+        for line in fp:
+            fields = line.rstrip('\n').split(':')
+            if len(fields) < 7 or line.startswith(('#', '+', '-')):
+                continue
+            yield (fields[0], fields[1], int(fields[2]), int(fields[3]),
+                   fields[4], fields[5], fields[6])
+
+
+def iter_group_file(group_path=GROUP):
+    """Stream group entries as (name, passwd, gid, members)."""
+    with open(group_path) as fp:
+        for line in fp:
+            fields = line.rstrip('\n').split(':')
+            if len(fields) < 4 or line.startswith(('#', '+', '-')):
+                continue
+            members = fields[3].split(',') if fields[3] else []
+            yield (fields[0], fields[1], int(fields[2]), members)
+
+
+def get_entries(source, passwd_path=PASSWD, group_path=GROUP):
+    """Return (passwd entries, group entries) of a source.
+
+    'files' only reads the local files and never asks a directory server,
+    'nss' enumerates everything the name service switch knows, including
+    LDAP/SSSD if enumeration is enabled there.
+    """
+    if source == 'files':
+        return iter_passwd_file(passwd_path), iter_group_file(group_path)
+    if source == 'nss':
+        import pwd
+        import grp
+        return pwd.getpwall(), grp.getgrall()
+    raise ValueError('unknown user source: {}'.format(source))
+
+
+def nss_sources(database, nsswitch_path=NSSWITCH):
+    """Return the sources the name service switch uses for database.
+
+    Actions like [NOTFOUND=return] are left out. Without a nsswitch.conf
+    only the local files are used.
+    """
+    try:
+        with open(nsswitch_path) as fp:
+            for line in fp:
+                name, _, sources = line.split('#', 1)[0].partition(':')
+                if name.strip() == database:
+                    return [s for s in sources.split()
+                            if not s.startswith('[')]
+    except IOError:
+        pass
+    return ['files']
+
+
+def local_only(source, nsswitch_path=NSSWITCH):
+    """Test if the users of source only come from /etc/passwd and group."""
+    if source == 'files':
+        return True
+    return all(nss_sources(database, nsswitch_path) == ['files']
+               for database in ('passwd', 'group'))
+
+
+def can_login(user):
+    """Test if a passwd entry is allowed/capable to login."""
+    return (not any(shell in user[6] for shell in NOLOGIN_SHELLS) and
+            '/home' in user[5])
+
+
+def _group_name(gid):
+    """Return the name of the group gid as the name service knows it."""
+    import grp
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
+def resolve_users(passwd_entries, group_entries):
+    """Map every login user to its primary and supplementary groups.
+
+    The groups are read once into a gid to name map and an index from
+    member to the groups it is listed in, so the work grows with the
+    number of entries instead of users times groups times members.
+    A primary group missing from the entries, as with LDAP/SSSD without
+    enumeration, is looked up by its gid, a gid without group is kept as
+    number. Returns the mapping and the number of passwd and group
+    entries seen.
+    """
+    gid_names = {}
+    member_groups = {}
+    group_count = 0
+    for group in group_entries:
+        group_count += 1
+        gid_names.setdefault(group[2], group[0])
+        for member in group[3]:
+            member_groups.setdefault(member, []).append(group[0])
+
+    return_dict = {}
+    user_count = 0
+    for user in passwd_entries:
+        user_count += 1
+        if not can_login(user):
+            continue
+        if user[3] not in gid_names:
+            gid_names[user[3]] = _group_name(user[3])
+        user_group_list = [gid_names[user[3]]]
+        user_group_list.extend(member_groups.get(user[0], []))
+        return_dict[user[0]] = user_group_list
+    return return_dict, {'passwd': user_count, 'group': group_count}
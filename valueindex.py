@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Inverted index from (section, key, value) to the hosts having it."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-05-26
+
+import os
+import json
+import base64
+
+VALUE_INDEX_SUFFIX = '.vidx'
+VALUE_INDEX_VERSION = 1
+SCALARS = (type(None), bool, int, float, str, type(u''))
+try:
+    SCALARS += (long, )
+except NameError:
+    pass
+
+
+def _walk(section, key, value):
+    """Yield the terms of value found at the dotted key path of section."""
+    if isinstance(value, dict):
+        for name, member in value.items():
+            path = '{}.{}'.format(key, name) if key else name
+            yield section, path
+            for term in _walk(section, path, member):
+                yield term
+    elif isinstance(value, list):
+        for item in value:
+            for term in _walk(section, key, item):
+                yield term
+    elif isinstance(value, SCALARS):
+        yield section, key, value
+
+
+def iter_terms(document):
+    """Yield the index terms of a host document.
+
+    Every key below a section gives (section, key) to look up its
+    presence and every scalar (section, key, value), where key is the
+    dotted path like eth0.2.addr. List items are indexed under the key of
+    the list, so processes.name finds the name of any process and a
+    scalar section or list item has the key ''. The section itself is
+    (section, '').
+    """
+    for section, value in document.items():
+        yield section, ''
+        for term in _walk(section, '', value):
+            yield term
+
+
+def term_key(term):
+    """Return the string a term is stored under."""
+    return json.dumps(list(term))
+
+
+def parse_lookup(expression):
+    """Parse section.key=value, section.key, section=value or section.
+
+    The value is matched as string and, if it parses as JSON, also as
+    that value, so packages.foo=1.2 finds the version string "1.2".
+    """
+    left, equal, raw = expression.partition('=')
+    section, _, key = left.partition('.')
+    if not equal:
+        return [(section, key)]
+    terms = [(section, key, raw)]
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        return terms
+    if value != raw and isinstance(value, SCALARS):
+        terms.append((section, key, value))
+    return terms
+
+
+def _encode_varint(ids):
+    data = bytearray()
+    previous = -1
+    for host_id in ids:
+        delta = host_id - previous
+        previous = host_id
+        while delta > 0x7f:
+            data.append(0x80 | (delta & 0x7f))
+            delta >>= 7
+        data.append(delta)
+    return data
+
+
+def _decode_varint(data):
+    ids = []
+    previous, delta, shift = -1, 0, 0
+    for byte in bytearray(data):
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += delta
+        ids.append(previous)
+        delta, shift = 0, 0
+    return ids
+
+
+def _encode_bitmap(ids, count):
+    data = bytearray((count + 7) // 8)
+    for host_id in ids:
+        data[host_id >> 3] |= 1 << (host_id & 7)
+    return data
+
+
+def _decode_bitmap(data):
+    ids = []
+    for position, byte in enumerate(bytearray(data)):
+        if byte:
+            ids.extend(position * 8 + bit for bit in range(8)
+                       if byte & (1 << bit))
+    return ids
+
+
+def encode_postings(ids, count):
+    """Encode sorted host ids as delta varints or a bitmap, the smaller."""
+    varint = _encode_varint(ids)
+    if len(varint) * 8 > count:
+        return 'b' + base64.b64encode(
+            bytes(_encode_bitmap(ids, count))).decode('ascii')
+    return 'v' + base64.b64encode(bytes(varint)).decode('ascii')
+
+
+def decode_postings(text):
+    """Return the sorted host ids of encoded postings."""
+    data = base64.b64decode(text[1:])
+    if text[0] == 'b':
+        return _decode_bitmap(data)
+    return _decode_varint(data)
+
+
+class ValueIndex(object):
+    """Host sets of every term, built host by host.
+
+    Hosts get ids in the order they are added, removed hosts are only
+    marked. save() numbers the hosts in sorted order and writes every
+    posting list encoded on its own, load() decodes a list only when it
+    is looked up.
+    """
+
+    def __init__(self):
+        """Class init."""
+        self.hosts = []
+        self.ids = {}
+        # term key to list of host ids or encoded postings after load
+        self.postings = {}
+        self.encoded = False
+
+    def _decode_all(self):
+        if self.encoded:
+            for key, text in self.postings.items():
+                self.postings[key] = decode_postings(text)
+            self.encoded = False
+
+    def add(self, hostname, document):
+        """Index document as the document of hostname."""
+        self._decode_all()
+        if hostname in self.ids:
+            self.remove(hostname)
+        host_id = len(self.hosts)
+        self.hosts.append(hostname)
+        self.ids[hostname] = host_id
+        for key in set(term_key(t) for t in iter_terms(document)):
+            self.postings.setdefault(key, []).append(host_id)
+
+    def remove(self, hostname):
+        """Drop hostname from the index."""
+        self.ids.pop(hostname, None)
+
+    def lookup(self, terms):
+        """Return the sorted names of the hosts having any of terms."""
+        found = set()
+        for term in terms:
+            postings = self.postings.get(term_key(term))
+            if postings is None:
+                continue
+            if self.encoded:
+                postings = decode_postings(postings)
+            # ids of removed or re-added hosts are stale
+            found.update(self.hosts[i] for i in postings
+                         if self.ids.get(self.hosts[i]) == i)
+        return sorted(found)
+
+    def save(self, file_path):
+        """Write the index of the db file file_path next to it."""
+        # database imports this module
+        from database import write_atomic
+        live = sorted(self.ids)
+        renumber = dict((self.ids[h], n) for n, h in enumerate(live))
+        postings = {}
+        for key, ids in self.postings.items():
+            if self.encoded:
+                ids = decode_postings(ids)
+            ids = sorted(renumber[i] for i in ids if i in renumber)
+            if ids:
+                postings[key] = encode_postings(ids, len(live))
+        stat = os.stat(file_path)
+        write_atomic(file_path + VALUE_INDEX_SUFFIX, {
+            'version': VALUE_INDEX_VERSION,
+            'output': [stat.st_size, stat.st_mtime],
+            'hosts': live,
+            'postings': postings,
+        }, sort_keys=True)
+
+    @classmethod
+    def load(cls, file_path):
+        """Return the index of file_path, None if missing or stale."""
+        try:
+            with open(file_path + VALUE_INDEX_SUFFIX) as fp:
+                data = json.load(fp)
+            stat = os.stat(file_path)
+        except (IOError, OSError, ValueError):
+            return None
+        if (data.get('version') != VALUE_INDEX_VERSION or
+                data['output'] != [stat.st_size, stat.st_mtime]):
+            return None
+        index = cls()
+        index.hosts = data['hosts']
+        index.ids = dict((h, n) for n, h in enumerate(index.hosts))
+        index.postings = data['postings']
+        index.encoded = True
+        return index
+
+    @classmethod
+    def build(cls, hosts):
+        """Return the index of (host name, document) pairs."""
+        index = cls()
+        for hostname, document in hosts:
+            index.add(hostname, document)
+        return index
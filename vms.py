@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 HLRS, University of Stuttgart
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Collect the domains of a hypervisor with libvirt's bulk stats API."""
+
+# @Author: Uwe Schilling, schilling@hlrs.de
+# @COMPANY: HLRS, University of Stuttgart
+# @Date: 2017-04-24
+
+DEFAULT_URI = 'qemu:///system'
+# optional counter groups, name to libvirt stats flag name
+DETAILS = {
+    'vcpu': 'VIR_DOMAIN_STATS_VCPU',
+    'block': 'VIR_DOMAIN_STATS_BLOCK',
+    'net': 'VIR_DOMAIN_STATS_INTERFACE',
+}
+
+
+def _group_counters(stats, prefix):
+    """Turn flat 'prefix.<n>.<field>' stats into a list of dicts.
+
+    vcpu stats have no count field, their number is taken from the
+    highest index found.
+    """
+    counters = {}
+    for name, value in stats.items():
+        parts = name.split('.', 2)
+        if len(parts) == 3 and parts[0] == prefix and parts[1].isdigit():
+            counters.setdefault(int(parts[1]), {})[parts[2]] = value
+    return [counters[i] for i in sorted(counters)]
+
+
+def _infos(stats):
+    """Map bulk stats onto the fields domain.info() used to return."""
+    return {
+        'state': stats.get('state.state'),
+        'max_memory': stats.get('balloon.maximum'),
+        'memory': stats.get('balloon.current'),
+        'nb_virt_cpu': stats.get('vcpu.current'),
+        'cpu_time': stats.get('cpu.time'),
+    }
+
+
+def _info_stats(domain):
+    """Build bulk stats from domain.info() for libvirt without them."""
+    info = domain.info()
+    return {
+        'state.state': info[0],
+        'balloon.maximum': info[1],
+        'balloon.current': info[2],
+        'vcpu.current': info[3],
+        'cpu.time': info[4],
+    }
+
+
+def active_stats(conn, libvirt, flags):
+    """Return (domain, stats) of all active domains.
+
+    The stats of flags come in one call, libvirt before 1.2.8 or a driver
+    without bulk stats gets the fields of domain.info() per domain.
+    """
+    try:
+        return conn.getAllDomainStats(
+            flags, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+    except (AttributeError, libvirt.libvirtError):
+        return [(d, _info_stats(d)) for d in conn.listAllDomains(
+            libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)]
+
+
+def _bulk_stats(conn, libvirt, details):
+    """Return (domain, stats) of all active domains with details."""
+    flags = (libvirt.VIR_DOMAIN_STATS_STATE |
+             libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |
+             libvirt.VIR_DOMAIN_STATS_BALLOON |
+             libvirt.VIR_DOMAIN_STATS_VCPU)
+    for detail in details:
+        flags |= getattr(libvirt, DETAILS[detail])
+    return active_stats(conn, libvirt, flags)
+
+
+def collect_domains(uri=DEFAULT_URI, details=()):
+    """Return the inactive domain names and the active domains with stats.
+
+    uri         libvirt connection, e.g. test:///default for testing
+    details     counter groups to add per active domain: vcpu, block, net
+    """
+    import libvirt
+
+    conn = libvirt.openReadOnly(uri)
+    if conn is None:
+        raise RuntimeError('can not open libvirt connection {}'.format(uri))
+    try:
+        # listing by state needs no call per domain, unlike isActive()
+        return_dict = {
+            'inactive_vms': sorted(d.name() for d in conn.listAllDomains(
+                libvirt.VIR_CONNECT_LIST_DOMAINS_INACTIVE)),
+            'active_vms': {},
+        }
+        for domain, stats in _bulk_stats(conn, libvirt, details):
+            entry = {
+                'os_type': domain.OSType(),
+                'id': domain.ID(),
+                'infos': _infos(stats),
+            }
+            for detail in details:
+                entry[detail] = _group_counters(stats, detail)
+            return_dict['active_vms'][domain.name()] = entry
+    finally:
+        conn.close()
+    return return_dict